@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible.plugins.action import ActionBase
+from ansible_collections.wallix.pam.plugins.module_utils.secret_client import (
+    ARGUMENT_SPEC,
+    MUTUALLY_EXCLUSIVE,
+    REQUIRED_ONE_OF,
+    execute,
+)
+from ansible_collections.wallix.pam.plugins.plugin_utils.lease_renewer import (
+    run_id,
+    start_renewer,
+)
+
+
+class ActionModule(ActionBase):
+    """Run wallix.pam.secret in the controller process when the task is local.
+
+    Tasks on localhost (``connection: local`` or ``delegate_to: localhost``)
+    call the Bastion API directly from the worker instead of shipping and
+    spawning the module. Ansible forks a new worker for every task, so its
+    pooled connections only serve the calls of that task, such as the items
+    of an ``accounts`` batch. The API session and checked out secrets carry
+    over to later tasks through the shared cache only (``shared_cache``,
+    ``lease_registry``). Any other target falls back to the regular module
+    execution.
+
+    With ``renew_leases``, a background renewer keeps the leases of the
+    playbook run alive until it ends, then checks them in.
+    """
+
+    TRANSFERS_FILES = False
+
+    def _is_local(self):
+        return getattr(self._connection, "transport", None) == "local"
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        if not self._is_local():
+            result.update(self._execute_module(task_vars=task_vars))
+            return result
+
+        validation, params = self.validate_argument_spec(
+            argument_spec=ARGUMENT_SPEC,
+            required_one_of=REQUIRED_ONE_OF,
+            mutually_exclusive=MUTUALLY_EXCLUSIVE,
+        )
+        del validation
+
+        if self._play_context.check_mode:
+            if params["accounts"] or params["state"] == "checkin_all":
+                result.update(changed=False, accounts={})
+            else:
+                result.update(changed=False, password="", metadata={})
+            return result
+
+        result.update(execute(params, run_id() if params["renew_leases"] else None))
+        if params["renew_leases"] and not result.get("failed"):
+            start_renewer(params)
+        return result
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+  name: api_profiler
+  author: Wallix Integration Team
+  type: aggregate
+  short_description: Profile the WALLIX Bastion API calls of a playbook run
+  version_added: "1.1.0"
+  description:
+    - Records every call to the Bastion API made by C(uri) tasks and by the
+      modules of this collection, with its endpoint template (ids replaced
+      by C({id})), method, status, latency, bytes transferred and the role
+      and task it belongs to.
+    - Calls of C(uri) tasks are timed from the start of the task (or the
+      previous loop item) as seen by the controller. Modules of the
+      collection report the latency of each API request they send in their
+      C(timings).
+    - At the end of the run, writes a JSON summary and a Prometheus textfile
+      with per-endpoint latency histograms, call counts by status and bytes
+      transferred, and shows the slowest endpoints.
+    - Lookups run inside the worker processes and report nothing back, so
+      their calls are not counted.
+  requirements:
+    - enable in configuration (C(callbacks_enabled = wallix.pam.api_profiler))
+  options:
+    output_dir:
+      description: Directory receiving C(wallix_api_profile.json) and, by default, C(wallix_api.prom).
+      type: path
+      default: ~/.ansible/wallix_api_profile
+      env:
+        - name: WALLIX_API_PROFILE_DIR
+      ini:
+        - section: callback_wallix_api_profiler
+          key: output_dir
+    prometheus_textfile:
+      description:
+        - Path of the Prometheus textfile, for instance in the directory of
+          the node exporter textfile collector.
+        - Defaults to C(wallix_api.prom) in I(output_dir).
+      type: path
+      env:
+        - name: WALLIX_API_PROFILE_PROM
+      ini:
+        - section: callback_wallix_api_profiler
+          key: prometheus_textfile
+    url_pattern:
+      description:
+        - Regular expression matching the API part of the C(uri) URLs to
+          profile; the endpoint is the rest of the path.
+      type: str
+      default: '/api(/v[0-9.]+)?(?=/|$)'
+      env:
+        - name: WALLIX_API_PROFILE_URL_PATTERN
+      ini:
+        - section: callback_wallix_api_profiler
+          key: url_pattern
+    display_top:
+      description: Number of endpoints, by cumulated time, shown at the end of the run. C(0) shows none.
+      type: int
+      default: 10
+      env:
+        - name: WALLIX_API_PROFILE_TOP
+      ini:
+        - section: callback_wallix_api_profiler
+          key: display_top
+'''
+
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from ansible.plugins.callback import CallbackBase
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    LATENCY_BUCKETS, endpoint_template)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_label(value)}"' for name, value in labels.items())
+
+
+def _write_atomic(path, content):
+    # Readers (the textfile collector) never see a partial file.
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'wallix.pam.api_profiler'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self._playbook = None
+        self._started = time.time()
+        # (source, method, endpoint) -> counts, seconds, bytes, statuses,
+        # histogram buckets and the same per owning task ("role : task").
+        self._endpoints = {}
+        # (host, task uuid) -> start of the task or end of its last loop item.
+        self._marks = {}
+        self._url_pattern = None
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(CallbackModule, self).set_options(task_keys=task_keys, var_options=var_options,
+                                                direct=direct)
+        self._url_pattern = re.compile(self.get_option('url_pattern'))
+
+    def _add(self, source, method, endpoint, owner, count, seconds, size, statuses, buckets):
+        entry = self._endpoints.setdefault((source, method, endpoint), dict(
+            count=0, seconds=0.0, bytes=0, statuses={}, buckets=[0] * (len(LATENCY_BUCKETS) + 1),
+            owners={}))
+        entry['count'] += count
+        entry['seconds'] += seconds
+        entry['bytes'] += size
+        for status, status_count in statuses.items():
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + status_count
+        entry['buckets'] = [a + b for a, b in zip(entry['buckets'], buckets)]
+        by_owner = entry['owners'].setdefault(owner, dict(count=0, seconds=0.0))
+        by_owner['count'] += count
+        by_owner['seconds'] += seconds
+
+    def _elapsed(self, result, item):
+        key = (result._host.get_name(), result._task._uuid)
+        now = time.monotonic()
+        elapsed = now - self._marks.get(key, now)
+        if item:
+            self._marks[key] = now
+        else:
+            self._marks.pop(key, None)
+        return elapsed
+
+    def _record_uri(self, task, data, elapsed):
+        url = data.get('url') or task.args.get('url')
+        if not isinstance(url, str):
+            return
+        path = urlsplit(url).path
+        match = self._url_pattern.search(path)
+        if match is None:
+            return
+        endpoint = endpoint_template(path[match.end():]) or '/'
+        method = str(task.args.get('method') or 'GET').upper()
+        status = str(data.get('status', 'error'))
+        size = int(data.get('content_length') or len(data.get('content') or ''))
+        body = task.args.get('body')
+        if body is not None:
+            size += len(body if isinstance(body, str) else json.dumps(body, default=str))
+        buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        buckets[sum(1 for bound in LATENCY_BUCKETS if elapsed > bound)] = 1
+        self._add('uri', method, endpoint, task.get_name(), 1, elapsed, size,
+                  {status: 1}, buckets)
+
+    def _record_timings(self, task, timings):
+        for name, entry in (timings.get('endpoints') or {}).items():
+            if not isinstance(entry, dict) or ' ' not in name:
+                continue
+            method, endpoint = name.split(' ', 1)
+            buckets = entry.get('buckets') or []
+            if len(buckets) != len(LATENCY_BUCKETS) + 1:
+                # Modules of older collection versions only report totals.
+                buckets = [0] * len(LATENCY_BUCKETS) + [entry.get('count', 0)]
+            self._add('module', method, endpoint, task.get_name(), entry.get('count', 0),
+                      entry.get('seconds', 0.0), entry.get('bytes', 0),
+                      entry.get('statuses') or {}, buckets)
+
+    def _record(self, result, item=False):
+        task, data = result._task, result._result
+        elapsed = self._elapsed(result, item)
+        if not isinstance(data, dict) or (not item and 'results' in data):
+            return
+        action = getattr(task, 'resolved_action', None) or task.action
+        if action in ('uri', 'ansible.builtin.uri', 'ansible.legacy.uri'):
+            self._record_uri(task, data, elapsed)
+        elif isinstance(data.get('timings'), dict):
+            self._record_timings(task, data['timings'])
+
+    def v2_playbook_on_start(self, playbook):
+        self._playbook = os.path.basename(playbook._file_name)
+
+    def v2_runner_on_start(self, host, task):
+        self._marks[(host.get_name(), task._uuid)] = time.monotonic()
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result)
+
+    def v2_runner_item_on_ok(self, result):
+        self._record(result, item=True)
+
+    def v2_runner_item_on_failed(self, result):
+        self._record(result, item=True)
+
+    def _summary(self):
+        endpoints = []
+        for (source, method, endpoint), entry in self._endpoints.items():
+            endpoints.append(dict(
+                source=source, method=method, endpoint=endpoint,
+                count=entry['count'], seconds=round(entry['seconds'], 3),
+                mean=round(entry['seconds'] / entry['count'], 4) if entry['count'] else 0,
+                bytes=entry['bytes'], statuses=entry['statuses'],
+                buckets=dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'],
+                                 entry['buckets'])),
+                owners=[dict(owner=owner, count=stats['count'], seconds=round(stats['seconds'], 3))
+                        for owner, stats in sorted(entry['owners'].items(),
+                                                   key=lambda item: -item[1]['seconds'])]))
+        endpoints.sort(key=lambda entry: -entry['seconds'])
+        tasks = {}
+        for entry in endpoints:
+            for owner in entry['owners']:
+                stats = tasks.setdefault(owner['owner'], dict(count=0, seconds=0.0))
+                stats['count'] += owner['count']
+                stats['seconds'] += owner['seconds']
+        return dict(
+            playbook=self._playbook, started=self._started,
+            duration=round(time.time() - self._started, 3),
+            requests=sum(entry['count'] for entry in endpoints),
+            seconds=round(sum(entry['seconds'] for entry in endpoints), 3),
+            bytes=sum(entry['bytes'] for entry in endpoints),
+            endpoints=endpoints,
+            tasks=[dict(owner=owner, count=stats['count'], seconds=round(stats['seconds'], 3))
+                   for owner, stats in sorted(tasks.items(), key=lambda item: -item[1]['seconds'])])
+
+    def _prometheus(self):
+        playbook = self._playbook or ''
+        lines = [
+            '# HELP wallix_api_request_duration_seconds Latency of the WALLIX Bastion API calls.',
+            '# TYPE wallix_api_request_duration_seconds histogram']
+        for (source, method, endpoint), entry in sorted(self._endpoints.items()):
+            labels = _labels(playbook=playbook, source=source, method=method, endpoint=endpoint)
+            cumulated = 0
+            for bound, count in zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'],
+                                    entry['buckets']):
+                cumulated += count
+                lines.append(f'wallix_api_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                             f'{cumulated}')
+            lines.append(f"wallix_api_request_duration_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+            lines.append(f"wallix_api_request_duration_seconds_count{{{labels}}} {entry['count']}")
+        lines += ['# HELP wallix_api_requests_total WALLIX Bastion API calls by status.',
+                  '# TYPE wallix_api_requests_total counter']
+        for (source, method, endpoint), entry in sorted(self._endpoints.items()):
+            for status, count in sorted(entry['statuses'].items()):
+                labels = _labels(playbook=playbook, source=source, method=method,
+                                 endpoint=endpoint, status=status)
+                lines.append(f'wallix_api_requests_total{{{labels}}} {count}')
+        lines += ['# HELP wallix_api_transferred_bytes_total Bytes sent and received by the WALLIX Bastion API calls.',
+                  '# TYPE wallix_api_transferred_bytes_total counter']
+        for (source, method, endpoint), entry in sorted(self._endpoints.items()):
+            labels = _labels(playbook=playbook, source=source, method=method, endpoint=endpoint)
+            lines.append(f"wallix_api_transferred_bytes_total{{{labels}}} {entry['bytes']}")
+        lines += ['# HELP wallix_api_profile_timestamp_seconds End of the profiled playbook run.',
+                  '# TYPE wallix_api_profile_timestamp_seconds gauge',
+                  f'wallix_api_profile_timestamp_seconds{{{_labels(playbook=playbook)}}} '
+                  f'{time.time():.3f}']
+        return '\n'.join(lines) + '\n'
+
+    def v2_playbook_on_stats(self, stats):
+        summary = self._summary()
+        output_dir = os.path.expanduser(self.get_option('output_dir'))
+        prometheus_textfile = (self.get_option('prometheus_textfile')
+                               or os.path.join(output_dir, 'wallix_api.prom'))
+        try:
+            _write_atomic(os.path.join(output_dir, 'wallix_api_profile.json'),
+                          json.dumps(summary, indent=2) + '\n')
+            _write_atomic(os.path.expanduser(prometheus_textfile), self._prometheus())
+        except (IOError, OSError) as e:
+            self._display.warning(f"wallix.pam.api_profiler: unable to write the profile: {e}")
+
+        top = self.get_option('display_top')
+        if top <= 0 or not summary['endpoints']:
+            return
+        self._display.banner('WALLIX API PROFILE')
+        self._display.display(f"{summary['requests']} calls, {summary['seconds']:.2f}s, "
+                              f"{summary['bytes']} bytes")
+        for entry in summary['endpoints'][:top]:
+            owner = entry['owners'][0]['owner'] if entry['owners'] else ''
+            self._display.display(
+                f"{entry['seconds']:>9.3f}s {entry['count']:>6} x {entry['method']:<6} "
+                f"{entry['endpoint']:<40} [{entry['source']}] {owner}")
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from collections.abc import Mapping
+
+from ansible.errors import AnsibleFilterError
+from ansible_collections.wallix.pam.plugins.module_utils.cleanup import (
+    conflict_report)
+
+
+def cleanup_conflicts(result):
+    """Report the objects a ``wallix.pam.cleanup`` run left behind."""
+    if not isinstance(result, Mapping):
+        raise AnsibleFilterError('cleanup_conflicts expects the result of wallix.pam.cleanup')
+    return conflict_report(result)
+
+
+class FilterModule(object):
+
+    def filters(self):
+        return dict(cleanup_conflicts=cleanup_conflicts)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from collections.abc import Mapping
+
+from ansible.errors import AnsibleFilterError
+from ansible_collections.wallix.pam.plugins.module_utils.patterns import (
+    compile_patterns)
+
+
+def _partition(items, include, exclude, attribute):
+    if isinstance(include, str) or isinstance(exclude, str):
+        raise AnsibleFilterError('include and exclude must be lists of patterns')
+    try:
+        matcher = compile_patterns(include, exclude)
+    except Exception as e:
+        raise AnsibleFilterError(f"Invalid pattern: {str(e)}")
+    if attribute is None:
+        return matcher.partition(items or [])
+    return matcher.partition(items or [], lambda item: item.get(attribute)
+                             if isinstance(item, Mapping) else None)
+
+
+def glob_partition(items, include=None, exclude=None, attribute=None):
+    """Split ``items`` into those matching the patterns and the others."""
+    matched, unmatched = _partition(items, include, exclude, attribute)
+    return dict(matched=matched, unmatched=unmatched)
+
+
+def glob_select(items, include=None, exclude=None, attribute=None):
+    """Keep the ``items`` matching an ``include`` pattern and no ``exclude`` pattern."""
+    return _partition(items, include, exclude, attribute)[0]
+
+
+class FilterModule(object):
+
+    def filters(self):
+        return dict(glob_partition=glob_partition, glob_select=glob_select)
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+  name: bastion
+  author: Wallix Integration Team
+  short_description: Build an inventory from the devices of a WALLIX Bastion
+  version_added: "1.1.0"
+  description:
+    - Adds one host per device of the Bastion, addressed by its C(host), and
+      one group per target group holding the devices the target group gives
+      access to.
+    - Devices and target groups are read concurrently, a page at a time and
+      limited to the fields the inventory needs.
+    - With I(cache), the inventory is kept in the configured Ansible cache
+      plugin for I(cache_timeout) seconds. Once it is older than
+      I(refresh_interval), the pages read last time are read again at once,
+      conditionally on their C(ETag) or C(Last-Modified) validators when the
+      Bastion returns them, so that unchanged pages are not transferred again.
+    - The configuration file name must end with C(wallix.yml) or C(wallix.yaml).
+  extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+  options:
+    plugin:
+      description: Token that ensures this is a source file for this plugin.
+      required: true
+      choices: ['wallix.pam.bastion']
+    wallix_url:
+      description: URL of the Wallix Bastion.
+      required: true
+      env:
+        - name: WALLIX_API_URL
+    api_key:
+      description: API Key for authentication (X-Auth-Token).
+      env:
+        - name: WALLIX_API_KEY
+    username:
+      description: Username for the API session.
+      env:
+        - name: WALLIX_API_USER
+    password:
+      description: Password of I(username).
+      env:
+        - name: WALLIX_API_PASSWORD
+    validate_certs:
+      description: Whether to validate SSL certificates.
+      type: bool
+      default: true
+    connect_timeout:
+      description: Seconds to wait for a connection to the Bastion.
+      type: float
+      default: 10
+    timeout:
+      description: Seconds to wait for the Bastion to answer a request.
+      type: float
+      default: 30
+    retries:
+      description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+      type: int
+      default: 3
+    retry_backoff:
+      description: Base delay in seconds of the exponential retry backoff.
+      type: float
+      default: 0.5
+    device_fields:
+      description:
+        - Device attributes read on top of the id and the name, and exposed
+          in the C(wallix_device) host variable.
+      type: list
+      elements: str
+      default: [host, alias, description]
+    hostname_field:
+      description:
+        - Device attribute set as C(ansible_host). Hosts whose device lacks
+          it get no C(ansible_host).
+      type: str
+      default: host
+    target_groups:
+      description: Whether to add one group per target group.
+      type: bool
+      default: true
+    group_prefix:
+      description: Prefix of the groups made from target groups and from I(group_by).
+      type: str
+      default: wallix_
+    group_by:
+      description:
+        - Device attributes whose values each make a group, named
+          C(<group_prefix><attribute>_<value>).
+        - Unlike I(keyed_groups), no template is evaluated per host, which
+          keeps large inventories fast to load.
+      type: list
+      elements: str
+      default: []
+    page_size:
+      description: Number of objects read per request.
+      type: int
+      default: 500
+    max_workers:
+      description: Maximum number of pages read concurrently.
+      type: int
+      default: 10
+    refresh_interval:
+      description:
+        - With I(cache), age in seconds after which a cached inventory is
+          refreshed incrementally instead of being used as is.
+        - C(0) refreshes it on every run; an inventory older than
+          I(cache_timeout) is read again in full.
+      type: int
+      default: 300
+'''
+
+EXAMPLES = r'''
+# bastion.wallix.yml
+plugin: wallix.pam.bastion
+wallix_url: https://bastion.example.com
+validate_certs: false
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: /tmp/wallix_inventory
+cache_timeout: 86400
+refresh_interval: 600
+group_by: [description]
+compose:
+  ansible_user: "'ansible'"
+
+# ansible-inventory -i bastion.wallix.yml --graph
+# ansible-inventory -i bastion.wallix.yml --graph --flush-cache
+'''
+
+import time
+
+from ansible.errors import AnsibleParserError
+from ansible.inventory.group import to_safe_group_name
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible.utils.display import Display
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    RESOURCE_TYPES, object_references)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, WallixAPIError, create_api)
+
+display = Display()
+
+# Format of the cached inventory; a cache in another format is read again.
+CACHE_VERSION = 1
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'wallix.pam.bastion'
+
+    def verify_file(self, path):
+        return (super(InventoryModule, self).verify_file(path)
+                and path.endswith(('wallix.yml', 'wallix.yaml')))
+
+    def _create_api(self):
+        params = dict((name, spec.get('default')) for name, spec in API_ARGUMENT_SPEC.items())
+        params.update((name, self.get_option(name)) for name in (
+            'wallix_url', 'api_key', 'username', 'password', 'validate_certs',
+            'connect_timeout', 'timeout', 'retries', 'retry_backoff'))
+        if not params['api_key'] and not (params['username'] and params['password']):
+            raise AnsibleParserError('Either api_key or username and password are required.')
+        return create_api(params, pool_maxsize=max(10, self.get_option('max_workers')))
+
+    def _read_page(self, api, path, fields, index, cached):
+        page_size = self.get_option('page_size')
+        params = dict(limit=page_size, offset=index * page_size, fields=','.join(fields))
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        response = api.request('GET', path, params, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached, False
+        if response.status_code != 200:
+            raise WallixAPIError(f"API Error {response.status_code}: {response.text}",
+                                 response.status_code, response.text)
+        return dict(etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    items=response.json() or []), True
+
+    def _read_collection(self, api, path, fields, cached_pages):
+        """Return the pages of ``path`` and the number of pages transferred.
+
+        The pages known from ``cached_pages`` are read concurrently; the
+        collection is then followed page by page while the last one is full.
+        """
+        page_size = self.get_option('page_size')
+        indexes = list(range(max(1, len(cached_pages))))
+        pages, transferred = [], 0
+
+        def read(index):
+            cached = cached_pages[index] if index < len(cached_pages) else None
+            return self._read_page(api, path, fields, index, cached)
+
+        for read_page, error in api.bulk(read, indexes, self.get_option('max_workers')):
+            if error is not None:
+                raise error
+            page, changed = read_page
+            pages.append(page)
+            transferred += changed
+            if len(page['items']) < page_size:
+                return pages, transferred
+        while len(pages[-1]['items']) == page_size:
+            page, changed = read(len(pages))
+            pages.append(page)
+            transferred += changed
+        return pages, transferred
+
+    def _fetch(self, cached):
+        api = self._create_api()
+        device_spec = RESOURCE_TYPES['devices']
+        device_fields = ['id', device_spec['key']] + [
+            field for field in (self.get_option('device_fields') + self.get_option('group_by')
+                                + [self.get_option('hostname_field')])
+            if field not in ('id', device_spec['key'])]
+        collections = [('devices', list(dict.fromkeys(device_fields)))]
+        if self.get_option('target_groups'):
+            spec = RESOURCE_TYPES['target_groups']
+            collections.append((spec['path'], ['id', spec['key']] + spec['fields']))
+
+        start = time.monotonic()
+        result = dict(version=CACHE_VERSION, fetched_at=time.time(), collections={})
+        reads = api.bulk(lambda collection: self._read_collection(
+            api, collection[0], collection[1],
+            cached.get('collections', {}).get(collection[0], []) if cached else []),
+            collections, len(collections))
+        for (path, _fields), (read, error) in zip(collections, reads):
+            if error is not None:
+                raise AnsibleParserError(f"Unable to read {path} from the Wallix Bastion: {error}")
+            pages, transferred = read
+            result['collections'][path] = pages
+            display.vvv(f"wallix.pam.bastion: {path}: {transferred} of {len(pages)} pages transferred")
+        display.vvv(f"wallix.pam.bastion: read in {time.monotonic() - start:.3f}s")
+        return result
+
+    def _group(self, name):
+        # Target group names and attribute values often hold spaces.
+        return self.inventory.add_group(to_safe_group_name(
+            f"{self.get_option('group_prefix')}{name}", force=True, silent=True))
+
+    def _populate(self, data):
+        strict = self.get_option('strict')
+        hostname_field = self.get_option('hostname_field')
+        group_by = self.get_option('group_by')
+        constructed = any(self.get_option(option) for option in ('compose', 'groups', 'keyed_groups'))
+        devices = [device for page in data['collections']['devices'] for device in page['items']]
+
+        memberships = {}
+        for page in data['collections'].get('targetgroups', []):
+            for target_group in page['items']:
+                group = self._group(target_group['group_name'])
+                for ref_type, name in object_references('target_groups', target_group):
+                    if ref_type == 'devices':
+                        memberships.setdefault(name, {})[target_group['group_name']] = group
+
+        for device in devices:
+            host = self.inventory.add_host(device['device_name'])
+            groups = memberships.get(device['device_name'], {})
+            for group in groups.values():
+                self.inventory.add_child(group, host)
+            for field in group_by:
+                if device.get(field) not in (None, ''):
+                    self.inventory.add_child(self._group(f"{field}_{device[field]}"), host)
+            variables = dict(wallix_device=device, wallix_target_groups=sorted(groups))
+            if device.get(hostname_field):
+                variables['ansible_host'] = device[hostname_field]
+            for name, value in variables.items():
+                self.inventory.set_variable(host, name, value)
+            if not constructed:
+                continue
+            variables = self.inventory.get_host(host).get_vars()
+            self._set_composite_vars(self.get_option('compose'), variables, host, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), variables, host,
+                                              strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), variables, host,
+                                           strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache')
+
+        # ``cache`` is false with --flush-cache and meta: refresh_inventory.
+        cached = None
+        if use_cache and cache:
+            try:
+                cached = self._cache[cache_key]
+            except KeyError:
+                cached = None
+            if not isinstance(cached, dict) or cached.get('version') != CACHE_VERSION:
+                cached = None
+
+        data = cached
+        if cached is None or time.time() - cached['fetched_at'] >= self.get_option('refresh_interval'):
+            try:
+                data = self._fetch(cached)
+            except WallixAPIError as e:
+                raise AnsibleParserError(f"Unable to read the Wallix Bastion: {e}")
+            if use_cache:
+                self._cache[cache_key] = data
+
+        self._populate(data)
@@ -1,9 +1,27 @@
 from __future__ import absolute_import, division, print_function
 import urllib3
-import requests
 import os
+import threading
+import time
+from collections import OrderedDict
 from ansible.plugins.lookup import LookupBase
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible_collections.wallix.pam.plugins.module_utils.secret_client import (
+    ARGUMENT_SPEC,
+    create_client,
+    secret_fields,
+)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    SharedCacheError,
+)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError,
+)
+from ansible_collections.wallix.pam.plugins.plugin_utils.lease_renewer import (
+    run_id,
+    start_renewer,
+)
 
 __metaclass__ = type
 
@@ -31,15 +49,166 @@ DOCUMENTATION = r"""
       env:
         - name: WALLIX_API_USER
     password:
-      description: Password for Basic Auth. Can be set via env var WALLIX_API_PASSWORD.
+      description:
+        - Password of I(username). Can be set via env var WALLIX_API_PASSWORD.
+        - The credentials are sent once to open an API session whose cookie
+          is used by every checkout of the lookup. With I(shared_cache),
+          I(lease_registry) or I(renew_leases), later checkouts, in every
+          fork, reuse it too and log in again only when it expires or the
+          Bastion rejects it.
       env:
         - name: WALLIX_API_PASSWORD
+    session_ttl:
+      description:
+        - Maximum time in seconds an API session cookie is reused before
+          logging in again.
+        - C(0) sends the credentials as Basic auth with every request
+          instead of logging in once.
+      type: int
+      default: 3600
+    validate_certs:
+      description: Whether to validate SSL certificates.
+      type: bool
+      default: True
+    connect_timeout:
+      description: Seconds to wait for a connection to the Bastion.
+      type: float
+      default: 10
+    timeout:
+      description: Seconds to wait for the Bastion to answer a request.
+      type: float
+      default: 30
+    retries:
+      description:
+        - Number of times a checkout is retried after a connection error, a
+          timeout or a 5xx response.
+        - Retries wait a random delay bounded by an exponential backoff.
+      type: int
+      default: 3
+    retry_backoff:
+      description: Base delay in seconds of the exponential retry backoff.
+      type: float
+      default: 0.5
+    deadline:
+      description:
+        - Absolute UNIX timestamp after which no further request or retry is
+          attempted, for instance computed once per play with
+          C({{ now().timestamp() + 1800 }}).
+        - Can be set via env var WALLIX_API_DEADLINE.
+      type: float
+      env:
+        - name: WALLIX_API_DEADLINE
+    circuit_breaker_threshold:
+      description:
+        - Consecutive failures after which calls to this Bastion fail
+          immediately, for every fork of the run. C(0) disables the breaker.
+      type: int
+      default: 5
+    circuit_breaker_reset:
+      description: Seconds the circuit breaker stays open before letting a trial call through.
+      type: float
+      default: 30
+    pool_maxsize:
+      description:
+        - Maximum number of keep-alive connections kept open to the Bastion.
+        - Connections are pooled per worker process, that is for the lookups
+          of one task, and shared by those using the same URL, credentials
+          and I(validate_certs).
+      type: int
+      default: 10
+    max_workers:
+      description:
+        - Number of terms checked out concurrently within one lookup call.
+        - Results are always returned in the order of the terms. Failures are
+          collected for every term and reported together.
+      type: int
+      default: 1
+    cache:
+      description:
+        - Whether to keep checked out secrets in an in-memory cache so that
+          repeated references to the same account reuse one checkout.
+        - The cache lives in the worker process of the task. Use
+          I(shared_cache) to reuse checkouts across tasks and forks.
+        - Set to C(false) to always query the Bastion.
+      type: bool
+      default: True
+    cache_ttl:
+      description:
+        - Maximum lifetime of a cached secret, in seconds.
+        - The effective lifetime never exceeds the checkout duration returned
+          by the Bastion.
+      type: int
+      default: 300
+    cache_size:
+      description: Maximum number of secrets kept in the cache (least recently used are evicted first).
+      type: int
+      default: 256
+    shared_cache:
+      description:
+        - Share checked out secrets between all forks on the controller
+          through an encrypted, memory-backed cache.
+        - When several forks need the same account at once, only one of them
+          performs the checkout while the others wait for its result.
+        - Entries follow the same lifetime as I(cache_ttl). Requires the
+          C(cryptography) Python library.
+      type: bool
+      default: False
+    shared_cache_dir:
+      description:
+        - Directory holding the shared cache files.
+        - Defaults to a private per-user directory under C(/dev/shm), or the
+          system temporary directory when C(/dev/shm) is not available.
+      type: path
+    lease_registry:
+      description:
+        - Record every checkout in the lease registry shared with the
+          C(wallix.pam.secret) module, and return the secret of a lease that
+          is still held instead of checking the account out again.
+        - Requires the C(cryptography) Python library.
+      type: bool
+      default: False
+    extend_threshold:
+      description:
+        - With I(lease_registry), remaining lease time in seconds below which
+          a held lease is extended.
+      type: int
+      default: 300
+    renew_leases:
+      description:
+        - Start a background process on the controller that extends every
+          lease used by the playbook run when it expires within
+          I(extend_threshold) seconds, and checks them in once the run has
+          ended, except those a concurrent run still uses.
+        - Implies I(lease_registry). One renewer runs per Bastion, identity
+          and playbook run.
+      type: bool
+      default: False
+    renew_interval:
+      description: Seconds between two passes of the background renewer over the registry.
+      type: int
+      default: 60
 """
 
 EXAMPLES = r"""
 - name: Retrieve password
   debug:
     msg: "{{ lookup('wallix.pam.secret', 'admin@local@prod-db-01') }}"
+
+- name: Retrieve several passwords in parallel
+  debug:
+    msg: "{{ lookup('wallix.pam.secret', 'app@local@web-01', 'app@local@web-02', 'app@local@web-03', max_workers=8) }}"
+
+- name: Always fetch a fresh secret
+  debug:
+    msg: "{{ lookup('wallix.pam.secret', 'admin@local@prod-db-01', cache=false) }}"
+
+- name: Check out a credential shared by many hosts only once per run
+  debug:
+    msg: "{{ lookup('wallix.pam.secret', 'deploy@local@jump-01', shared_cache=true) }}"
+
+- name: Keep a credential checked out for the whole play, then release it
+  set_fact:
+    db_password: "{{ lookup('wallix.pam.secret', 'admin@local@prod-db-01', renew_leases=true) }}"
 """
 
 RETURN = r"""
@@ -53,6 +222,38 @@ RETURN = r"""
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+class _SecretCache:
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            secret, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return secret
+
+    def put(self, key, secret, ttl, max_size):
+        if ttl <= 0 or max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (secret, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+
+_CACHE = _SecretCache()
+
+
 class LookupModule(LookupBase):
     def run(self, terms, variables=None, **kwargs):
         wallix_url = kwargs.get("wallix_url") or os.getenv("WALLIX_API_URL")
@@ -73,44 +274,95 @@ class LookupModule(LookupBase):
                 "Either WALLIX_API_KEY or username/password are required."
             )
 
-        ret = []
-
-        for term in terms:
-            # term is expected to be the account_name string directly
-            # e.g. "account@domain@device"
-
-            url = f"{wallix_url.rstrip('/')}/api/targetpasswords/checkout/{term}"
-            headers = {"Content-Type": "application/json"}
-
-            auth = None
-            if api_key:
-                headers["X-Auth-Token"] = api_key
-            elif username and password:
-                auth = (username, password)
-
-            try:
-                response = requests.get(
-                    url, headers=headers, auth=auth, verify=validate_certs
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    # Extract secret
-                    if "password" in data:
-                        ret.append(data["password"])
-                    elif "ssh_key" in data:
-                        ret.append(data["ssh_key"])
-                    elif "key" in data:
-                        ret.append(data["key"])
-                    else:
-                        # Fallback: return the whole JSON as string if we can't identify the field
-                        ret.append(str(data))
-                else:
-                    raise AnsibleError(
-                        f"Wallix API Error {response.status_code}: {response.text}"
-                    )
-
-            except Exception as e:
-                raise AnsibleError(f"Error retrieving secret for {term}: {e}")
-
-        return ret
+        max_workers = max(1, int(kwargs.get("max_workers", 1)))
+        use_cache = boolean(kwargs.get("cache", True), strict=False)
+        cache_ttl = int(kwargs.get("cache_ttl", 300))
+        cache_size = int(kwargs.get("cache_size", 256))
+        shared_cache = boolean(kwargs.get("shared_cache", False), strict=False)
+        renew_leases = boolean(kwargs.get("renew_leases", False), strict=False)
+        deadline = kwargs.get("deadline") or os.getenv("WALLIX_API_DEADLINE")
+
+        params = {name: spec.get("default") for name, spec in ARGUMENT_SPEC.items()}
+        params.update(
+            wallix_url=wallix_url,
+            api_key=api_key,
+            username=username,
+            password=password,
+            validate_certs=validate_certs,
+            max_workers=max_workers,
+            session_ttl=int(kwargs.get("session_ttl", 3600)),
+            connect_timeout=float(kwargs.get("connect_timeout", 10)),
+            timeout=float(kwargs.get("timeout", 30)),
+            retries=int(kwargs.get("retries", 3)),
+            retry_backoff=float(kwargs.get("retry_backoff", 0.5)),
+            deadline=deadline,
+            circuit_breaker_threshold=int(kwargs.get("circuit_breaker_threshold", 5)),
+            circuit_breaker_reset=float(kwargs.get("circuit_breaker_reset", 30)),
+            shared_cache=use_cache and shared_cache,
+            shared_cache_dir=kwargs.get("shared_cache_dir"),
+            cache_ttl=cache_ttl,
+            lease_registry=boolean(kwargs.get("lease_registry", False), strict=False),
+            extend_threshold=int(kwargs.get("extend_threshold", 300)),
+            renew_leases=renew_leases,
+            renew_interval=int(kwargs.get("renew_interval", 60)),
+        )
+        try:
+            # Every worker thread needs its own connection to keep it alive.
+            client = create_client(
+                params,
+                int(kwargs.get("pool_maxsize", 10)),
+                run_id() if renew_leases else None,
+            )
+        except (SharedCacheError, WallixAPIError, OSError) as e:
+            raise AnsibleError(f"Unable to set up the Wallix API client: {e}")
+        cache_scope = (client.api.base_url, client.api.identity)
+
+        def resolve(term):
+            cache_key = cache_scope + (term,)
+            if use_cache:
+                secret = _CACHE.get(cache_key)
+                if secret is not None:
+                    return secret
+
+            secret, duration = self._checkout(client, term)
+            if use_cache:
+                ttl = cache_ttl if duration is None else min(cache_ttl, duration)
+                _CACHE.put(cache_key, secret, ttl, cache_size)
+            return secret
+
+        # Each distinct account is checked out once, however often it is listed.
+        unique_terms = list(dict.fromkeys(terms))
+        resolved = dict(
+            zip(unique_terms, client.api.bulk(resolve, unique_terms, max_workers))
+        )
+
+        errors = [
+            f"{term}: {error}" for term, (_secret, error) in resolved.items() if error
+        ]
+        if errors:
+            raise AnsibleError(
+                f"Error retrieving {len(errors)} of {len(unique_terms)} secrets: "
+                + "; ".join(errors)
+            )
+
+        if renew_leases:
+            start_renewer(params)
+
+        return [resolved[term][0] for term in terms]
+
+    @staticmethod
+    def _checkout(client, term):
+        """Check out one account and return its secret and remaining lifetime."""
+        # term is expected to be the account_name string directly
+        # e.g. "account@domain@device"
+        result = client.run(dict(account_name=term, state="checkout"))
+        if result.get("lease"):
+            duration = result["lease"]["remaining"]
+        else:
+            duration = result["metadata"].get("duration")
+            if not isinstance(duration, int):
+                duration = None
+
+        # Fallback: return the whole JSON as string if we can't identify the field
+        fields = secret_fields(result["metadata"])
+        return fields.get("password", str(result["metadata"])), duration
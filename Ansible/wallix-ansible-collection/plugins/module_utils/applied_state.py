@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Local record of the objects last applied to a WALLIX Bastion.
+
+Reconciling an endpoint normally reads it in full to diff it against the
+desired objects. With a state directory, one file per Bastion and endpoint
+records the validators (``ETag``, ``Last-Modified``) of the pages of its last
+read and, for each object, its id and the fingerprint of the desired content
+last applied to it. Modules reconciling different endpoints, in overlapping
+runs or forks, thus never overwrite each other's records.
+
+A later run first probes those pages with conditional requests. When they
+all answer 304, nothing changed on the Bastion since: desired objects whose
+fingerprint is the recorded one are skipped without any API call, and only
+the others are read, one by one. Any other answer falls back to a full read.
+Writes change the pages, so a run that writes leaves the endpoint without
+validators and the next run reads it in full, recording fresh ones. See
+:func:`reconcile.fetch_with_state` and :func:`reconcile.record_applied`.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    ensure_private_dir)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+STATE_VERSION = 2
+
+
+class AppliedState:
+    """Objects last applied to one Bastion, kept in ``state_dir``."""
+
+    def __init__(self, state_dir, base_url):
+        self.state_dir = state_dir
+        self.base_url = base_url.rstrip('/')
+        self._digest = hashlib.sha256(self.base_url.encode('utf-8')).hexdigest()
+        self._endpoints = {}
+
+    def _path(self, path):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', path.strip('/'))
+        return os.path.join(self.state_dir, f"applied-{self._digest}-{name}.json")
+
+    def _load(self, path):
+        try:
+            with open(self._path(path), encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = None
+        # A state of another version, Bastion or endpoint is read again in full.
+        if (not isinstance(data, dict) or data.get('version') != STATE_VERSION
+                or data.get('bastion') != self.base_url or data.get('endpoint') != path):
+            return dict(pages=[], objects={})
+        return data['record']
+
+    def endpoint(self, path):
+        """Return the mutable record of the endpoint ``path``."""
+        if path not in self._endpoints:
+            self._endpoints[path] = self._load(path)
+        return self._endpoints[path]
+
+    def save(self):
+        """Write the record of every endpoint used, each to its own file."""
+        ensure_private_dir(self.state_dir)
+        for path, record in self._endpoints.items():
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(version=STATE_VERSION, bastion=self.base_url,
+                               endpoint=path, record=record), f, sort_keys=True)
+            os.replace(tmp_path, self._path(path))
+
+
+def _page_params(fields, index, page_size):
+    return dict(limit=page_size, offset=index * page_size, fields=','.join(fields))
+
+
+def read_pages(api, path, fields, page_size=500):
+    """Read every page of ``path`` and return its items and page validators.
+
+    The validators are empty when the Bastion sends neither ``ETag`` nor
+    ``Last-Modified`` for a page, as nothing could then be probed.
+    """
+    items, pages, index = [], [], 0
+    while True:
+        response = api.request('GET', path, _page_params(fields, index, page_size))
+        if response.status_code != 200:
+            raise WallixAPIError(f"API Error {response.status_code}: {response.text}",
+                                 response.status_code, response.text)
+        page = response.json() or []
+        items.extend(page)
+        pages.append(dict(etag=response.headers.get('ETag'),
+                          last_modified=response.headers.get('Last-Modified'),
+                          count=len(page)))
+        if len(page) < page_size:
+            break
+        index += 1
+    if not all(page['etag'] or page['last_modified'] for page in pages):
+        pages = []
+    return items, pages
+
+
+def probe_pages(api, path, fields, pages, page_size=500, max_workers=10):
+    """Whether every page of ``path`` is unchanged since ``pages`` were read.
+
+    The pages are requested concurrently with their validators; when the
+    last one was full, the page after it must still be empty.
+    """
+    if not pages:
+        return False
+
+    def probe(index):
+        headers = {}
+        if index < len(pages):
+            if pages[index]['etag']:
+                headers['If-None-Match'] = pages[index]['etag']
+            if pages[index]['last_modified']:
+                headers['If-Modified-Since'] = pages[index]['last_modified']
+        response = api.request('GET', path, _page_params(fields, index, page_size),
+                               headers=headers)
+        if index < len(pages):
+            return response.status_code == 304
+        return response.status_code == 200 and not response.json()
+
+    indexes = list(range(len(pages) + (pages[-1]['count'] == page_size)))
+    return all(error is None and unchanged
+               for unchanged, error in api.bulk(probe, indexes, max_workers))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming, compressed NDJSON backups of WALLIX Bastion objects.
+
+The objects of each type are written to their own ``<type>.ndjson`` file,
+gzip- or zstd-compressed, one ``{"name": ..., "object": ...}`` line per
+object, as the pages are read from the Bastion: no backup is ever held in
+memory as a whole. A ``manifest.json`` records the SHA-256 of every object,
+which :mod:`restore` also uses to check the objects it recreates.
+
+An incremental backup compares the objects with the manifest of a previous
+backup and only writes those that are new or changed. Its manifest still
+lists every object, each with the file holding its current content
+(relative to the manifest, possibly in an earlier backup directory), and the
+objects deleted since, so that one manifest describes the whole estate.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    RESOURCE_TYPES, iter_discover)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+COMPRESSIONS = dict(gzip='.gz', zstd='.zst', none='')
+
+
+def object_hash(obj):
+    """Return the SHA-256 of the canonical JSON form of ``obj``, id aside.
+
+    Ids are assigned by the Bastion, so an object recreated by a restore
+    hashes like the one backed up.
+    """
+    content = dict((field, value) for field, value in obj.items() if field != 'id')
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':'))
+                          .encode('utf-8')).hexdigest()
+
+
+def compression_of(path):
+    """Return the compression of a backup file from its suffix."""
+    for compression, suffix in COMPRESSIONS.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return 'none'
+
+
+def open_ndjson(path, mode='r', compression=None, level=None):
+    """Open a backup file for reading (``r``) or writing (``w``) as text."""
+    compression = compression or compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8',
+                         compresslevel=6 if level is None else level)
+    if compression == 'zstd':
+        if not HAS_ZSTANDARD:
+            raise WallixAPIError("The 'zstandard' Python library is required for zstd backups.")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+            stream = compressor.stream_writer(raw)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_manifest(path):
+    """Return the manifest at ``path``, a manifest file or a backup directory,
+    and the directory its file names are relative to."""
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise WallixAPIError(f"Unsupported backup manifest version in {path}")
+    return manifest, os.path.dirname(os.path.abspath(path))
+
+
+def iter_records(directory, file_name):
+    """Yield the ``(name, object)`` records of one backup file."""
+    with open_ndjson(os.path.join(directory, file_name)) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record['name'], record['object']
+
+
+def _backup_type(api, resource_type, dest, compression, level, previous, base_dir,
+                 max_workers, page_size):
+    file_name = f"{resource_type}.ndjson{COMPRESSIONS[compression]}"
+    path = os.path.join(dest, file_name) if dest else os.devnull
+    objects, written = {}, 0
+    # Written under a temporary name so that a failed run leaves no
+    # truncated file behind.
+    part = f"{path}.part" if dest else path
+    try:
+        with open_ndjson(part, 'w', compression, level) as out:
+            for instance in iter_discover(api, resource_type, max_workers, project=False,
+                                          page_size=page_size):
+                digest = object_hash(instance['object'])
+                entry = dict(id=instance['object'].get('id'), sha256=digest, file=file_name)
+                old = previous.get(instance['name'])
+                if old and old['sha256'] == digest:
+                    entry['file'] = os.path.relpath(os.path.join(base_dir, old['file']),
+                                                    dest or os.getcwd())
+                else:
+                    out.write(json.dumps(dict(name=instance['name'], object=instance['object']),
+                                         separators=(',', ':')) + '\n')
+                    written += 1
+                objects[instance['name']] = entry
+    except Exception:
+        if dest and os.path.exists(part):
+            os.unlink(part)
+        raise
+    if dest:
+        os.replace(part, path)
+    return dict(file=file_name, count=len(objects), written=written,
+                deleted=sorted(set(previous) - set(objects)), objects=objects)
+
+
+def write_backup(api, types, dest, compression='gzip', level=None, base=None, metadata=None,
+                 max_workers=10, page_size=500):
+    """Back the objects of ``types`` up into the directory ``dest``.
+
+    With ``base``, the manifest (or directory) of a previous backup of the
+    same Bastion, only the objects changed since are written. With ``dest``
+    None nothing is written, which gives the counts of a check run.
+    Returns the manifest.
+    """
+    types = sorted(types)
+    unknown = set(types) - set(RESOURCE_TYPES)
+    if unknown:
+        raise WallixAPIError(f"Unknown object types: {', '.join(sorted(unknown))}")
+    if compression not in COMPRESSIONS:
+        raise WallixAPIError(f"Unknown compression: {compression}")
+    if compression == 'zstd' and not HAS_ZSTANDARD:
+        raise WallixAPIError("The 'zstandard' Python library is required for zstd backups.")
+
+    base_manifest, base_dir = read_manifest(base) if base else (None, None)
+    if base_manifest and base_manifest.get('bastion') != api.base_url:
+        raise WallixAPIError(f"{base} is a backup of {base_manifest.get('bastion')}, "
+                             f"not of {api.base_url}")
+    if dest:
+        dest = os.path.abspath(dest)
+        if base_manifest and base_dir == dest:
+            # Its files would be overwritten while still referred to.
+            raise WallixAPIError("An incremental backup needs another directory than its base")
+        os.makedirs(dest, mode=0o700, exist_ok=True)
+
+    start = time.time()
+    results = api.bulk(
+        lambda resource_type: _backup_type(
+            api, resource_type, dest, compression, level,
+            ((base_manifest or {}).get('types', {}).get(resource_type) or {}).get('objects', {}),
+            base_dir, max_workers, page_size),
+        types, max_workers)
+    manifest = dict(version=MANIFEST_VERSION, created_at=start, bastion=api.base_url,
+                    mode='incremental' if base_manifest else 'full', compression=compression,
+                    base=os.path.relpath(base_dir, dest or os.getcwd()) if base_manifest else None,
+                    metadata=metadata or {}, types={})
+    for resource_type, (backup, error) in zip(types, results):
+        if error is not None:
+            raise error
+        manifest['types'][resource_type] = backup
+
+    if dest:
+        path = os.path.join(dest, MANIFEST)
+        with open(f"{path}.part", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(f"{path}.part", path)
+    return manifest
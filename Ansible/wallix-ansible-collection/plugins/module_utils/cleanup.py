@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Dependency-ordered, concurrent deletion of WALLIX Bastion objects.
+
+The objects of the selected types are discovered once, together with the
+objects of the types that may refer to them. Types are then deleted level by
+level (see :func:`resources.deletion_levels`), each level concurrently. An
+object still referred to by an object that is kept, or whose deletion
+failed, is reported as blocked instead of being sent to the Bastion.
+:func:`conflict_report` indexes the objects left behind for reporting.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import re
+import time
+
+from ansible_collections.wallix.pam.plugins.module_utils.patterns import (
+    compile_patterns)
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    deletion_levels, discover_all, object_references, referring_types)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+_STATUS = re.compile(r'API Error (\d{3})')
+
+
+def matches(name, include, exclude):
+    """Whether ``name`` matches an ``include`` glob and no ``exclude`` glob."""
+    return compile_patterns(include, exclude)(name)
+
+
+def plan_cleanup(api, types, include, exclude, max_workers=10):
+    """Return the objects of ``types`` to delete and who refers to them.
+
+    Returns ``(selected, referrers, discovered)``: the matching objects by
+    type, the referring objects of every ``(type, name)`` and the number of
+    objects discovered by type.
+    """
+    to_read = set(types)
+    for resource_type in types:
+        to_read.update(referring_types(resource_type))
+    snapshots = discover_all(api, to_read, max_workers)
+
+    matcher = compile_patterns(include, exclude)
+    selected = dict((resource_type, [instance for instance in snapshots[resource_type]
+                                     if matcher(instance['match'])])
+                    for resource_type in types)
+    referrers = {}
+    for resource_type, instances in snapshots.items():
+        for instance in instances:
+            for ref in object_references(resource_type, instance['object']):
+                referrers.setdefault(ref, set()).add((resource_type, instance['name']))
+    discovered = dict((resource_type, len(snapshots[resource_type])) for resource_type in types)
+    return selected, referrers, discovered
+
+
+def delete_levels(api, selected, referrers, max_workers=10, check_mode=False):
+    """Delete the ``selected`` objects level by level.
+
+    In check mode every deletion is assumed to succeed. Returns the
+    ``deleted`` and ``blocked`` names and the ``failed`` errors by type, and
+    the duration of each level.
+    """
+    result = dict(deleted={}, blocked={}, failed={}, levels=[])
+    gone = set()
+    for level in deletion_levels(selected):
+        start = time.monotonic()
+        batch = []
+        for resource_type in level:
+            result['deleted'].setdefault(resource_type, [])
+            for instance in selected[resource_type]:
+                holders = sorted(f"{ref_type}:{name}" for ref_type, name in
+                                 referrers.get((resource_type, instance['name']), ())
+                                 if (ref_type, name) not in gone)
+                if holders:
+                    result['blocked'].setdefault(resource_type, {})[instance['name']] = holders
+                else:
+                    batch.append(instance)
+
+        if check_mode:
+            outcomes = [(None, None)] * len(batch)
+        else:
+            # 404: deleted meanwhile, for instance along with its device.
+            outcomes = api.bulk(lambda instance: api.delete(instance['path'],
+                                                            expected=(200, 204, 404)),
+                                batch, max_workers)
+        for instance, (_response, error) in zip(batch, outcomes):
+            if error is not None:
+                result['failed'].setdefault(instance['type'], {})[instance['name']] = str(error)
+            else:
+                gone.add((instance['type'], instance['name']))
+                result['deleted'][instance['type']].append(instance['name'])
+        result['levels'].append(dict(types=level, objects=len(batch),
+                                     seconds=round(time.monotonic() - start, 3)))
+    return result
+
+
+def run_cleanup(api, types, include, exclude, max_workers=10, check_mode=False,
+                max_deletions=0):
+    """Delete the objects of ``types`` matching ``include`` but not ``exclude``.
+
+    Fails before any deletion when more than ``max_deletions`` objects (if
+    not 0) match. The ``referrers`` of the selected objects found during
+    discovery are returned by ``type:name``, for :func:`conflict_report` to
+    explain the deletions the Bastion refused.
+    """
+    selected, referrers, discovered = plan_cleanup(api, types, include, exclude, max_workers)
+    count = sum(len(instances) for instances in selected.values())
+    if max_deletions and count > max_deletions and not check_mode:
+        raise WallixAPIError(f"{count} objects match the cleanup patterns, more than the "
+                             f"{max_deletions} allowed in one run")
+    result = delete_levels(api, selected, referrers, max_workers, check_mode)
+    result['referrers'] = dict(
+        (f"{resource_type}:{instance['name']}",
+         sorted(f"{ref_type}:{name}" for ref_type, name in
+                referrers[(resource_type, instance['name'])]))
+        for resource_type, instances in selected.items() for instance in instances
+        if referrers.get((resource_type, instance['name'])))
+    result['summary'] = dict(
+        (resource_type, dict(discovered=discovered[resource_type],
+                             selected=len(selected[resource_type]),
+                             deleted=len(result['deleted'].get(resource_type, [])),
+                             blocked=len(result['blocked'].get(resource_type, {})),
+                             failed=len(result['failed'].get(resource_type, {}))))
+        for resource_type in types)
+    return result
+
+
+def conflict_report(result):
+    """Index the objects a cleanup left behind, in one pass over ``result``.
+
+    ``result`` is the result of :func:`run_cleanup` (or of the
+    ``wallix.pam.cleanup`` module). Blocked objects are reported with the
+    status 409 the Bastion would have answered and the objects referring to
+    them; failed objects with the status of their error, when there is one.
+    A deletion the Bastion refused with a 409 counts as blocked by the
+    ``referrers`` discovered for it that were not deleted, when known.
+    Returns the ``conflicts`` by type, their counts ``by_type`` and
+    ``by_status``, and the ``blockers``: the objects referring to blocked
+    ones, with the objects they block, those blocking the most first, of
+    which the ``root_blockers`` are not themselves left behind: the objects
+    to delete, or to select, for the cleanup to go through.
+    """
+    report = dict(total=0, by_status={}, by_type={}, conflicts={}, blockers={},
+                  root_blockers=[])
+    left_behind = set()
+
+    def add(resource_type, name, status, reason, referenced_by):
+        left_behind.add(f"{resource_type}:{name}")
+        report['conflicts'].setdefault(resource_type, []).append(
+            dict(name=name, status=status, reason=reason, referenced_by=referenced_by))
+        counts = report['by_type'].setdefault(resource_type, dict(total=0, blocked=0, failed=0))
+        counts['total'] += 1
+        counts['blocked' if referenced_by else 'failed'] += 1
+        report['by_status'][status] = report['by_status'].get(status, 0) + 1
+        report['total'] += 1
+        for holder in referenced_by:
+            report['blockers'].setdefault(holder, []).append(f"{resource_type}:{name}")
+
+    for resource_type, blocked in sorted((result.get('blocked') or {}).items()):
+        for name, holders in sorted(blocked.items()):
+            add(resource_type, name, 409,
+                f"Still referred to by {len(holders)} object(s)", list(holders))
+    referrers = result.get('referrers') or {}
+    deleted = set(f"{resource_type}:{name}"
+                  for resource_type, names in (result.get('deleted') or {}).items()
+                  for name in names)
+    for resource_type, failed in sorted((result.get('failed') or {}).items()):
+        for name, error in sorted(failed.items()):
+            status = _STATUS.search(str(error))
+            status = int(status.group(1)) if status else None
+            holders = []
+            if status == 409:
+                holders = [holder for holder in referrers.get(f"{resource_type}:{name}", [])
+                           if holder not in deleted]
+            add(resource_type, name, status, str(error), holders)
+    report['blockers'] = dict(sorted(report['blockers'].items(),
+                                     key=lambda item: (-len(item[1]), item[0])))
+    report['root_blockers'] = [holder for holder in report['blockers']
+                               if holder not in left_behind]
+    return report
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""Local registry of the secrets checked out from a WALLIX Bastion.
+
+Each checkout is recorded with its expiry and the response it returned, so a
+later task can reuse a lease it already holds, extend it only when it is
+about to expire and check in exactly the leases it took. The registry is one
+encrypted entry of the shared cache per Bastion and identity.
+
+A registry opened for a playbook run (``run_id``) also records which runs
+use each lease, so that the end of one run only checks in the leases no
+other run still uses.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import time
+
+# Assumed lifetime of a checkout when the Bastion does not report one.
+DEFAULT_LEASE_DURATION = 3600
+
+
+class LeaseRegistry:
+    """Leases held on one Bastion by one identity, keyed by account name."""
+
+    def __init__(self, cache, base_url, identity, run_id=None):
+        self.cache = cache
+        self.run_id = run_id
+        self._key = ["leases", base_url, identity]
+
+    @staticmethod
+    def _prune(leases):
+        now = time.time()
+        leases = dict((name, lease) for name, lease in (leases or {}).items()
+                      if lease["expires_at"] > now)
+        if not leases:
+            return None, 0
+        return leases, max(lease["expires_at"] for lease in leases.values()) - now
+
+    def all(self):
+        """Return every unexpired lease."""
+        return self._prune(self.cache.get(self._key))[0] or {}
+
+    def get(self, account_name):
+        return self.all().get(account_name)
+
+    def held(self):
+        """Return the unexpired leases used by this run."""
+        return dict((name, lease) for name, lease in self.all().items()
+                    if self.run_id in lease.get("runs", ()))
+
+    def record(self, account_name, metadata, duration, authorization=None,
+               checked_out_at=None):
+        """Record a checkout of ``account_name`` lasting ``duration`` seconds.
+
+        ``authorization`` is the one the checkout went through; extending or
+        checking in the lease must name it again. ``checked_out_at`` defaults
+        to now; a checkout reused from the shared cache passes its own.
+        """
+        checked_out_at = checked_out_at or time.time()
+        lease = dict(account=account_name, metadata=metadata, duration=duration,
+                     authorization=authorization, checked_out_at=checked_out_at,
+                     expires_at=checked_out_at + duration,
+                     runs=[self.run_id] if self.run_id else [])
+
+        def mutate(leases):
+            leases = dict(leases or {})
+            leases[account_name] = lease
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+        return lease
+
+    def renew(self, account_name, duration=None):
+        """Push the expiry of a held lease ``duration`` seconds from now."""
+        renewed = []
+
+        def mutate(leases):
+            leases = dict(leases or {})
+            lease = leases.get(account_name)
+            if lease is not None:
+                lease = dict(lease, expires_at=time.time() + (duration or lease["duration"]),
+                             renew_error=None)
+                leases[account_name] = lease
+                renewed.append(lease)
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+        return renewed[0] if renewed else None
+
+    def fail_renewal(self, account_name, error):
+        """Record on a held lease why extending it failed."""
+        def mutate(leases):
+            leases = dict(leases or {})
+            lease = leases.get(account_name)
+            if lease is not None:
+                leases[account_name] = dict(lease, renew_error=str(error))
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+
+    def claim(self, account_name):
+        """Mark a held lease as also used by this run."""
+        if not self.run_id:
+            return
+
+        def mutate(leases):
+            leases = dict(leases or {})
+            lease = leases.get(account_name)
+            if lease is not None and self.run_id not in lease.get("runs", ()):
+                leases[account_name] = dict(lease, runs=lease.get("runs", []) + [self.run_id])
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+
+    def release(self):
+        """Stop using the leases of this run.
+
+        Returns the names of the leases no other run uses any more, which
+        are left in the registry for the caller to check them in.
+        """
+        released = []
+
+        def mutate(leases):
+            leases = dict(leases or {})
+            for name, lease in leases.items():
+                runs = lease.get("runs", [])
+                if self.run_id in runs:
+                    runs = [run for run in runs if run != self.run_id]
+                    leases[name] = dict(lease, runs=runs)
+                    if not runs:
+                        released.append(name)
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+        return sorted(released)
+
+    def remove(self, account_name):
+        def mutate(leases):
+            leases = dict(leases or {})
+            leases.pop(account_name, None)
+            return self._prune(leases)
+
+        self.cache.update(self._key, mutate)
+
+
+def lease_info(lease, reused=False):
+    """Return the public view of a lease, without the secret it holds."""
+    if lease is None:
+        return None
+    return dict(account=lease["account"], expires_at=lease["expires_at"],
+                remaining=max(0, int(lease["expires_at"] - time.time())), reused=reused,
+                renew_error=lease.get("renew_error"))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""Shell-style name patterns compiled once into a single matcher.
+
+Matching a name against every pattern in turn costs one ``fnmatch`` call per
+pattern and name. :class:`GlobSet` sorts the patterns by kind instead:
+literal names go to a set, ``prefix*`` patterns to sets of prefixes keyed by
+length, and the remaining patterns to one alternation regex, so that a name
+is checked with a few set lookups and at most one regex match whatever the
+number of patterns. Matching is case-sensitive, like ``fnmatchcase``.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import re
+from fnmatch import translate
+from functools import lru_cache
+
+_MAGIC = re.compile(r'[*?[]')
+
+
+class GlobSet:
+    """Whether a name matches any of ``patterns``."""
+
+    def __init__(self, patterns):
+        self.literals = set()
+        prefixes = {}
+        others = []
+        for pattern in patterns:
+            if not _MAGIC.search(pattern):
+                self.literals.add(pattern)
+            elif pattern.endswith('*') and not _MAGIC.search(pattern[:-1]):
+                prefixes.setdefault(len(pattern) - 1, set()).add(pattern[:-1])
+            else:
+                others.append(pattern)
+        self.prefixes = sorted(prefixes.items())
+        self.regex = re.compile('|'.join(translate(pattern) for pattern in others)) if others else None
+
+    def __contains__(self, name):
+        if name in self.literals:
+            return True
+        for length, prefixes in self.prefixes:
+            if length > len(name):
+                break
+            if name[:length] in prefixes:
+                return True
+        return self.regex is not None and self.regex.match(name) is not None
+
+
+class PatternMatcher:
+    """Whether a name matches an ``include`` pattern and no ``exclude`` pattern.
+
+    With ``include`` None every name not excluded matches; an empty
+    ``include`` matches nothing.
+    """
+
+    def __init__(self, include, exclude=()):
+        self.include = None if include is None else GlobSet(include)
+        self.exclude = GlobSet(exclude or ())
+
+    def __call__(self, name):
+        if not isinstance(name, str):
+            return False
+        return (self.include is None or name in self.include) and name not in self.exclude
+
+    def partition(self, items, key=None):
+        """Split ``items`` into the matching and the other ones, in one pass.
+
+        ``key`` gives the name of an item; items are names by default.
+        """
+        matched, unmatched = [], []
+        for item in items:
+            (matched if self(key(item) if key else item) else unmatched).append(item)
+        return matched, unmatched
+
+
+@lru_cache(maxsize=64)
+def _compile(include, exclude):
+    return PatternMatcher(include, exclude)
+
+
+def compile_patterns(include, exclude=()):
+    """Return the :class:`PatternMatcher` of ``include`` and ``exclude``.
+
+    Matchers are cached, so repeated calls with the same patterns, for
+    instance once per host or task, compile them only once.
+    """
+    return _compile(None if include is None else tuple(include), tuple(exclude or ()))
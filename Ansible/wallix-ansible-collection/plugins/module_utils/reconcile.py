@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+"""Diff-based reconciliation of WALLIX Bastion objects.
+
+The objects of a collection endpoint (``devices``, ``users``...) are fetched
+once, projected on the compared fields, and diffed against the desired list.
+Only the resulting delta is sent to the Bastion: creations, updates of the
+fields that differ and deletions, run concurrently over the pooled session.
+Objects whose fingerprint (a hash of their normalized compared fields)
+matches the Bastion are skipped without a field-by-field diff. With the
+record of an :class:`applied_state.AppliedState`, objects applied as they are
+desired are skipped without being read while the Bastion is unchanged.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import json
+import time
+
+from ansible_collections.wallix.pam.plugins.module_utils.applied_state import (
+    probe_pages, read_pages)
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    quote_name)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _normalize(value):
+    # The Bastion omits empty attributes; treat them like empty strings.
+    if value is None:
+        return ''
+    # Nested settings (target group sessions...) drop their empty attributes.
+    if isinstance(value, dict):
+        normalized = dict((field, _normalize(item)) for field, item in value.items())
+        return dict((field, item) for field, item in normalized.items()
+                    if item not in ('', [], {}))
+    # Membership lists (groups, targets...) are compared regardless of order.
+    if isinstance(value, list):
+        return sorted((_normalize(item) for item in value), key=_canonical)
+    return value
+
+
+def fingerprint(obj, fields):
+    """Return a digest of the normalized ``fields`` of ``obj``.
+
+    Two objects with the same fingerprint need no update.
+    """
+    projection = dict((field, _normalize(obj.get(field))) for field in fields)
+    return hashlib.sha256(_canonical(projection).encode('utf-8')).hexdigest()
+
+
+def desired_payload(item):
+    """Return the attributes of a desired ``item`` to send, without ``state``."""
+    return dict((field, value) for field, value in item.items()
+                if field != 'state' and value is not None)
+
+
+def desired_fingerprint(item, fields):
+    """Return the fingerprint of the ``fields`` given for a desired ``item``."""
+    payload = desired_payload(item)
+    return fingerprint(payload, [field for field in fields if field in payload])
+
+
+def field_changes(desired, current, fields):
+    """Return ``{field: {before, after}}`` for the desired fields that differ."""
+    changes = {}
+    for field in fields:
+        if field in desired and _normalize(desired[field]) != _normalize(current.get(field)):
+            changes[field] = dict(before=current.get(field), after=desired[field])
+    return changes
+
+
+def compute_delta(desired, current, key, fields, purge=False, create_defaults=None):
+    """Diff desired objects against the current ones, indexed by ``key``.
+
+    ``desired`` items are payloads with an optional ``state``
+    (present/absent). With ``purge``, current objects missing from
+    ``desired`` are deleted too. ``create_defaults(payload)`` returns the
+    attributes sent on creation when the payload leaves them out; existing
+    objects are never compared with them.
+    """
+    names = [item[key] for item in desired]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise WallixAPIError(f"Duplicate {key} values: {', '.join(duplicates)}")
+
+    delta = dict(create=[], update=[], delete=[], unchanged=[])
+    for item in desired:
+        payload = desired_payload(item)
+        existing = current.get(payload[key])
+        if item.get('state', 'present') == 'absent':
+            if existing is not None:
+                delta['delete'].append(existing)
+        elif existing is None:
+            if create_defaults is not None:
+                payload = dict(create_defaults(payload), **payload)
+            delta['create'].append(payload)
+        else:
+            # Only the fields given for this object are compared.
+            compared = [field for field in fields if field in payload]
+            if fingerprint(payload, compared) == fingerprint(existing, compared):
+                delta['unchanged'].append(payload[key])
+                continue
+            changes = field_changes(payload, existing, fields)
+            if changes:
+                delta['update'].append((existing, changes))
+            else:
+                delta['unchanged'].append(payload[key])
+
+    if purge:
+        wanted = set(names)
+        delta['delete'].extend(obj for name, obj in sorted(current.items())
+                               if name not in wanted)
+    return delta
+
+
+def apply_delta(api, path, delta, key, id_field='id', max_workers=10):
+    """Send the creations, updates and deletions of ``delta`` concurrently.
+
+    Returns the names created, updated and deleted, and the failures keyed by name.
+    """
+    ops = ([('create', payload[key], payload) for payload in delta['create']]
+           + [('update', obj[key], (obj, changes)) for obj, changes in delta['update']]
+           + [('delete', obj[key], obj) for obj in delta['delete']])
+
+    def run(op):
+        action, _name, data = op
+        start = time.monotonic()
+        if action == 'create':
+            api.post(path, data)
+        elif action == 'update':
+            obj, changes = data
+            api.put(f"{path}/{obj[id_field]}",
+                    dict((field, change['after']) for field, change in changes.items()))
+        else:
+            api.delete(f"{path}/{data[id_field]}")
+        return round(time.monotonic() - start, 3)
+
+    done = dict(create='created', update='updated', delete='deleted')
+    result = dict(created=[], updated=[], deleted=[], failed={}, durations={})
+    for (action, name, _data), (elapsed, error) in zip(ops, api.bulk(run, ops, max_workers)):
+        if error is not None:
+            result['failed'][name] = str(error)
+        else:
+            result[done[action]].append(name)
+            result['durations'][name] = elapsed
+    return result
+
+
+def merge_results(first, second):
+    """Combine the results of two apply_delta calls on the same endpoint."""
+    merged = dict(first)
+    for field in ('created', 'updated', 'deleted'):
+        merged[field] = first[field] + second[field]
+    for field in ('failed', 'durations'):
+        merged[field] = dict(first[field], **second[field])
+    return merged
+
+
+def fetch_current(api, path, key, fields, id_field='id'):
+    """Return the objects of ``path`` keyed by ``key``, limited to ``id_field`` and ``fields``."""
+    return dict((obj[key], obj) for obj in
+                api.paginate(path, fields=[id_field] + list(fields)))
+
+
+def fetch_with_state(api, path, key, fields, desired, record, purge=False, max_workers=10,
+                     id_field='id', page_size=500):
+    """Return ``(current, desired, skipped)`` to diff with ``compute_delta``.
+
+    When the pages of ``path`` are unchanged since ``record`` was written,
+    the desired objects applied as they are now are skipped (and left out
+    of the returned ``desired``), the others are read one by one and, with
+    ``purge``, the recorded objects not desired are returned from the
+    record. Otherwise ``path`` is read in full and ``record`` refreshed from
+    it; nothing is skipped.
+    """
+    read_fields = [id_field] + list(fields)
+    if not probe_pages(api, path, read_fields, record['pages'], page_size, max_workers):
+        items, record['pages'] = read_pages(api, path, read_fields, page_size)
+        current = dict((obj[key], obj) for obj in items)
+        # The objects may have been changed since they were applied: their
+        # fingerprints are recorded again once compared with the desired ones.
+        record['objects'] = dict((name, dict(id=obj.get(id_field), sha256=None))
+                                 for name, obj in current.items())
+        return current, desired, []
+
+    objects = record['objects']
+    current, skipped, to_read = {}, [], []
+    for item in desired:
+        name = item[key]
+        entry = objects.get(name)
+        if entry is None:
+            # Never recorded, so not on the Bastion: its pages would differ.
+            if item.get('state', 'present') == 'absent':
+                skipped.append(name)
+        elif item.get('state', 'present') == 'absent':
+            current[name] = {key: name, id_field: entry['id']}
+        elif entry['sha256'] == desired_fingerprint(item, fields):
+            skipped.append(name)
+        else:
+            to_read.append(name)
+
+    def read(name):
+        return api.get(f"{path}/{quote_name(name)}", dict(fields=','.join(read_fields)))
+
+    for name, (obj, error) in zip(to_read, api.bulk(read, to_read, max_workers)):
+        if error is not None:
+            raise error
+        current[name] = obj
+    if purge:
+        wanted = set(item[key] for item in desired)
+        current.update((name, {key: name, id_field: entry['id']})
+                       for name, entry in objects.items() if name not in wanted)
+    skipped_names = set(skipped)
+    return current, [item for item in desired if item[key] not in skipped_names], skipped
+
+
+def fetch_endpoints(api, endpoints, state=None, max_workers=10):
+    """Read the ``(path, key, fields, desired, purge)`` endpoints at the same time.
+
+    Returns ``{path: (current, desired, skipped)}``. With ``state``, an
+    :class:`applied_state.AppliedState`, the endpoints given a ``desired``
+    list are read through :func:`fetch_with_state`; the others, and all of
+    them without ``state``, are read in full.
+    """
+    def fetch(endpoint):
+        path, key, fields, desired, purge = endpoint
+        if state is None or desired is None:
+            return fetch_current(api, path, key, fields), desired, []
+        return fetch_with_state(api, path, key, fields, desired, state.endpoint(path),
+                                purge, max_workers)
+
+    snapshots = {}
+    reads = api.bulk(fetch, endpoints, max(1, len(endpoints)))
+    for endpoint, (snapshot, error) in zip(endpoints, reads):
+        if error is not None:
+            raise error
+        snapshots[endpoint[0]] = snapshot
+    return snapshots
+
+
+def record_applied(record, desired, result, key, fields):
+    """Update ``record`` with the outcome of applying ``desired``.
+
+    ``result`` is the result of the endpoint as completed by :func:`summarize`.
+    """
+    objects = record['objects']
+    for name in result['deleted']:
+        objects.pop(name, None)
+    applied = set(result['created'] + result['updated'] + result['unchanged'])
+    for item in desired:
+        name = item[key]
+        if name in result['failed']:
+            if name in objects:
+                objects[name]['sha256'] = None
+        elif name in applied and item.get('state', 'present') == 'present':
+            objects.setdefault(name, dict(id=None))['sha256'] = desired_fingerprint(item, fields)
+    if result['created'] or result['updated'] or result['deleted'] or result['failed']:
+        record['pages'] = []
+
+
+def planned_result(delta, key):
+    """Return what applying ``delta`` would change, for check mode."""
+    return dict(
+        created=[payload[key] for payload in delta['create']],
+        updated=[obj[key] for obj, _changes in delta['update']],
+        deleted=[obj[key] for obj in delta['delete']],
+        failed={}, durations={})
+
+
+def summarize(result, delta, current, key, skipped=(), record=None):
+    """Complete an apply (or planned) result with the unchanged objects and the changes.
+
+    ``skipped`` objects, left out of ``delta`` by :func:`fetch_with_state`,
+    are unchanged too and counted as ``from_state``; the total is then that
+    of the ``record``.
+    """
+    result.update(
+        changed=bool(result['created'] or result['updated'] or result['deleted']),
+        unchanged=list(skipped) + delta['unchanged'],
+        from_state=len(skipped),
+        changes=dict((obj[key], changes) for obj, changes in delta['update']),
+        total=len(current) if record is None else len(record['objects']))
+    return result
+
+
+def reconcile(api, path, desired, key, fields, purge=False, max_workers=10,
+              check_mode=False, id_field='id', record=None, create_defaults=None):
+    """Converge the objects of ``path`` to ``desired`` and return a module result.
+
+    Current objects are read once, paginated and limited to ``id_field`` and
+    ``fields``, or through the applied-state ``record`` of ``path`` when
+    given (see :func:`fetch_with_state`), which is then updated. In check
+    mode the delta is computed but not applied. ``create_defaults`` is
+    passed on to :func:`compute_delta`.
+    """
+    skipped = []
+    if record is None:
+        current = fetch_current(api, path, key, fields, id_field)
+    else:
+        current, desired, skipped = fetch_with_state(api, path, key, fields, desired, record,
+                                                     purge, max_workers, id_field)
+    delta = compute_delta(desired, current, key, fields, purge, create_defaults)
+    if check_mode:
+        result = planned_result(delta, key)
+    else:
+        result = apply_delta(api, path, delta, key, id_field, max_workers)
+    result = summarize(result, delta, current, key, skipped, record)
+    if record is not None and not check_mode:
+        record_applied(record, desired, result, key, fields)
+    return result
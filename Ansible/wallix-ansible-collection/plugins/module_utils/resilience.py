@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Timeouts, retries and circuit breaking for WALLIX Bastion API calls."""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import fcntl
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+
+import requests
+
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    default_cache_dir, ensure_private_dir)
+
+# Responses worth retrying: the Bastion or a proxy in front of it is unhealthy.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fail fast once a Bastion has failed ``threshold`` times in a row.
+
+    The state is kept in a small file of the per-user cache directory so that
+    every fork of the run sees the same breaker; it is only changed under a
+    ``flock`` so that concurrent failures all count. After ``reset_timeout``
+    seconds the breaker lets one trial call through (half-open), across all
+    forks; a success closes it again.
+    """
+
+    def __init__(self, base_url, threshold=5, reset_timeout=30, state_dir=None):
+        self.base_url = base_url.rstrip("/")
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state_dir = state_dir or default_cache_dir()
+        digest = hashlib.sha256(self.base_url.encode("utf-8")).hexdigest()
+        self._path = os.path.join(self.state_dir, f"breaker-{digest}.json")
+        self._lock_path = os.path.join(self.state_dir, f"breaker-{digest}.lock")
+
+    def _load(self):
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {"failures": 0, "opened_at": None}
+
+    def _save(self, state):
+        try:
+            ensure_private_dir(self.state_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._path)
+        except Exception:
+            # Losing breaker state only costs a few extra attempts.
+            pass
+
+    @contextmanager
+    def _locked(self):
+        fd = None
+        try:
+            ensure_private_dir(self.state_dir)
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except Exception:
+            # Without the lock the breaker still works, only less precisely.
+            if fd is not None:
+                os.close(fd)
+                fd = None
+        try:
+            yield
+        finally:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def allow(self):
+        """Raise CircuitOpenError while the breaker is open.
+
+        Once ``reset_timeout`` has elapsed, only the first caller is let
+        through until it succeeds, fails or itself takes ``reset_timeout``.
+        """
+        if self.threshold <= 0 or not self._load().get("opened_at"):
+            return
+        with self._locked():
+            state = self._load()
+            opened_at = state.get("opened_at")
+            if not opened_at:
+                return
+            now = time.time()
+            trial_at = state.get("trial_at")
+            if (now - opened_at >= self.reset_timeout
+                    and not (trial_at and now - trial_at < self.reset_timeout)):
+                state["trial_at"] = now
+                self._save(state)
+                return
+        raise CircuitOpenError(
+            f"Circuit breaker open for {self.base_url} after {self.threshold} "
+            f"consecutive failures; retrying after {self.reset_timeout}s.")
+
+    def record_success(self):
+        if self.threshold <= 0 or not self._load()["failures"]:
+            return
+        with self._locked():
+            self._save({"failures": 0, "opened_at": None})
+
+    def record_failure(self):
+        if self.threshold <= 0:
+            return
+        with self._locked():
+            state = self._load()
+            state["failures"] += 1
+            if state["failures"] >= self.threshold:
+                state["opened_at"] = time.time()
+                state["trial_at"] = None
+            self._save(state)
+
+
+def call_with_retry(send, timeout=(10, 30), retries=3, backoff=0.5, max_backoff=10,
+                    deadline=None, breaker=None):
+    """Call ``send(timeout)`` with jittered exponential backoff.
+
+    Connection errors, timeouts and 5xx responses are retried up to
+    ``retries`` times. ``deadline`` is an absolute UNIX timestamp: no attempt
+    starts after it and the read timeout never runs past it. The last
+    response is returned as is; the last exception is re-raised.
+    """
+    connect_timeout, read_timeout = timeout
+    attempt = 0
+    while True:
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DeadlineExceeded("Deadline reached before the Bastion answered.")
+            read_timeout = min(timeout[1], remaining)
+        if breaker is not None:
+            breaker.allow()
+
+        error = response = None
+        try:
+            response = send((connect_timeout, read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if error is None and response.status_code not in RETRY_STATUSES:
+            if breaker is not None:
+                breaker.record_success()
+            return response
+
+        if breaker is not None:
+            breaker.record_failure()
+        if attempt >= retries:
+            if error is not None:
+                raise error
+            return response
+
+        # Full jitter keeps many forks from retrying in lockstep.
+        delay = random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+        if deadline is not None and time.time() + delay >= deadline:
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
+        attempt += 1
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""Registry of the WALLIX Bastion object types and of their dependencies.
+
+Each type names its API collection, the attribute naming its objects and the
+types its objects refer to. An object must be deleted before the objects it
+refers to: :func:`deletion_levels` turns those references into levels of
+types whose objects can be processed concurrently, and
+:func:`object_references` gives the references of one discovered object.
+:func:`creation_levels` orders types the other way round, for a restore.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from urllib.parse import quote
+
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+# ``fields`` are the attributes needed to find the references of an object.
+# ``created_after`` lists types that must exist before an object is created
+# but that do not keep it from being deleted (the groups and authentication
+# domains of a user). Local and global accounts are nested under their device
+# or domain and are named ``account@domain@device`` and ``account@domain``.
+RESOURCE_TYPES = dict(
+    authorizations=dict(path='authorizations', key='authorization_name',
+                        fields=['user_group', 'target_group'],
+                        refers_to=['user_groups', 'target_groups']),
+    target_groups=dict(path='targetgroups', key='group_name',
+                       fields=['session', 'password_retrieval'],
+                       refers_to=['local_accounts', 'global_accounts', 'devices']),
+    user_groups=dict(path='usergroups', key='group_name', fields=['timeframes'],
+                     refers_to=['timeframes']),
+    users=dict(path='users', key='user_name', fields=[], refers_to=[],
+               created_after=['user_groups', 'domains']),
+    local_accounts=dict(path='devices/{device_id}/localdomains/{domain_id}/accounts',
+                        key='account_name', fields=[],
+                        refers_to=['devices']),
+    global_accounts=dict(path='domains/{domain_id}/accounts', key='account_name', fields=[],
+                         refers_to=['global_domains']),
+    devices=dict(path='devices', key='device_name', fields=['services'],
+                 refers_to=['connection_policies']),
+    global_domains=dict(path='domains', key='domain_name', fields=[], refers_to=[]),
+    domains=dict(path='authdomains', key='domain_name', fields=[], refers_to=[]),
+    timeframes=dict(path='timeframes', key='timeframe_name', fields=[], refers_to=[]),
+    connection_policies=dict(path='connectionpolicies', key='connection_policy_name',
+                             fields=[], refers_to=[]),
+)
+
+
+def referring_types(resource_type):
+    """Return the types whose objects may refer to objects of ``resource_type``."""
+    return sorted(name for name, spec in RESOURCE_TYPES.items()
+                  if resource_type in spec['refers_to'])
+
+
+def deletion_levels(types):
+    """Group ``types`` into levels, each deleted after the levels before it.
+
+    A type comes after every type of ``types`` referring to it; the types of
+    one level do not depend on each other.
+    """
+    pending = set(types)
+    unknown = pending - set(RESOURCE_TYPES)
+    if unknown:
+        raise WallixAPIError(f"Unknown object types: {', '.join(sorted(unknown))}")
+    levels = []
+    while pending:
+        level = sorted(name for name in pending
+                       if not pending.intersection(referring_types(name)))
+        if not level:
+            raise WallixAPIError(f"Circular references between {', '.join(sorted(pending))}")
+        levels.append(level)
+        pending.difference_update(level)
+    return levels
+
+
+def creation_levels(types):
+    """Group ``types`` into levels, each created after the levels before it.
+
+    A type comes as early as possible after every type of ``types`` it
+    refers to or is created after.
+    """
+    pending = set(types)
+    unknown = pending - set(RESOURCE_TYPES)
+    if unknown:
+        raise WallixAPIError(f"Unknown object types: {', '.join(sorted(unknown))}")
+    levels = []
+    while pending:
+        level = sorted(name for name in pending
+                       if not pending.intersection(RESOURCE_TYPES[name]['refers_to']
+                                                   + RESOURCE_TYPES[name].get('created_after', [])))
+        if not level:
+            raise WallixAPIError(f"Circular references between {', '.join(sorted(pending))}")
+        levels.append(level)
+        pending.difference_update(level)
+    return levels
+
+
+def _account_references(accounts):
+    for account in accounts or []:
+        if not isinstance(account, dict) or not account.get('account'):
+            continue
+        name = f"{account['account']}@{account.get('domain')}"
+        if account.get('domain_type') == 'local':
+            yield ('local_accounts', f"{name}@{account.get('device')}")
+            yield ('devices', account.get('device'))
+        else:
+            yield ('global_accounts', name)
+
+
+def object_references(resource_type, obj):
+    """Return the ``(type, name)`` of the objects ``obj`` refers to."""
+    refs = set()
+    if resource_type == 'authorizations':
+        refs.update((ref_type, obj.get(field)) for ref_type, field in
+                    (('user_groups', 'user_group'), ('target_groups', 'target_group')))
+    elif resource_type == 'target_groups':
+        for section in ('session', 'password_retrieval'):
+            settings = obj.get(section) or {}
+            refs.update(_account_references(settings.get('accounts')))
+            for field in ('account_mappings', 'interactive_logins'):
+                refs.update(('devices', target.get('device'))
+                            for target in settings.get(field) or []
+                            if isinstance(target, dict))
+    elif resource_type == 'user_groups':
+        refs.update(('timeframes', name) for name in obj.get('timeframes') or [])
+    elif resource_type == 'devices':
+        refs.update(('connection_policies', service.get('connection_policy'))
+                    for service in obj.get('services') or [] if isinstance(service, dict))
+    return sorted(ref for ref in refs if ref[1])
+
+
+def _instance(resource_type, name, path, obj, match=None):
+    # ``match`` is the name checked against include/exclude patterns.
+    return dict(type=resource_type, name=name, path=path, object=obj, match=match or name)
+
+
+def _nested(api, parents, fields, max_workers, page_size):
+    # List the children of every parent path at once.
+    results = api.bulk(lambda parent: api.get_all(parent, fields=fields, page_size=page_size),
+                       parents, max_workers)
+    for parent, (children, error) in zip(parents, results):
+        if error is not None and getattr(error, 'status', None) != 404:
+            raise error
+        yield parent, children or []
+
+
+def _projection(spec, fields, project):
+    if not project:
+        return None
+    extra = spec['fields'] if fields is None else fields
+    return ['id', spec['key']] + [field for field in extra if field not in ('id', spec['key'])]
+
+
+def quote_name(name):
+    """Return ``name`` escaped to stand for an object id in an API path."""
+    return quote(str(name), safe='')
+
+
+def _bulk_local_accounts(api, projection, page_size):
+    # Every device account in one paginated read. The Bastion takes names
+    # in place of ids in object paths, so no per-device read is needed.
+    fields = projection and projection + [field for field in ('device', 'domain')
+                                          if field not in projection]
+    accounts = api.get_all('accounts', params=dict(account_type='device'), fields=fields,
+                           page_size=page_size)
+    return [(account['device'], account['domain'],
+             f"devices/{quote_name(account['device'])}"
+             f"/localdomains/{quote_name(account['domain'])}/accounts", account)
+            for account in accounts if account.get('device')]
+
+
+def _nested_local_accounts(api, projection, max_workers, page_size):
+    # Without the /accounts endpoint, the local domains of all devices, then
+    # the accounts of all those domains, are each read concurrently.
+    devices = api.get_all('devices', fields=['id', 'device_name'], page_size=page_size)
+    names = dict((f"devices/{device['id']}/localdomains", device['device_name'])
+                 for device in devices)
+    domains = dict((f"{parent}/{domain['id']}/accounts", (names[parent], domain['domain_name']))
+                   for parent, children in _nested(api, sorted(names), ['id', 'domain_name'],
+                                                   max_workers, page_size)
+                   for domain in children)
+    return [(device, domain, parent, account)
+            for parent, children in _nested(api, sorted(domains), projection,
+                                            max_workers, page_size)
+            for device, domain in [domains[parent]]
+            for account in children]
+
+
+def local_accounts(api, max_workers=10, fields=None, project=True, page_size=500):
+    """Return the local accounts of all devices as ``(device, domain, parent path, account)``.
+
+    The accounts are read through the ``/accounts`` endpoint when the
+    Bastion has it, and through the local domains of every device otherwise.
+    """
+    projection = _projection(RESOURCE_TYPES['local_accounts'], fields, project)
+    try:
+        return _bulk_local_accounts(api, projection, page_size)
+    except WallixAPIError as e:
+        if e.status not in (400, 404, 405):
+            raise
+    return _nested_local_accounts(api, projection, max_workers, page_size)
+
+
+def iter_discover(api, resource_type, max_workers=10, fields=None, project=True, page_size=500):
+    """Yield the objects of ``resource_type`` with their name and API path.
+
+    Objects are read ``page_size`` at a time and limited to their id, name
+    and ``fields`` (by default those giving their references). With
+    ``project`` false, whole objects are read. Top-level objects are yielded
+    page by page as they are read; accounts once all are read.
+    """
+    spec = RESOURCE_TYPES[resource_type]
+    projection = _projection(spec, fields, project)
+    if resource_type == 'local_accounts':
+        for device, domain, parent, account in local_accounts(
+                api, max_workers, fields, project, page_size):
+            yield dict(_instance(resource_type, f"{account['account_name']}@{domain}@{device}",
+                                 f"{parent}/{account['id']}", account, device), device=device)
+        return
+    if resource_type == 'global_accounts':
+        domains = dict((f"domains/{domain['id']}/accounts", domain['domain_name'])
+                       for domain in api.get_all('domains', fields=['id', 'domain_name'],
+                                                 page_size=page_size))
+        for parent, children in _nested(api, sorted(domains), projection, max_workers,
+                                        page_size):
+            for account in children:
+                yield _instance(resource_type, f"{account['account_name']}@{domains[parent]}",
+                                f"{parent}/{account['id']}", account, account['account_name'])
+        return
+    for obj in api.paginate(spec['path'], fields=projection, page_size=page_size):
+        yield _instance(resource_type, obj[spec['key']], f"{spec['path']}/{obj['id']}", obj)
+
+
+def discover(api, resource_type, max_workers=10, fields=None, project=True, page_size=500):
+    """Return the objects of ``resource_type``, see :func:`iter_discover`."""
+    return list(iter_discover(api, resource_type, max_workers, fields, project, page_size))
+
+
+def discover_all(api, types, max_workers=10, fields=None, project=True, page_size=500):
+    """Discover the objects of ``types`` concurrently, keyed by type.
+
+    ``fields`` optionally maps a type to the fields read for it.
+    """
+    types = sorted(types)
+    fields = fields or {}
+    snapshots = {}
+    results = api.bulk(
+        lambda resource_type: discover(api, resource_type, max_workers,
+                                       fields.get(resource_type), project, page_size),
+        types, max_workers)
+    for resource_type, (instances, error) in zip(types, results):
+        if error is not None:
+            raise error
+        snapshots[resource_type] = instances
+    return snapshots
+
+
+def index_instances(instances, resource_type=None):
+    """Return a compact index of discovered objects.
+
+    Each object is kept once, under ``by_id``; ``by_name`` maps names to ids
+    and, for local accounts, ``by_device`` maps device names to account ids.
+    """
+    index = dict(
+        count=len(instances),
+        by_id=dict((instance['object']['id'], instance['object']) for instance in instances),
+        by_name=dict((instance['name'], instance['object']['id']) for instance in instances))
+    if resource_type == 'local_accounts':
+        by_device = index['by_device'] = {}
+        for instance in instances:
+            by_device.setdefault(instance['device'], []).append(instance['object']['id'])
+    return index
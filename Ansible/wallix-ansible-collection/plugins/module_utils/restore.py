@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""Replay of the backups written by :mod:`backup` onto a WALLIX Bastion.
+
+Types are created level by level (see :func:`resources.creation_levels`):
+domains and timeframes first, then devices and groups, accounts and users,
+target groups and authorizations last. The objects of a level are read from
+the backup files in chunks and created concurrently; objects that already
+exist are skipped or updated. The restored objects can then be read back and
+compared with the backup, on the attributes the restore sent.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import itertools
+import time
+
+from ansible_collections.wallix.pam.plugins.module_utils.backup import (
+    iter_records, object_hash, read_manifest)
+from ansible_collections.wallix.pam.plugins.module_utils.reconcile import (
+    fingerprint)
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    RESOURCE_TYPES, creation_levels, discover, quote_name)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+# Attributes set by the Bastion, or added by the endpoint an object was read
+# from, that are not sent back when it is created.
+READ_ONLY_FIELDS = dict(local_accounts=('id', 'device', 'domain'))
+DEFAULT_READ_ONLY_FIELDS = ('id',)
+
+# Objects read from the backup and sent to the Bastion at once.
+CHUNK_SIZE = 1000
+
+
+def creation_path(resource_type, name):
+    """Return the collection an object of ``resource_type`` named ``name`` is created in."""
+    if resource_type == 'local_accounts':
+        _account, domain, device = name.rsplit('@', 2)
+        return f"devices/{quote_name(device)}/localdomains/{quote_name(domain)}/accounts"
+    if resource_type == 'global_accounts':
+        _account, domain = name.rsplit('@', 1)
+        return f"domains/{quote_name(domain)}/accounts"
+    return RESOURCE_TYPES[resource_type]['path']
+
+
+def creation_payload(resource_type, obj):
+    """Return ``obj`` without the attributes the Bastion does not take on creation."""
+    read_only = READ_ONLY_FIELDS.get(resource_type, DEFAULT_READ_ONLY_FIELDS)
+    return dict((field, value) for field, value in obj.items() if field not in read_only)
+
+
+def iter_backup(manifest, directory, resource_type):
+    """Yield ``(name, object, intact)`` for the objects of ``resource_type``.
+
+    Objects are read file by file from the files the manifest points to;
+    ``intact`` tells whether an object still has the hash of the manifest.
+    """
+    entries = manifest['types'][resource_type]['objects']
+    files = sorted(set(entry['file'] for entry in entries.values()))
+    for file_name in files:
+        for name, obj in iter_records(directory, file_name):
+            entry = entries.get(name)
+            # Earlier backups also hold the older versions of changed objects.
+            if entry is not None and entry['file'] == file_name:
+                yield name, obj, object_hash(obj) == entry['sha256']
+
+
+def _local_domains(api, names, max_workers):
+    # Accounts are created in the local domain of their device, which may
+    # be gone along with the device.
+    domains = sorted(set(tuple(name.rsplit('@', 2)[1:]) for name in names))
+
+    def create(domain):
+        name, device = domain
+        try:
+            api.post(f"devices/{quote_name(device)}/localdomains", dict(domain_name=name))
+        except WallixAPIError as e:
+            if e.status != 409:
+                raise
+    for (name, device), (_result, error) in zip(domains, api.bulk(create, domains, max_workers)):
+        if error is not None:
+            raise WallixAPIError(f"Unable to create the local domain {name} of {device}: {error}")
+
+
+def _intact_records(manifest, directory, types, corrupted):
+    # Objects whose content no longer matches the manifest are not replayed.
+    for resource_type in types:
+        for name, obj, intact in iter_backup(manifest, directory, resource_type):
+            if intact:
+                yield resource_type, name, obj
+            else:
+                corrupted.setdefault(resource_type, []).append(name)
+
+
+def _replay(api, records, existing, max_workers):
+    def create(record):
+        resource_type, name, obj = record
+        path = creation_path(resource_type, name)
+        payload = creation_payload(resource_type, obj)
+        try:
+            api.post(path, payload)
+            return 'created'
+        except WallixAPIError as e:
+            if e.status != 409:
+                raise
+        if existing != 'update':
+            return 'existing'
+        key = RESOURCE_TYPES[resource_type]['key']
+        # The Bastion takes names in place of ids in object paths.
+        api.put(f"{path}/{quote_name(obj.get(key) or name)}", payload)
+        return 'updated'
+    return zip(records, api.bulk(create, records, max_workers))
+
+
+def verify_restore(api, manifest, directory, types, max_workers=10):
+    """Compare the objects of ``types`` on the Bastion with the backup.
+
+    Only the attributes a restore sends (see :func:`creation_payload`) are
+    compared, normalized like for reconciliation, so ids and attributes the
+    Bastion adds or sets itself do not count as differences. Objects whose
+    backup is corrupted are not compared.
+
+    Returns, by type, the names of the objects whose content differs
+    (``mismatched``) and of those not found (``missing``), and the number of
+    objects ``verified``.
+    """
+    result = dict(verified={}, mismatched={}, missing={})
+    for resource_type in types:
+        current = dict((instance['name'], instance['object'])
+                       for instance in discover(api, resource_type, max_workers, project=False))
+        verified, mismatched, missing = 0, [], []
+        for name, obj, intact in iter_backup(manifest, directory, resource_type):
+            if not intact:
+                continue
+            if name not in current:
+                missing.append(name)
+                continue
+            fields = sorted(creation_payload(resource_type, obj))
+            if fingerprint(obj, fields) != fingerprint(current[name], fields):
+                mismatched.append(name)
+            else:
+                verified += 1
+        result['verified'][resource_type] = verified
+        if mismatched:
+            result['mismatched'][resource_type] = sorted(mismatched)
+        if missing:
+            result['missing'][resource_type] = sorted(missing)
+    return result
+
+
+def run_restore(api, src, types=None, existing='skip', verify=True, max_workers=10,
+                check_mode=False):
+    """Recreate the objects of the backup ``src`` (manifest or directory).
+
+    ``types`` defaults to every type of the backup. Objects that already
+    exist are left as they are, or updated with ``existing`` set to
+    ``update``. In check mode nothing is sent and every object is reported
+    as to be created.
+    """
+    manifest, directory = read_manifest(src)
+    types = sorted(types or manifest['types'])
+    absent = set(types) - set(manifest['types'])
+    if absent:
+        raise WallixAPIError(f"Types not in the backup: {', '.join(sorted(absent))}")
+
+    result = dict(summary={}, failed={}, corrupted={}, levels=[])
+    for resource_type in types:
+        result['summary'][resource_type] = dict(
+            backed_up=manifest['types'][resource_type]['count'],
+            created=0, existing=0, updated=0, failed=0)
+    for level in creation_levels(types):
+        start = time.monotonic()
+        if 'local_accounts' in level and not check_mode:
+            _local_domains(api, manifest['types']['local_accounts']['objects'], max_workers)
+        replayed = 0
+        records = _intact_records(manifest, directory, level, result['corrupted'])
+        while True:
+            chunk = list(itertools.islice(records, CHUNK_SIZE))
+            if not chunk:
+                break
+            replayed += len(chunk)
+            if check_mode:
+                outcomes = zip(chunk, [('created', None)] * len(chunk))
+            else:
+                outcomes = _replay(api, chunk, existing, max_workers)
+            for (resource_type, name, _obj), (outcome, error) in outcomes:
+                summary = result['summary'][resource_type]
+                if error is not None:
+                    result['failed'].setdefault(resource_type, {})[name] = str(error)
+                    summary['failed'] += 1
+                else:
+                    summary[outcome] += 1
+        result['levels'].append(dict(types=level, objects=replayed,
+                                     seconds=round(time.monotonic() - start, 3)))
+
+    if verify and not check_mode:
+        start = time.monotonic()
+        result['verification'] = verify_restore(api, manifest, directory, types, max_workers)
+        result['verification']['seconds'] = round(time.monotonic() - start, 3)
+    return result
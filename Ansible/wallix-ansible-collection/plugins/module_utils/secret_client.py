@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+"""Checkout, extend and checkin of WALLIX Bastion secrets.
+
+Shared by the ``wallix.pam.secret`` module, its controller-side action plugin
+and the ``wallix.pam.secret`` lookup.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import time
+
+from ansible_collections.wallix.pam.plugins.module_utils.lease_registry import (
+    DEFAULT_LEASE_DURATION, LeaseRegistry, lease_info)
+from ansible_collections.wallix.pam.plugins.module_utils.resilience import (
+    CircuitOpenError, DeadlineExceeded)
+from ansible_collections.wallix.pam.plugins.module_utils.session_auth import (
+    SessionAuthError)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    SharedCache, SharedCacheError)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, WallixAPIError, create_api, run_bulk)
+
+STATES = ['checkout', 'checkin', 'extend']
+
+ACCOUNT_SPEC = dict(
+    account=dict(type='str', required=True),
+    domain=dict(type='str', required=False),
+    device=dict(type='str', required=False),
+    application=dict(type='str', required=False),
+    state=dict(type='str', required=False, choices=STATES),
+    authorization=dict(type='str', required=False),
+    key_format=dict(type='str', required=False),
+    cert_format=dict(type='str', required=False),
+    duration=dict(type='int', required=False),
+    force=dict(type='bool', required=False),
+    comment=dict(type='str', required=False),
+)
+
+ARGUMENT_SPEC = dict(
+    API_ARGUMENT_SPEC,
+    account=dict(type='str', required=False),
+    accounts=dict(type='list', elements='dict', required=False, options=ACCOUNT_SPEC),
+    max_workers=dict(type='int', required=False, default=10),
+    domain=dict(type='str', required=False, default=""),
+    device=dict(type='str', required=False),
+    application=dict(type='str', required=False),
+    key_format=dict(type='str', required=False),
+    cert_format=dict(type='str', required=False),
+    authorization=dict(type='str', required=False),
+    duration=dict(type='int', required=False),
+    key_passphrase=dict(type='str', required=False, no_log=True),
+    state=dict(type='str', required=False, default='checkout',
+               choices=STATES + ['checkin_all']),
+    force=dict(type='bool', required=False, default=False),
+    comment=dict(type='str', required=False),
+    shared_cache=dict(type='bool', required=False, default=False),
+    shared_cache_dir=dict(type='path', required=False),
+    cache_ttl=dict(type='int', required=False, default=300),
+    lease_registry=dict(type='bool', required=False, default=False),
+    extend_threshold=dict(type='int', required=False, default=300),
+    renew_leases=dict(type='bool', required=False, default=False),
+    renew_interval=dict(type='int', required=False, default=60)
+)
+
+# account or accounts is required except for state=checkin_all (see execute).
+REQUIRED_ONE_OF = API_REQUIRED_ONE_OF
+MUTUALLY_EXCLUSIVE = [['account', 'accounts']]
+
+
+def build_account_name(account, domain=None, device=None, application=None):
+    """Return the Bastion account name (account[@domain][@device|@application])."""
+    if device:
+        if domain:
+            return f"{account}@{domain}@{device}"
+        return f"{account}@{device}"
+    if application:
+        if domain:
+            return f"{account}@{domain}@{application}"
+        return f"{account}@{application}"
+    if domain:
+        return f"{account}@{domain}"
+    return account
+
+
+def secret_fields(data):
+    """Return the result fields exposing the secret of a checkout response."""
+    fields = {}
+    if 'login' in data:
+        fields['login'] = data['login']
+    if 'password' in data:
+        fields['password'] = data['password']
+    elif 'ssh_key' in data:
+        fields['password'] = data['ssh_key']
+        fields['ssh_key'] = data['ssh_key']
+    elif 'key' in data:
+        fields['password'] = data['key']
+    return fields
+
+
+class SecretClient:
+    """Run checkout, extend and checkin operations against one Bastion."""
+
+    def __init__(self, api, cache=None, cache_ttl=300, leases=None, extend_threshold=300):
+        self.api = api
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.leases = leases
+        self.extend_threshold = extend_threshold
+
+    def checkout(self, op):
+        """Check out an account.
+
+        Returns the response, whether it came from the cache and when the
+        Bastion issued it.
+        """
+        account_name = op['account_name']
+        headers = {}
+        path = f"targetpasswords/checkout/{account_name}"
+        params = {}
+        if op.get('key_format'):
+            params['key_format'] = op['key_format']
+        if op.get('cert_format'):
+            params['cert_format'] = op['cert_format']
+        if op.get('authorization'):
+            params['authorization'] = op['authorization']
+        if op.get('duration'):
+            params['duration'] = op['duration']
+
+        if op.get('key_passphrase'):
+            headers['X-Key-Passphrase'] = op['key_passphrase']
+
+        if self.cache is None:
+            return self.api.get(path, params, headers=headers, retry=True), False, time.time()
+
+        computed = []
+
+        def checkout():
+            data = self.api.get(path, params, headers=headers, retry=True)
+            computed.append(True)
+            ttl = self.cache_ttl
+            if isinstance(data.get('duration'), int):
+                ttl = min(ttl, data['duration'])
+            return dict(response=data, checked_out_at=time.time()), ttl
+
+        # The cache key covers everything that shapes the returned secret.
+        passphrase = op.get('key_passphrase') or ''
+        cache_key = [
+            'module', self.api.base_url, self.api.identity, account_name, params,
+            hashlib.sha256(passphrase.encode('utf-8')).hexdigest(),
+        ]
+        entry = self.cache.get_or_compute(cache_key, checkout)
+        return entry['response'], not computed, entry['checked_out_at']
+
+    def extend(self, op):
+        path = f"targetpasswords/extendcheckout/{op['account_name']}"
+        params = {}
+        if op.get('authorization'):
+            params['authorization'] = op['authorization']
+
+        # Only checkouts are safe to replay; checkin and extend are sent once.
+        return self.api.get(path, params, retry=False)
+
+    def checkin(self, op):
+        path = f"targetpasswords/checkin/{op['account_name']}"
+        params = {}
+        if op.get('authorization'):
+            params['authorization'] = op['authorization']
+        if op.get('force'):
+            params['force'] = 'true'
+            if not op.get('comment'):
+                raise WallixAPIError("Comment is required when force is true")
+            params['comment'] = op['comment']
+
+        return self.api.get(path, params, retry=False)
+
+    def _needs_extension(self, lease):
+        return lease['expires_at'] - time.time() <= self.extend_threshold
+
+    def run(self, op):
+        """Perform the operation described by ``op`` and return its result."""
+        if self.leases is not None:
+            return self._run_with_leases(op)
+
+        state = op['state']
+        result = dict(changed=False, password='', metadata={})
+        if state == 'checkout':
+            data, result['cached'], _checked_out_at = self.checkout(op)
+            result.update(secret_fields(data))
+        elif state == 'extend':
+            data = self.extend(op)
+        elif state == 'checkin':
+            data = self.checkin(op)
+
+        result['metadata'] = data
+        # Assuming any successful API call is a change or access,
+        # unless the checkout was already held through the shared cache
+        result['changed'] = not result.get('cached', False)
+        return result
+
+    def _run_with_leases(self, op):
+        """Run ``op`` using the lease registry to skip redundant API calls."""
+        name = op['account_name']
+        state = op['state']
+        lease = self.leases.get(name)
+        result = dict(changed=False, password='', metadata={})
+
+        if state == 'checkout':
+            if lease is None:
+                data, result['cached'], checked_out_at = self.checkout(op)
+                duration = data.get('duration') if isinstance(data.get('duration'), int) else None
+                # A checkout shared by another fork has been running since it was issued.
+                lease = self.leases.record(
+                    name, data, duration or op.get('duration') or DEFAULT_LEASE_DURATION,
+                    op.get('authorization'), checked_out_at)
+                result['changed'] = not result['cached']
+                reused = False
+            else:
+                # A held lease is returned as is, extended only when about to expire.
+                self.leases.claim(name)
+                if self._needs_extension(lease):
+                    data = self.extend(op)
+                    duration = data.get('duration') if isinstance(data.get('duration'), int) else None
+                    lease = self.leases.renew(name, duration) or lease
+                    result['changed'] = True
+                reused = True
+            result['metadata'] = lease['metadata']
+            result.update(secret_fields(lease['metadata']))
+            result['lease'] = lease_info(lease, reused)
+
+        elif state == 'extend':
+            if lease is None or self._needs_extension(lease):
+                result['metadata'] = self.extend(op)
+                result['changed'] = True
+                duration = result['metadata'].get('duration')
+                if lease is not None:
+                    lease = self.leases.renew(name, duration if isinstance(duration, int) else None)
+            result['lease'] = lease_info(lease, reused=lease is not None)
+
+        elif state == 'checkin':
+            # Leases this controller never took are left alone unless forced.
+            if lease is not None or op.get('force'):
+                result['metadata'] = self.checkin(op)
+                result['changed'] = True
+                self.leases.remove(name)
+            result['lease'] = None
+
+        return result
+
+    def checkin_all(self, max_workers, authorization=None):
+        """Check in every lease of the registry concurrently.
+
+        Each lease is checked in through ``authorization`` if given, else
+        through the authorization it was checked out with.
+        """
+        ops = [dict(account_name=name, state='checkin',
+                    authorization=authorization or lease.get('authorization'))
+               for name, lease in sorted(self.leases.all().items())]
+        return run_operations(self, ops, max_workers)
+
+
+# Per-item options of the accounts list that default to the top-level value
+INHERITED_OPTIONS = ('domain', 'state', 'authorization', 'key_format', 'cert_format',
+                     'duration', 'force', 'comment')
+
+
+def batch_operations(params):
+    """Expand the ``accounts`` list into operations, applying top-level defaults."""
+    ops = []
+    for item in params['accounts']:
+        op = dict(item)
+        for option in INHERITED_OPTIONS:
+            if op.get(option) is None:
+                op[option] = params[option]
+        op['key_passphrase'] = params['key_passphrase']
+        op['account_name'] = build_account_name(
+            op['account'], op['domain'], op['device'], op['application'])
+        ops.append(op)
+
+    names = [op['account_name'] for op in ops]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise WallixAPIError(f"Duplicate accounts in batch: {', '.join(duplicates)}")
+    return ops
+
+
+def run_operations(client, ops, max_workers):
+    """Run ``ops`` concurrently and return their results keyed by account name."""
+    results = {}
+    for op, (result, error) in zip(ops, run_bulk(client.run, ops, max_workers)):
+        if error is not None:
+            result = dict(changed=False, failed=True, msg=str(error))
+        results[op['account_name']] = result
+    return results
+
+
+def create_client(params, pool_maxsize=10, run_id=None):
+    """Build a SecretClient from validated module parameters.
+
+    ``run_id`` identifies the playbook run whose leases are renewed and
+    checked in by the background renewer (see ``lease_renewer.run_id``).
+    """
+    # The lease registry lives in the shared cache directory even when
+    # secrets themselves are not shared. Background renewal needs it too.
+    use_leases = params['lease_registry'] or params['renew_leases']
+    store = None
+    if params['shared_cache'] or use_leases:
+        store = SharedCache(
+            params['api_key'] or params['session_cookie']
+            or f"{params['username']}:{params['password']}",
+            cache_dir=params['shared_cache_dir'])
+    cache = store if params['shared_cache'] else None
+
+    # Keep one connection alive per concurrent batch item.
+    api = create_api(params, store, max(pool_maxsize, params['max_workers']))
+    leases = LeaseRegistry(store, api.base_url, api.identity, run_id) if use_leases else None
+
+    return SecretClient(api, cache, params['cache_ttl'], leases, params['extend_threshold'])
+
+
+def summarize_batch(result, results):
+    """Fill a module result from per-account results keyed by account name."""
+    result['changed'] = any(r['changed'] for r in results.values())
+    result['accounts'] = results
+    failures = [f"{name}: {r['msg']}" for name, r in results.items() if r.get('failed')]
+    if failures:
+        result.update(
+            failed=True,
+            msg=f"{len(failures)} of {len(results)} accounts failed: " + "; ".join(failures))
+    return result
+
+
+def execute(params, run_id=None):
+    """Run the operation(s) described by validated module parameters.
+
+    Returns the module result; it contains ``failed`` and ``msg`` on error.
+    ``run_id`` is passed on to :func:`create_client`.
+    """
+    state = params['state']
+    if params['accounts'] or state == 'checkin_all':
+        result = dict(changed=False, accounts={})
+    else:
+        result = dict(changed=False, password='', metadata={})
+
+    if state == 'checkin_all':
+        if not (params['lease_registry'] or params['renew_leases']):
+            return dict(result, failed=True,
+                        msg="state=checkin_all requires lease_registry=true")
+    elif not (params['account'] or params['accounts']):
+        return dict(result, failed=True,
+                    msg="one of the following is required: account, accounts")
+
+    client = None
+    try:
+        client = create_client(params, run_id=run_id)
+
+        if state == 'checkin_all':
+            result = summarize_batch(result, client.checkin_all(
+                params['max_workers'], params['authorization']))
+        elif params['accounts']:
+            ops = batch_operations(params)
+            result = summarize_batch(result, run_operations(client, ops, params['max_workers']))
+        else:
+            op = dict(params)
+            op['account_name'] = build_account_name(
+                params['account'], params['domain'], params['device'], params['application'])
+            result.update(client.run(op))
+
+    except (WallixAPIError, SessionAuthError, CircuitOpenError, DeadlineExceeded) as e:
+        result.update(failed=True, msg=str(e))
+    except SharedCacheError as e:
+        result.update(failed=True, msg=f"Shared cache unavailable: {str(e)}")
+    except Exception as e:
+        result.update(failed=True, msg=f"Request failed: {str(e)}")
+
+    if client is not None:
+        result['timings'] = client.api.timings()
+    return result
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""Session-cookie authentication for the WALLIX Bastion REST API.
+
+Instead of sending Basic credentials with every call, the client logs in
+once with ``POST /api`` (like the ``wallix-auth`` role does), keeps the
+``wab_session_id`` cookie until it expires and only logs in again when the
+Bastion answers 401.
+
+Without a shared cache the session lasts as long as the process, that is
+the calls of one task or batch; with one, later tasks reuse it too. A
+``session_ttl`` of 0 makes :class:`wallix_api.WallixAPI` send Basic
+credentials with every call instead.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import threading
+import time
+
+SESSION_COOKIE = "wab_session_id"
+
+# Session tokens known to this process, keyed by (base_url, identity, verify).
+_AUTHENTICATORS = {}
+_AUTHENTICATORS_LOCK = threading.Lock()
+
+
+class SessionAuthError(Exception):
+    pass
+
+
+def credentials_identity(api_key=None, username=None, password=None):
+    """Return an opaque digest identifying the credentials in use."""
+    if api_key:
+        material = f"api_key:{api_key}"
+    else:
+        material = f"user:{username}:{password}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SessionAuth:
+    """Log in once with Basic auth and replay the session cookie."""
+
+    def __init__(self, base_url, username, password, verify=True,
+                 session_ttl=3600, shared_cache=None):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.verify = verify
+        self.session_ttl = session_ttl
+        self.shared_cache = shared_cache
+        self._cache_key = ["session", self.base_url,
+                           credentials_identity(None, username, password)]
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def login(self, http, timeout=None):
+        """Open a new API session and return ``(cookie, ttl)``."""
+        response = http.post(f"{self.base_url}/api", auth=(self.username, self.password),
+                             verify=self.verify, timeout=timeout)
+        if response.status_code not in (200, 204):
+            raise SessionAuthError(
+                f"Authentication failed {response.status_code}: {response.text}")
+        ttl = self.session_ttl
+        for cookie in response.cookies:
+            if cookie.name == SESSION_COOKIE:
+                # The cookie jar turns Max-Age into an absolute expiry too.
+                if cookie.expires:
+                    ttl = min(ttl, int(cookie.expires - time.time()))
+                return cookie.value, ttl
+        raise SessionAuthError(
+            f"Authentication succeeded but no {SESSION_COOKIE} cookie was returned.")
+
+    def token(self, http, timeout=None):
+        """Return a valid session cookie, logging in only when needed."""
+        with self._lock:
+            if self._token and self._expires_at > time.time():
+                return self._token
+
+            def login():
+                token, ttl = self.login(http, timeout)
+                return dict(token=token, expires_at=time.time() + ttl), ttl
+
+            if self.shared_cache is not None:
+                # The entry carries the cookie expiry, not a fresh session_ttl.
+                session = self.shared_cache.get_or_compute(self._cache_key, login)
+            else:
+                session = login()[0]
+            self._token, self._expires_at = session['token'], session['expires_at']
+            return self._token
+
+    def invalidate(self, token):
+        """Forget ``token`` after the Bastion rejected it."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0
+                if self.shared_cache is not None:
+                    self.shared_cache.delete(self._cache_key)
+
+    def request(self, http, method, url, **kwargs):
+        """Send a request with the session cookie, re-authenticating once on 401."""
+        headers = dict(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("verify", self.verify)
+        for attempt in range(2):
+            token = self.token(http, kwargs.get("timeout"))
+            headers["Cookie"] = f"{SESSION_COOKIE}={token}"
+            response = http.request(method, url, headers=headers, **kwargs)
+            if response.status_code != 401 or attempt:
+                return response
+            self.invalidate(token)
+        return response
+
+
+def get_session_auth(base_url, username, password, verify=True,
+                     session_ttl=3600, shared_cache=None):
+    """Return the process-wide authenticator for these credentials."""
+    key = (base_url.rstrip("/"), credentials_identity(None, username, password), verify)
+    with _AUTHENTICATORS_LOCK:
+        auth = _AUTHENTICATORS.get(key)
+        if auth is None:
+            auth = SessionAuth(base_url, username, password, verify,
+                               session_ttl, shared_cache)
+            _AUTHENTICATORS[key] = auth
+        elif shared_cache is not None and auth.shared_cache is None:
+            auth.shared_cache = shared_cache
+    return auth
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""Controller-local secret cache shared between Ansible forks.
+
+Entries live in one file per key inside a memory-backed directory
+(``/dev/shm`` when available). Each file is encrypted with a key derived
+from the Bastion credentials, so only a process holding the same
+credentials can read it back. A per-key ``flock`` gives single-flight
+semantics: the first fork missing an entry computes it while the other
+forks wait and then read the stored result.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import base64
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+_SALT_FILE = ".salt"
+_KDF_INFO = b"wallix.pam shared cache v1"
+
+
+def default_cache_dir():
+    """Return the per-user cache directory, preferring shared memory."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"wallix-pam-{os.getuid()}")
+
+
+class SharedCacheError(Exception):
+    pass
+
+
+def ensure_private_dir(path):
+    """Create ``path`` with mode 0700 and check nobody else can access it."""
+    try:
+        os.makedirs(path, mode=0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise SharedCacheError(
+            f"Refusing to use cache directory {path}: it must be owned "
+            "by the current user and not accessible to others.")
+
+
+class SharedCache:
+    """Encrypted, flock-coordinated cache of JSON values with per-entry TTL."""
+
+    def __init__(self, secret, cache_dir=None, lock_timeout=60):
+        if not HAS_CRYPTOGRAPHY:
+            raise SharedCacheError(
+                "The 'cryptography' Python library is required for the shared cache.")
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.lock_timeout = lock_timeout
+        ensure_private_dir(self.cache_dir)
+        self._fernet = Fernet(self._derive_key(secret))
+
+    def _read_salt(self):
+        path = os.path.join(self.cache_dir, _SALT_FILE)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(32))
+        # Another fork may still be writing the salt it just created.
+        deadline = time.time() + 5
+        while True:
+            with open(path, "rb") as f:
+                salt = f.read()
+            if len(salt) == 32 or time.time() > deadline:
+                return salt
+            time.sleep(0.01)
+
+    def _derive_key(self, secret):
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32,
+                    salt=self._read_salt(), info=_KDF_INFO)
+        return base64.urlsafe_b64encode(hkdf.derive(secret.encode("utf-8")))
+
+    def _path(self, key, suffix):
+        digest = hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + suffix)
+
+    def get(self, key):
+        """Return the cached value for ``key``, or ``None`` if missing or expired."""
+        path = self._path(key, ".entry")
+        try:
+            with open(path, "rb") as f:
+                token = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            entry = json.loads(self._fernet.decrypt(token))
+        except (InvalidToken, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            self.delete(key)
+            return None
+        return entry.get("value")
+
+    def set(self, key, value, ttl):
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+        if ttl <= 0:
+            return
+        token = self._fernet.encrypt(json.dumps(
+            {"value": value, "expires_at": time.time() + ttl}).encode("utf-8"))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            os.replace(tmp_path, self._path(key, ".entry"))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key, ".entry"))
+        except OSError:
+            pass
+
+    def _lock(self, key):
+        fd = os.open(self._path(key, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if time.time() > deadline:
+                os.close(fd)
+                raise SharedCacheError(
+                    f"Timed out after {self.lock_timeout}s waiting for another "
+                    "process to fill the shared cache.")
+            time.sleep(0.05)
+
+    def get_or_compute(self, key, compute):
+        """Return the value for ``key``, calling ``compute`` in one process only.
+
+        ``compute`` must return a ``(value, ttl)`` tuple. Processes that miss
+        the entry while another one is computing it block on the key lock and
+        then return the value that process stored.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        fd = self._lock(key)
+        try:
+            value = self.get(key)
+            if value is not None:
+                return value
+            value, ttl = compute()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def update(self, key, mutate):
+        """Atomically replace the value for ``key`` with ``mutate(value)``.
+
+        ``mutate`` receives the current value (or ``None``) and returns a
+        ``(value, ttl)`` tuple; a ``None`` value removes the entry.
+        """
+        fd = self._lock(key)
+        try:
+            value, ttl = mutate(self.get(key))
+            if value is None:
+                self.delete(key)
+            else:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""Shared client for the WALLIX Bastion REST API.
+
+Every plugin and module of the collection talks to the Bastion through
+:class:`WallixAPI`, which owns the pooled keep-alive session, API key,
+session-cookie or Basic authentication, retries with circuit breaking, pagination,
+concurrent bulk calls and per-request timing hooks.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from ansible_collections.wallix.pam.plugins.module_utils.resilience import (
+    CircuitBreaker, call_with_retry)
+from ansible_collections.wallix.pam.plugins.module_utils.session_auth import (
+    SESSION_COOKIE, credentials_identity, get_session_auth)
+
+# Disable warnings for self-signed certificates if necessary
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Connection, authentication and resilience options shared by every module.
+API_ARGUMENT_SPEC = dict(
+    wallix_url=dict(type='str', required=True),
+    api_key=dict(type='str', required=False, no_log=True),
+    username=dict(type='str', required=False),
+    password=dict(type='str', required=False, no_log=True),
+    session_cookie=dict(type='str', required=False, no_log=True),
+    validate_certs=dict(type='bool', required=False, default=True),
+    session_ttl=dict(type='int', required=False, default=3600),
+    connect_timeout=dict(type='float', required=False, default=10),
+    timeout=dict(type='float', required=False, default=30),
+    retries=dict(type='int', required=False, default=3),
+    retry_backoff=dict(type='float', required=False, default=0.5),
+    deadline=dict(type='float', required=False),
+    circuit_breaker_threshold=dict(type='int', required=False, default=5),
+    circuit_breaker_reset=dict(type='float', required=False, default=30),
+)
+API_REQUIRED_ONE_OF = [['api_key', 'username', 'session_cookie']]
+
+# Methods replayed after a connection error, a timeout or a 5xx by default.
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+# Upper bounds in seconds of the latency histogram buckets kept per endpoint.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Path segments kept in endpoint templates where an object id is expected.
+ENDPOINT_ACTIONS = ('checkout', 'checkin', 'extendcheckout')
+
+# Keep-alive sessions shared by every caller in this process,
+# keyed by (base_url, auth identity, validate_certs).
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# A forked worker must not reuse sockets opened by its parent.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_SESSIONS.clear)
+
+
+class WallixAPIError(Exception):
+    def __init__(self, message, status=None, body=None):
+        super(WallixAPIError, self).__init__(message)
+        self.status = status
+        self.body = body
+
+
+def get_pooled_session(base_url, identity, verify, pool_maxsize=10):
+    """Return the pooled session for this Bastion and identity, creating it once."""
+    key = (base_url, identity, verify)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = verify
+            _SESSIONS[key] = session
+    return session
+
+
+def split_api_url(url, api_version='api'):
+    """Split a URL into the Bastion URL and the API path.
+
+    ``https://bastion`` and ``https://bastion/api/v3.12`` (the ``base_url`` of
+    the roles) are both accepted.
+    """
+    parts = urlsplit(url.rstrip('/'))
+    path = parts.path.strip('/')
+    if path == 'api' or path.startswith('api/'):
+        return urlunsplit(parts._replace(path='')), path
+    return url.rstrip('/'), api_version.strip('/')
+
+
+def endpoint_template(path):
+    """Return ``path`` with its object ids and names replaced by ``{id}``.
+
+    ``devices/42/localdomains/7/accounts`` gives
+    ``devices/{id}/localdomains/{id}/accounts``.
+    """
+    segments = path.split('?')[0].strip('/').split('/')
+    return '/'.join(
+        segment if (segment.isidentifier() and segment.islower()
+                    and (index % 2 == 0 or segment in ENDPOINT_ACTIONS)) else '{id}'
+        for index, segment in enumerate(segments))
+
+
+def run_bulk(func, items, max_workers=10):
+    """Call ``func`` on every item concurrently.
+
+    Returns ``(result, error)`` pairs in the order of ``items``; exactly one
+    of the two is None for each item.
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    items = list(items)
+    if not items:
+        return []
+    if max_workers <= 1 or len(items) == 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(call, items))
+
+
+class WallixAPI:
+    """Authenticated, pooled and instrumented access to one Bastion."""
+
+    def __init__(self, base_url, api_key=None, username=None, password=None, verify=True,
+                 session_ttl=3600, shared_cache=None, retry_options=None, pool_maxsize=10,
+                 api_version='api', session_cookie=None):
+        if not (api_key or session_cookie or (username and password)):
+            raise WallixAPIError(
+                "Either api_key, session_cookie or username/password must be provided")
+        self.base_url, api_version = split_api_url(base_url, api_version)
+        self.api_url = f"{self.base_url}/{api_version}"
+        if session_cookie and not api_key:
+            # A cookie opened elsewhere (wallix-auth role) is used as is.
+            if not session_cookie.startswith(f"{SESSION_COOKIE}="):
+                session_cookie = f"{SESSION_COOKIE}={session_cookie}"
+            self.identity = hashlib.sha256(
+                f"cookie:{session_cookie}".encode("utf-8")).hexdigest()
+        else:
+            self.identity = credentials_identity(api_key, username, password)
+        self.verify = verify
+        self.http = get_pooled_session(self.base_url, self.identity, verify, pool_maxsize)
+        self.headers = {"Content-Type": "application/json"}
+        self.session_auth = None
+        self.basic_auth = None
+        if api_key:
+            self.headers["X-Auth-Token"] = api_key
+        elif session_cookie:
+            self.headers["Cookie"] = session_cookie
+        elif session_ttl > 0:
+            # One login serves every call of the task; with a shared cache,
+            # later tasks and forks reuse the session too.
+            self.session_auth = get_session_auth(self.base_url, username, password, verify,
+                                                 session_ttl, shared_cache)
+        else:
+            # Explicitly requested with session_ttl=0.
+            self.basic_auth = (username, password)
+        self.retry_options = retry_options or {}
+        self._hooks = []
+        self._timings = {}
+        self._timings_lock = threading.Lock()
+
+    def url(self, path):
+        """Return the absolute URL of an API path such as ``devices/{id}``."""
+        return f"{self.api_url}/{path.lstrip('/')}"
+
+    def add_hook(self, hook):
+        """Call ``hook(method, path, status, seconds)`` after every request.
+
+        ``status`` is None when the request raised.
+        """
+        self._hooks.append(hook)
+
+    def _record(self, method, path, status, elapsed, size=0):
+        # Aggregate by endpoint ("GET devices/{id}"), not by object.
+        endpoint = f"{method} {endpoint_template(path)}"
+        outcome = 'error' if status is None else str(status)
+        with self._timings_lock:
+            entry = self._timings.setdefault(endpoint, dict(
+                count=0, seconds=0.0, bytes=0, statuses={},
+                buckets=[0] * (len(LATENCY_BUCKETS) + 1)))
+            entry['count'] += 1
+            entry['seconds'] += elapsed
+            entry['bytes'] += size
+            entry['statuses'][outcome] = entry['statuses'].get(outcome, 0) + 1
+            entry['buckets'][sum(1 for bound in LATENCY_BUCKETS if elapsed > bound)] += 1
+        for hook in self._hooks:
+            hook(method, path, status, elapsed)
+
+    def timings(self):
+        """Return request counts and cumulated seconds, per endpoint and in total.
+
+        Each endpoint also gets its bytes sent and received, its counts by
+        status and the counts of requests in each bucket of
+        ``LATENCY_BUCKETS`` (the last one counts slower requests).
+        """
+        with self._timings_lock:
+            endpoints = dict((name, dict(entry, seconds=round(entry['seconds'], 3),
+                                         statuses=dict(entry['statuses']),
+                                         buckets=list(entry['buckets'])))
+                             for name, entry in self._timings.items())
+        return dict(
+            requests=sum(entry['count'] for entry in endpoints.values()),
+            seconds=round(sum(entry['seconds'] for entry in endpoints.values()), 3),
+            endpoints=endpoints)
+
+    def request(self, method, path, params=None, json=None, headers=None, retry=None):
+        """Send a request and return the raw response.
+
+        Only GET and HEAD are retried unless ``retry`` says otherwise.
+        """
+        method = method.upper()
+        url = self.url(path)
+        all_headers = dict(self.headers, **(headers or {}))
+        retry_options = self.retry_options
+        if not (method in IDEMPOTENT_METHODS if retry is None else retry):
+            retry_options = dict(retry_options, retries=0)
+
+        def send(timeout):
+            kwargs = dict(params=params, json=json, headers=all_headers, timeout=timeout)
+            if self.session_auth is not None:
+                return self.session_auth.request(self.http, method, url, **kwargs)
+            return self.http.request(method, url, auth=self.basic_auth, **kwargs)
+
+        status, size = None, 0
+        start = time.monotonic()
+        try:
+            response = call_with_retry(send, **retry_options)
+            status = response.status_code
+            size = len(response.request.body or b'') + len(response.content or b'')
+        finally:
+            self._record(method, path, status, time.monotonic() - start, size)
+        return response
+
+    def call(self, method, path, params=None, json=None, headers=None, retry=None,
+             expected=(200, 201, 204)):
+        """Send a request and return its decoded JSON body (None when empty).
+
+        Raises WallixAPIError for any status not in ``expected``.
+        """
+        response = self.request(method, path, params, json, headers, retry)
+        if response.status_code not in expected:
+            raise WallixAPIError(f"API Error {response.status_code}: {response.text}",
+                                 response.status_code, response.text)
+        if not response.content:
+            return None
+        return response.json()
+
+    def get(self, path, params=None, **kwargs):
+        return self.call('GET', path, params=params, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.call('POST', path, json=json, **kwargs)
+
+    def put(self, path, json=None, **kwargs):
+        return self.call('PUT', path, json=json, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.call('DELETE', path, **kwargs)
+
+    def paginate(self, path, params=None, fields=None, page_size=500):
+        """Yield every item of a list endpoint, ``page_size`` items per request.
+
+        ``fields`` restricts the attributes returned by the Bastion.
+        """
+        params = dict(params or {})
+        if fields:
+            params['fields'] = ','.join(fields)
+        offset = 0
+        while True:
+            page = self.get(path, dict(params, limit=page_size, offset=offset)) or []
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+            offset += len(page)
+
+    def get_all(self, path, params=None, fields=None, page_size=500):
+        return list(self.paginate(path, params, fields, page_size))
+
+    def bulk(self, func, items, max_workers=10):
+        """Run ``func(item)`` concurrently over the pooled session (see run_bulk)."""
+        return run_bulk(func, items, max_workers)
+
+
+def api_deadline(params):
+    """Return the ``deadline`` parameter, or WALLIX_API_DEADLINE, as a float.
+
+    Raises WallixAPIError when the value is not a UNIX timestamp.
+    """
+    deadline = params['deadline'] or os.environ.get('WALLIX_API_DEADLINE')
+    if not deadline:
+        return None
+    try:
+        return float(deadline)
+    except (TypeError, ValueError):
+        raise WallixAPIError(
+            f"Invalid deadline {deadline!r} (deadline or WALLIX_API_DEADLINE): "
+            "expected an absolute UNIX timestamp such as 1767225600.")
+
+
+def create_api(params, shared_cache=None, pool_maxsize=10):
+    """Build a WallixAPI from module parameters following API_ARGUMENT_SPEC."""
+    # Keep the /api/vX.Y path of wallix_url so the requested API version is used.
+    base_url, api_version = split_api_url(params['wallix_url'])
+    retry_options = dict(
+        timeout=(params['connect_timeout'], params['timeout']),
+        retries=params['retries'],
+        backoff=params['retry_backoff'],
+        deadline=api_deadline(params),
+        breaker=CircuitBreaker(base_url, params['circuit_breaker_threshold'],
+                               params['circuit_breaker_reset']))
+    return WallixAPI(base_url, params['api_key'], params['username'], params['password'],
+                     params['validate_certs'], params['session_ttl'], shared_cache,
+                     retry_options, pool_maxsize, api_version,
+                     session_cookie=params['session_cookie'])
@@ -0,0 +1,389 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.applied_state import AppliedState
+from ansible_collections.wallix.pam.plugins.module_utils.reconcile import (
+    apply_delta, compute_delta, fetch_endpoints, merge_results, planned_result,
+    record_applied, summarize)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, WallixAPIError, create_api)
+
+DOCUMENTATION = r'''
+---
+module: authorizations
+short_description: Reconcile the target groups and authorizations of a WALLIX Bastion in bulk
+version_added: "1.1.0"
+description:
+  - Reads C(/targetgroups) and C(/authorizations) once, at the same time,
+    and pushes only the objects that differ from the desired state,
+    concurrently.
+  - Each object is compared through a fingerprint of its desired attributes;
+    objects whose fingerprint matches the Bastion cause no API call, so an
+    unchanged inventory converges with two reads and no write.
+  - Target groups are created and updated before the authorizations that
+    reference them, and deleted after them.
+  - With I(state_dir), the objects applied are recorded locally and later
+    runs skip those still desired as applied, without reading them, as long
+    as the pages of the Bastion answer 304 to a conditional request.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  target_groups:
+    description:
+      - Desired target groups, in the format of the C(wallix_target_groups)
+        variable of the C(wallix-authorizations) role.
+      - Each item takes C(group_name) (or C(name)), C(description),
+        C(session), C(password_retrieval), C(restrictions) and C(state)
+        (C(present) or C(absent)).
+      - Attributes left out of an item are not compared with the Bastion.
+    required: false
+    type: list
+    elements: dict
+    default: []
+  authorizations:
+    description:
+      - Desired authorizations, in the format of the C(wallix_authorizations)
+        variable of the C(wallix-authorizations) role.
+      - Each item takes C(name) (or C(authorization_name)), C(description),
+        C(user_group), C(target_group), C(subprotocols) (or a single
+        C(subprotocol)), C(is_critical), C(is_recorded),
+        C(approval_required), C(authorize_sessions),
+        C(authorize_password_retrieval), C(authorize_session_sharing),
+        C(approvers), C(active_quorum), C(inactive_quorum),
+        C(approval_timeout) and C(state).
+      - Attributes left out of an item are not compared with the Bastion,
+        so they keep the value they have there. A new authorization is
+        recorded and authorizes sessions and password retrieval unless
+        given otherwise.
+    required: false
+    type: list
+    elements: dict
+    default: []
+  purge_target_groups:
+    description: Delete the target groups of the Bastion that are not in I(target_groups).
+    required: false
+    type: bool
+    default: false
+  purge_authorizations:
+    description: Delete the authorizations of the Bastion that are not in I(authorizations).
+    required: false
+    type: bool
+    default: false
+  max_workers:
+    description: Maximum number of API calls sent concurrently to apply the delta.
+    required: false
+    type: int
+    default: 10
+  state_dir:
+    description:
+      - Directory of the applied state, one file per Bastion and endpoint
+        holding the fingerprint and id of each target group and
+        authorization last applied and the validators (C(ETag),
+        C(Last-Modified)) of the pages last read.
+      - When the pages are unchanged since, only the objects whose desired
+        attributes changed are read and compared. A run that writes leaves
+        the pages to be read in full by the next one.
+      - Not updated in check mode.
+    required: false
+    type: path
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Converge the target groups and authorizations of the role in one task
+  wallix.pam.authorizations:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    validate_certs: "{{ wallix_auth.connection.verify_ssl }}"
+    target_groups: "{{ wallix_target_groups }}"
+    authorizations: "{{ wallix_authorizations }}"
+    max_workers: 20
+  register: authorizations_result
+
+- name: Grant SSH access to the Linux servers
+  wallix.pam.authorizations:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    target_groups:
+      - group_name: "Linux_Servers"
+        description: "Linux servers"
+    authorizations:
+      - name: "Linux_Admins_SSH"
+        user_group: "Linux_Admins"
+        target_group: "Linux_Servers"
+        subprotocol: "SSH_SHELL_SESSION"
+'''
+
+RETURN = r'''
+target_groups:
+  description:
+    - Outcome for target groups, with the C(created), C(updated), C(deleted)
+      and C(unchanged) names, the number of unchanged target groups skipped
+      from the applied state (C(from_state)), the per-attribute C(changes),
+      the C(durations) in seconds of each API call, the C(failures) by name
+      and the C(total) number of target groups before the run.
+  type: dict
+  returned: always
+authorizations:
+  description: Outcome for authorizations, with the same keys as I(target_groups).
+  type: dict
+  returned: always
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+# Attributes compared with the Bastion and sent on creation.
+TARGET_GROUP_FIELDS = ['group_name', 'description', 'session', 'password_retrieval',
+                       'restrictions']
+AUTHORIZATION_FIELDS = ['authorization_name', 'description', 'user_group', 'target_group',
+                        'subprotocols', 'is_critical', 'is_recorded', 'approval_required',
+                        'authorize_sessions', 'authorize_password_retrieval',
+                        'authorize_session_sharing', 'approvers', 'active_quorum',
+                        'inactive_quorum', 'approval_timeout']
+
+
+def _optional_bool(item, key):
+    return None if item.get(key) is None else bool(item[key])
+
+
+def desired_target_groups(items):
+    """Turn the module (or role) target group items into API payloads.
+
+    Attributes not given are left out of the diff.
+    """
+    groups = []
+    for item in items:
+        name = item.get('group_name') or item.get('name')
+        if not name:
+            raise WallixAPIError(f"Target group without a name: {item}")
+        group = dict(group_name=name, state=item.get('state', 'present'))
+        if group['state'] == 'present':
+            for field in ('description', 'session', 'password_retrieval', 'restrictions'):
+                if item.get(field) is not None:
+                    group[field] = item[field]
+        groups.append(group)
+    return groups
+
+
+def desired_authorizations(items):
+    """Turn the module (or role) authorization items into API payloads.
+
+    Attributes not given stay None and are left out of the diff.
+    """
+    authorizations = []
+    for item in items:
+        name = item.get('authorization_name') or item.get('name')
+        if not name:
+            raise WallixAPIError(f"Authorization without a name: {item}")
+        authorization = dict(authorization_name=name, state=item.get('state', 'present'))
+        if authorization['state'] == 'present':
+            subprotocols = item.get('subprotocols')
+            if subprotocols is None and item.get('subprotocol'):
+                subprotocols = [item['subprotocol']]
+            authorization.update(
+                description=item.get('description'),
+                user_group=item.get('user_group'),
+                target_group=item.get('target_group'),
+                subprotocols=None if subprotocols is None else list(subprotocols),
+                is_critical=_optional_bool(item, 'is_critical'),
+                is_recorded=_optional_bool(item, 'is_recorded'),
+                approval_required=_optional_bool(item, 'approval_required'),
+                authorize_sessions=_optional_bool(item, 'authorize_sessions'),
+                authorize_password_retrieval=_optional_bool(item, 'authorize_password_retrieval'),
+                authorize_session_sharing=_optional_bool(item, 'authorize_session_sharing'))
+            # Approval settings are only managed when given.
+            for field in ('approvers', 'active_quorum', 'inactive_quorum', 'approval_timeout'):
+                if item.get(field) is not None:
+                    authorization[field] = item[field]
+        authorizations.append(authorization)
+    return authorizations
+
+
+def authorization_defaults(payload):
+    """Return the attributes a new authorization gets when the item leaves them out."""
+    return dict(description='', target_group='', subprotocols=[], is_critical=False,
+                is_recorded=True, approval_required=False, authorize_sessions=True,
+                authorize_password_retrieval=True, authorize_session_sharing=False)
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        target_groups=dict(type='list', elements='dict', required=False, default=[]),
+        authorizations=dict(type='list', elements='dict', required=False, default=[]),
+        purge_target_groups=dict(type='bool', required=False, default=False),
+        purge_authorizations=dict(type='bool', required=False, default=False),
+        max_workers=dict(type='int', required=False, default=10),
+        state_dir=dict(type='path', required=False),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+    max_workers = params['max_workers']
+
+    result = dict(changed=False, target_groups={}, authorizations={})
+    try:
+        api = create_api(params, pool_maxsize=max(10, max_workers))
+        groups = desired_target_groups(params['target_groups'])
+        authorizations = desired_authorizations(params['authorizations'])
+
+        state = AppliedState(params['state_dir'], api.base_url) if params['state_dir'] else None
+
+        # One snapshot of each endpoint, both read at once.
+        endpoints = []
+        if groups or params['purge_target_groups']:
+            endpoints.append(('targetgroups', 'group_name', TARGET_GROUP_FIELDS, groups,
+                              params['purge_target_groups']))
+        if authorizations or params['purge_authorizations']:
+            endpoints.append(('authorizations', 'authorization_name', AUTHORIZATION_FIELDS,
+                              authorizations, params['purge_authorizations']))
+        snapshots = fetch_endpoints(api, endpoints, state, max_workers)
+        current_groups, groups, skipped_groups = snapshots.get(
+            'targetgroups', ({}, groups, []))
+        current_authorizations, authorizations, skipped_authorizations = snapshots.get(
+            'authorizations', ({}, authorizations, []))
+
+        group_delta = compute_delta(groups, current_groups, 'group_name', TARGET_GROUP_FIELDS,
+                                    params['purge_target_groups'])
+        authorization_delta = compute_delta(authorizations, current_authorizations,
+                                            'authorization_name', AUTHORIZATION_FIELDS,
+                                            params['purge_authorizations'],
+                                            authorization_defaults)
+
+        if module.check_mode:
+            group_result = planned_result(group_delta, 'group_name')
+            authorization_result = planned_result(authorization_delta, 'authorization_name')
+        else:
+            # Target groups must exist before the authorizations that
+            # reference them, and outlive them until those are deleted.
+            group_result = apply_delta(api, 'targetgroups', dict(group_delta, delete=[]),
+                                       'group_name', max_workers=max_workers)
+            authorization_result = apply_delta(api, 'authorizations', authorization_delta,
+                                               'authorization_name', max_workers=max_workers)
+            group_result = merge_results(group_result, apply_delta(
+                api, 'targetgroups', dict(group_delta, create=[], update=[]),
+                'group_name', max_workers=max_workers))
+    except Exception as e:
+        module.fail_json(msg=f"Authorization reconciliation failed: {str(e)}", **result)
+
+    for section, path, outcome, delta, current, key, desired, fields, skipped in (
+            ('target_groups', 'targetgroups', group_result, group_delta, current_groups,
+             'group_name', groups, TARGET_GROUP_FIELDS, skipped_groups),
+            ('authorizations', 'authorizations', authorization_result, authorization_delta,
+             current_authorizations, 'authorization_name', authorizations,
+             AUTHORIZATION_FIELDS, skipped_authorizations)):
+        used = any(endpoint[0] == path for endpoint in endpoints)
+        record = state.endpoint(path) if state and used else None
+        outcome = summarize(outcome, delta, current, key, skipped, record)
+        if record is not None and not module.check_mode:
+            record_applied(record, desired, outcome, key, fields)
+        outcome['failures'] = outcome.pop('failed')
+        result[section] = outcome
+    if state and not module.check_mode:
+        state.save()
+    result['changed'] = (result['target_groups']['changed']
+                         or result['authorizations']['changed'])
+    result['timings'] = api.timings()
+
+    failures = [f"{name}: {error}" for section in ('target_groups', 'authorizations')
+                for name, error in result[section]['failures'].items()]
+    if failures:
+        module.fail_json(msg=f"{len(failures)} target group and authorization changes failed: "
+                         + "; ".join(failures), **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.backup import (
+    COMPRESSIONS, MANIFEST, write_backup)
+from ansible_collections.wallix.pam.plugins.module_utils.resources import RESOURCE_TYPES
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, create_api)
+
+DOCUMENTATION = r'''
+---
+module: backup
+short_description: Back WALLIX Bastion objects up to compressed NDJSON files
+version_added: "1.1.0"
+description:
+  - Reads the objects of the selected types in parallel, page by page, and
+    streams them to one compressed NDJSON file per type in I(dest), one
+    JSON line holding the C(name) and the C(object) per object. Objects are
+    never held in memory as a whole nor returned to the controller.
+  - Writes a C(manifest.json) holding the SHA-256 of every object and the
+    file holding it.
+  - With I(base_backup), the backup is incremental. Only the objects that
+    are new or changed since that backup are written. The manifest still
+    lists every object, pointing unchanged ones to the file of the earlier
+    backup that holds them, and lists the objects deleted since.
+  - In check mode, objects are read and compared but nothing is written.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  types:
+    description:
+      - Object types to back up.
+      - C(local_accounts) are named C(account@domain@device) and
+        C(global_accounts) C(account@domain).
+    required: true
+    type: list
+    elements: str
+    choices: [authorizations, target_groups, user_groups, users, local_accounts,
+              global_accounts, devices, global_domains, domains, timeframes,
+              connection_policies]
+  dest:
+    description: Directory receiving the backup files, created if needed.
+    required: true
+    type: path
+  compression:
+    description:
+      - Compression of the backup files.
+      - C(zstd) requires the C(zstandard) Python library.
+    required: false
+    type: str
+    choices: [gzip, zstd, none]
+    default: gzip
+  compression_level:
+    description: Compression level, by default 6 for gzip and 3 for zstd.
+    required: false
+    type: int
+  base_backup:
+    description:
+      - Manifest, or directory, of a previous backup of the same Bastion to
+        take an incremental backup from. It must not be I(dest).
+      - When it does not exist yet, a full backup is taken.
+    required: false
+    type: path
+  metadata:
+    description: Free-form information stored in the manifest.
+    required: false
+    type: dict
+    default: {}
+  page_size:
+    description: Number of objects read per request.
+    required: false
+    type: int
+    default: 500
+  max_workers:
+    description: Maximum number of API calls sent concurrently.
+    required: false
+    type: int
+    default: 10
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Full backup
+  wallix.pam.backup:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    types: [authorizations, target_groups, user_groups, users, devices, local_accounts]
+    dest: /var/backups/wallix/full
+  delegate_to: localhost
+
+- name: Nightly incremental backup against the full one
+  wallix.pam.backup:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    types: [authorizations, target_groups, user_groups, users, devices, local_accounts]
+    dest: "/var/backups/wallix/{{ ansible_date_time.date }}"
+    base_backup: /var/backups/wallix/full
+    compression: zstd
+  delegate_to: localhost
+'''
+
+RETURN = r'''
+manifest:
+  description: Path of the manifest of the backup.
+  type: str
+  returned: always
+mode:
+  description: C(full), or C(incremental) when a base backup was used.
+  type: str
+  returned: always
+backups:
+  description:
+    - Per type, the C(file) written, the C(count) of objects on the Bastion,
+      how many were C(written) and C(unchanged), and the names of the
+      objects C(deleted) since the base backup.
+  type: dict
+  returned: always
+  sample:
+    devices:
+      file: devices.ndjson.gz
+      count: 1200
+      written: 14
+      unchanged: 1186
+      deleted: [web-99]
+bytes:
+  description: Size in bytes of the files written.
+  type: int
+  returned: always
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        types=dict(type='list', elements='str', required=True, choices=sorted(RESOURCE_TYPES)),
+        dest=dict(type='path', required=True),
+        compression=dict(type='str', required=False, default='gzip', choices=sorted(COMPRESSIONS)),
+        compression_level=dict(type='int', required=False),
+        base_backup=dict(type='path', required=False),
+        metadata=dict(type='dict', required=False, default={}),
+        page_size=dict(type='int', required=False, default=500),
+        max_workers=dict(type='int', required=False, default=10),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+    dest = os.path.abspath(params['dest'])
+
+    base = params['base_backup']
+    if base and not os.path.exists(base):
+        module.warn(f"Base backup {base} not found, taking a full backup")
+        base = None
+
+    result = dict(changed=False, manifest=os.path.join(dest, MANIFEST), backups={}, bytes=0)
+    try:
+        api = create_api(params, pool_maxsize=max(10, params['max_workers']))
+        manifest = write_backup(api, params['types'], None if module.check_mode else dest,
+                                params['compression'], params['compression_level'], base,
+                                params['metadata'], params['max_workers'], params['page_size'])
+    except Exception as e:
+        module.fail_json(msg=f"Backup failed: {str(e)}", **result)
+
+    result['mode'] = manifest['mode']
+    for resource_type, backup in manifest['types'].items():
+        result['backups'][resource_type] = dict(
+            file=backup['file'], count=backup['count'], written=backup['written'],
+            unchanged=backup['count'] - backup['written'], deleted=backup['deleted'])
+        if not module.check_mode:
+            result['bytes'] += os.path.getsize(os.path.join(dest, backup['file']))
+    result['changed'] = not module.check_mode
+    result['timings'] = api.timings()
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
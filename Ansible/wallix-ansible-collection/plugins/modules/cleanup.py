@@ -0,0 +1,252 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.cleanup import run_cleanup
+from ansible_collections.wallix.pam.plugins.module_utils.resources import RESOURCE_TYPES
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, create_api)
+
+DOCUMENTATION = r'''
+---
+module: cleanup
+short_description: Delete WALLIX Bastion objects in dependency order, concurrently
+version_added: "1.1.0"
+description:
+  - Discovers the objects of the selected types, and of the types that may
+    refer to them, then deletes the objects matching the patterns level by
+    level, each level concurrently.
+  - Authorizations are deleted before the target and user groups they use,
+    target groups before the accounts and devices they contain, accounts
+    before their device or domain, and so on.
+  - An object still referred to by an object that is kept, or whose
+    deletion failed, is reported in C(blocked) and not deleted.
+  - In check mode, nothing is deleted and C(deleted) lists what would be.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  types:
+    description:
+      - Object types to clean up.
+      - C(local_accounts) are named C(account@domain@device) and matched on
+        their device name; C(global_accounts) are named C(account@domain) and
+        matched on their account name.
+    required: true
+    type: list
+    elements: str
+    choices: [authorizations, target_groups, user_groups, users, local_accounts,
+              global_accounts, devices, global_domains, domains, timeframes,
+              connection_policies]
+  include:
+    description:
+      - Shell-style patterns (C(*), C(?), C([seq])) of the object names to delete.
+      - Nothing is deleted when empty.
+    required: false
+    type: list
+    elements: str
+    default: []
+  exclude:
+    description: Shell-style patterns of the object names never to delete.
+    required: false
+    type: list
+    elements: str
+    default: []
+  max_deletions:
+    description:
+      - Fail before deleting anything when more objects match. C(0) means no limit.
+      - Only warns in check mode.
+    required: false
+    type: int
+    default: 0
+  max_workers:
+    description: Maximum number of API calls sent concurrently.
+    required: false
+    type: int
+    default: 10
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Show what tearing down the demo tenant would delete
+  wallix.pam.cleanup:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    types: [authorizations, target_groups, user_groups, users, devices, timeframes]
+    include: ["demo*", "Demo_*", "TG_Demo*", "AUTH_Demo*"]
+    exclude: ["admin*", "root*"]
+  check_mode: true
+  register: cleanup_plan
+
+- name: Tear it down
+  wallix.pam.cleanup:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    types: [authorizations, target_groups, user_groups, users, devices, timeframes]
+    include: ["demo*", "Demo_*", "TG_Demo*", "AUTH_Demo*"]
+    max_workers: 20
+'''
+
+RETURN = r'''
+deleted:
+  description: Names of the objects deleted (or that would be, in check mode), by type.
+  type: dict
+  returned: always
+blocked:
+  description: Objects not deleted, by type, with the C(type:name) of the objects still referring to them.
+  type: dict
+  returned: always
+failed:
+  description: Error message per object whose deletion failed, by type.
+  type: dict
+  returned: always
+referrers:
+  description:
+    - C(type:name) of the objects found referring to each selected object, by its C(type:name).
+    - Lets the C(wallix.pam.cleanup_conflicts) filter explain deletions the Bastion refused with a 409.
+  type: dict
+  returned: always
+summary:
+  description: Number of objects C(discovered), C(selected), C(deleted), C(blocked) and C(failed), by type.
+  type: dict
+  returned: always
+levels:
+  description: Types deleted at each level, with the number of objects deleted and the seconds taken.
+  type: list
+  elements: dict
+  returned: always
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        types=dict(type='list', elements='str', required=True, choices=sorted(RESOURCE_TYPES)),
+        include=dict(type='list', elements='str', required=False, default=[]),
+        exclude=dict(type='list', elements='str', required=False, default=[]),
+        max_deletions=dict(type='int', required=False, default=0),
+        max_workers=dict(type='int', required=False, default=10),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+
+    result = dict(changed=False, deleted={}, blocked={}, failed={}, referrers={}, summary={},
+                  levels=[])
+    try:
+        api = create_api(params, pool_maxsize=max(10, params['max_workers']))
+        result.update(run_cleanup(api, params['types'], params['include'], params['exclude'],
+                                  params['max_workers'], module.check_mode,
+                                  params['max_deletions']))
+    except Exception as e:
+        module.fail_json(msg=f"Cleanup failed: {str(e)}", **result)
+
+    selected = sum(entry['selected'] for entry in result['summary'].values())
+    if params['max_deletions'] and selected > params['max_deletions']:
+        module.warn(f"{selected} objects match the cleanup patterns, more than the "
+                    f"{params['max_deletions']} allowed in one run")
+    result['changed'] = any(result['deleted'].values())
+    result['timings'] = api.timings()
+    failures = [f"{resource_type} {name}: {error}"
+                for resource_type, errors in result['failed'].items()
+                for name, error in errors.items()]
+    if failures:
+        module.fail_json(msg=f"{len(failures)} deletions failed: " + "; ".join(failures),
+                         **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.applied_state import AppliedState
+from ansible_collections.wallix.pam.plugins.module_utils.reconcile import reconcile
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, WallixAPIError, create_api)
+
+DOCUMENTATION = r'''
+---
+module: devices
+short_description: Reconcile the devices of a WALLIX Bastion in bulk
+version_added: "1.1.0"
+description:
+  - Fetches the current devices once, computes the creations, updates and
+    deletions needed to reach the desired list and applies only that delta,
+    concurrently.
+  - Devices already matching the desired attributes cause no API call.
+  - With I(state_dir), the devices applied are recorded locally and later
+    runs skip those still desired as applied, without reading them, as long
+    as the pages of the Bastion devices answer 304 to a conditional request.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  devices:
+    description:
+      - Desired devices. Each item takes C(name) (or C(device_name)), C(host),
+        C(alias) (defaults to the name on creation), C(description) and
+        C(state) (C(present) or C(absent), defaults to C(present)).
+      - Attributes left out of an item are not compared with the Bastion,
+        so they keep the value they have there.
+      - Other keys, such as the C(type) used by the C(wallix-devices) role
+        variables, are ignored.
+    required: true
+    type: list
+    elements: dict
+  purge:
+    description: Delete the devices of the Bastion that are not in I(devices).
+    required: false
+    type: bool
+    default: false
+  max_workers:
+    description: Maximum number of API calls sent concurrently to apply the delta.
+    required: false
+    type: int
+    default: 10
+  state_dir:
+    description:
+      - Directory of the applied state, one file per Bastion and endpoint
+        holding the fingerprint and id of each device last applied and the
+        validators (C(ETag), C(Last-Modified)) of the device pages last
+        read.
+      - When the pages are unchanged since, only the devices whose desired
+        attributes changed are read and compared. A run that writes leaves
+        the pages to be read in full by the next one.
+      - Not updated in check mode.
+    required: false
+    type: path
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Converge the devices of the wallix-devices role in one task
+  wallix.pam.devices:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    validate_certs: "{{ wallix_auth.connection.verify_ssl }}"
+    devices: "{{ wallix_devices }}"
+    state_dir: "{{ playbook_dir }}/.wallix-state"
+  register: devices_result
+
+- name: Make the Bastion hold exactly this inventory
+  wallix.pam.devices:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    devices:
+      - name: "web-server-01"
+        host: "10.0.1.100"
+        description: "Production web server"
+      - name: "old-server"
+        state: absent
+    purge: true
+    max_workers: 20
+'''
+
+RETURN = r'''
+created:
+  description: Names of the devices created.
+  type: list
+  elements: str
+  returned: always
+updated:
+  description: Names of the devices updated.
+  type: list
+  elements: str
+  returned: always
+deleted:
+  description: Names of the devices deleted.
+  type: list
+  elements: str
+  returned: always
+unchanged:
+  description: Names of the desired devices that already matched.
+  type: list
+  elements: str
+  returned: always
+from_state:
+  description: Number of the I(unchanged) devices skipped from the applied state, without any API call.
+  type: int
+  returned: always
+changes:
+  description: Attributes changed per updated device, as C(before) and C(after) values.
+  type: dict
+  returned: always
+durations:
+  description: Seconds taken by the API call of each device created, updated or deleted.
+  type: dict
+  returned: always
+failed_devices:
+  description: Error message per device whose change failed.
+  type: dict
+  returned: always
+total:
+  description: Number of devices on the Bastion before the run.
+  type: int
+  returned: always
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+# Attributes compared with the Bastion and sent on creation.
+DEVICE_FIELDS = ['device_name', 'host', 'alias', 'description']
+
+
+def desired_devices(items):
+    """Turn the module (or role) device items into API payloads."""
+    devices = []
+    for item in items:
+        name = item.get('device_name') or item.get('name')
+        if not name:
+            raise WallixAPIError(f"Device without a name: {item}")
+        device = dict(device_name=name, state=item.get('state', 'present'))
+        if device['state'] == 'present':
+            # Attributes not given stay None and are left out of the diff.
+            device.update(
+                host=item.get('host'),
+                alias=item.get('alias'),
+                description=item.get('description'))
+        devices.append(device)
+    return devices
+
+
+def device_defaults(payload):
+    """Return the attributes a new device gets when the item leaves them out."""
+    return dict(alias=payload['device_name'])
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        devices=dict(type='list', elements='dict', required=True),
+        purge=dict(type='bool', required=False, default=False),
+        max_workers=dict(type='int', required=False, default=10),
+        state_dir=dict(type='path', required=False),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+
+    result = dict(changed=False, created=[], updated=[], deleted=[], unchanged=[],
+                  changes={}, failed_devices={})
+    try:
+        api = create_api(module.params, pool_maxsize=max(10, module.params['max_workers']))
+        state = None
+        if module.params['state_dir']:
+            state = AppliedState(module.params['state_dir'], api.base_url)
+        outcome = reconcile(api, 'devices', desired_devices(module.params['devices']),
+                            'device_name', DEVICE_FIELDS, module.params['purge'],
+                            module.params['max_workers'], module.check_mode,
+                            record=state.endpoint('devices') if state else None,
+                            create_defaults=device_defaults)
+        if state and not module.check_mode:
+            state.save()
+    except Exception as e:
+        module.fail_json(msg=f"Device reconciliation failed: {str(e)}", **result)
+
+    result['failed_devices'] = outcome.pop('failed')
+    result.update(outcome)
+    result['timings'] = api.timings()
+    if result['failed_devices']:
+        module.fail_json(
+            msg=f"{len(result['failed_devices'])} device changes failed: "
+            + "; ".join(f"{name}: {error}" for name, error in result['failed_devices'].items()),
+            **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    RESOURCE_TYPES, discover_all, index_instances)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, WallixAPIError, create_api)
+
+DOCUMENTATION = r'''
+---
+module: resources_info
+short_description: Take a compact snapshot of the objects of a WALLIX Bastion
+version_added: "1.1.0"
+description:
+  - Reads the objects of several types in parallel, a page at a time, and
+    only the fields asked for.
+  - Returns, per type, each object once indexed by id, and an index of the
+    ids by name.
+  - Local accounts are read through the C(/accounts) endpoint in one
+    paginated listing when the Bastion has it; otherwise the local domains
+    and accounts of all devices are read concurrently.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  types:
+    description:
+      - Object types to read.
+      - C(local_accounts) are named C(account@domain@device) and
+        C(global_accounts) C(account@domain).
+    required: true
+    type: list
+    elements: str
+    choices: [authorizations, target_groups, user_groups, users, local_accounts,
+              global_accounts, devices, global_domains, domains, timeframes,
+              connection_policies]
+  fields:
+    description:
+      - Fields to read per type, on top of the id and the name.
+      - Types not listed get the fields giving their references to other
+        objects (the user group and target group of an authorization, the
+        accounts of a target group...).
+    required: false
+    type: dict
+    default: {}
+  all_fields:
+    description: Read whole objects instead, for instance to back them up.
+    required: false
+    type: bool
+    default: false
+  page_size:
+    description: Number of objects read per request.
+    required: false
+    type: int
+    default: 500
+  max_workers:
+    description: Maximum number of API calls sent concurrently.
+    required: false
+    type: int
+    default: 10
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Snapshot what cleanup and reporting need
+  wallix.pam.resources_info:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    types: [authorizations, target_groups, user_groups, devices, users]
+    fields:
+      devices: [host, description]
+  register: snapshot
+
+- name: Look a device up by name
+  debug:
+    msg: "{{ snapshot.resources.devices.by_id[snapshot.resources.devices.by_name['web-01']] }}"
+'''
+
+RETURN = r'''
+resources:
+  description:
+    - Snapshot per type, with the C(count) of objects, the objects C(by_id)
+      and their ids C(by_name).
+    - C(local_accounts) also map each device name to the ids of its
+      accounts in C(by_device).
+  type: dict
+  returned: always
+  sample:
+    devices:
+      count: 1
+      by_id:
+        "42": {"id": "42", "device_name": "web-01", "services": []}
+      by_name:
+        web-01: "42"
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        types=dict(type='list', elements='str', required=True, choices=sorted(RESOURCE_TYPES)),
+        fields=dict(type='dict', required=False, default={}),
+        all_fields=dict(type='bool', required=False, default=False),
+        page_size=dict(type='int', required=False, default=500),
+        max_workers=dict(type='int', required=False, default=10),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+
+    result = dict(changed=False, resources={})
+    try:
+        unknown = set(params['fields']) - set(RESOURCE_TYPES)
+        if unknown:
+            raise WallixAPIError(f"Unknown object types in fields: {', '.join(sorted(unknown))}")
+        api = create_api(params, pool_maxsize=max(10, params['max_workers']))
+        snapshots = discover_all(api, params['types'], params['max_workers'], params['fields'],
+                                 not params['all_fields'], params['page_size'])
+    except Exception as e:
+        module.fail_json(msg=f"Discovery failed: {str(e)}", **result)
+
+    result['resources'] = dict((resource_type, index_instances(instances, resource_type))
+                               for resource_type, instances in snapshots.items())
+    result['timings'] = api.timings()
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.resources import RESOURCE_TYPES
+from ansible_collections.wallix.pam.plugins.module_utils.restore import run_restore
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, create_api)
+
+DOCUMENTATION = r'''
+---
+module: restore
+short_description: Recreate WALLIX Bastion objects from a wallix.pam.backup backup
+version_added: "1.1.0"
+description:
+  - Replays a backup written by M(wallix.pam.backup), full or incremental,
+    onto a Bastion.
+  - Types are created level by level in dependency order. Domains and
+    timeframes come first, then devices and groups, then accounts and
+    users, then target groups, then authorizations. The objects of a level
+    are created concurrently.
+  - Objects are read from the backup files in chunks, and only when their
+    content still has the hash recorded in the manifest.
+  - Objects that already exist (the Bastion answers 409) are left as they
+    are, or updated with I(existing=update).
+  - With I(verify), the restored types are read back and every object is
+    compared with its backup, on the attributes the restore sends. Ids and
+    attributes the Bastion sets itself are ignored.
+  - Secrets, such as account credentials and user passwords, are not
+    returned by the API and so are not in backups. Restored accounts and
+    users need them set again.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  src:
+    description: Manifest, or directory, of the backup to restore.
+    required: true
+    type: path
+  types:
+    description: Object types to restore, by default every type of the backup.
+    required: false
+    type: list
+    elements: str
+    choices: [authorizations, target_groups, user_groups, users, local_accounts,
+              global_accounts, devices, global_domains, domains, timeframes,
+              connection_policies]
+  existing:
+    description: What to do with objects that already exist on the Bastion.
+    required: false
+    type: str
+    choices: [skip, update]
+    default: skip
+  verify:
+    description: Read the restored objects back and compare them with the backup.
+    required: false
+    type: bool
+    default: true
+  max_workers:
+    description: Maximum number of API calls sent concurrently.
+    required: false
+    type: int
+    default: 10
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Rebuild the lab from last night's backup
+  wallix.pam.restore:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    src: /var/backups/wallix/latest
+    max_workers: 20
+  delegate_to: localhost
+
+- name: Put back the authorizations and target groups only, overwriting changes
+  wallix.pam.restore:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    src: /var/backups/wallix/2024-05-01/manifest.json
+    types: [target_groups, authorizations]
+    existing: update
+  delegate_to: localhost
+'''
+
+RETURN = r'''
+summary:
+  description:
+    - Per type, the number of objects C(backed_up) and how many were
+      C(created), found C(existing), C(updated) or C(failed).
+    - In check mode, every object is counted as C(created).
+  type: dict
+  returned: always
+failed:
+  description: Error message per object that could not be restored, by type.
+  type: dict
+  returned: always
+corrupted:
+  description: Names of the objects not restored because their content no longer matches the manifest, by type.
+  type: dict
+  returned: always
+levels:
+  description: Types restored at each level, with the number of objects replayed and the seconds taken.
+  type: list
+  elements: dict
+  returned: always
+verification:
+  description:
+    - Number of objects C(verified) per type. C(mismatched) lists, by type,
+      the objects whose content differs from the backup and C(missing)
+      those not found. C(seconds) is the time the check took.
+  type: dict
+  returned: when verify is true and not in check mode
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        src=dict(type='path', required=True),
+        types=dict(type='list', elements='str', required=False, choices=sorted(RESOURCE_TYPES)),
+        existing=dict(type='str', required=False, default='skip', choices=['skip', 'update']),
+        verify=dict(type='bool', required=False, default=True),
+        max_workers=dict(type='int', required=False, default=10),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+
+    result = dict(changed=False, summary={}, failed={}, corrupted={}, levels=[])
+    try:
+        api = create_api(params, pool_maxsize=max(10, params['max_workers']))
+        result.update(run_restore(api, params['src'], params['types'], params['existing'],
+                                  params['verify'], params['max_workers'], module.check_mode))
+    except Exception as e:
+        module.fail_json(msg=f"Restore failed: {str(e)}", **result)
+
+    result['changed'] = any(entry['created'] or entry['updated']
+                            for entry in result['summary'].values())
+    result['timings'] = api.timings()
+    verification = result.get('verification', {})
+    mismatched = sum(len(names) for names in verification.get('mismatched', {}).values())
+    if mismatched:
+        module.warn(f"{mismatched} restored objects differ from the backup")
+    if result['corrupted']:
+        module.warn(f"{sum(len(names) for names in result['corrupted'].values())} objects "
+                    "were not restored: their content no longer matches the manifest")
+    failures = [f"{resource_type} {name}: {error}"
+                for resource_type, errors in result['failed'].items()
+                for name, error in errors.items()]
+    if failures:
+        module.fail_json(msg=f"{len(failures)} objects could not be restored: "
+                         + "; ".join(failures), **result)
+    missing = sum(len(names) for names in verification.get('missing', {}).values())
+    if missing:
+        module.fail_json(msg=f"{missing} objects of the backup are missing after the restore",
+                         **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import (absolute_import, division, print_function)
-import urllib3
-import requests
 __metaclass__ = type
 
 import os
-import json
-import traceback
 
 # OpenShift arbitrary UID fix
 if 'HOME' not in os.environ:
@@ -33,7 +29,8 @@ except ImportError:
     pass
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.urls import fetch_url
+from ansible_collections.wallix.pam.plugins.module_utils.secret_client import (
+    ARGUMENT_SPEC, MUTUALLY_EXCLUSIVE, REQUIRED_ONE_OF, execute)
 
 DOCUMENTATION = r'''
 ---
@@ -57,19 +54,134 @@ options:
     required: false
     type: str
   password:
-    description: Password for Basic Auth.
+    description:
+      - Password of I(username).
+      - The credentials are sent once to open an API session whose cookie is
+        used by every call of the task. With I(shared_cache) or
+        I(lease_registry), later tasks reuse it too until it expires or the
+        Bastion rejects it.
     required: false
     type: str
     no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+      - Used instead of I(username) and I(password) when I(api_key) is not set.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
   validate_certs:
     description: Whether to validate SSL certificates.
     required: false
     type: bool
     default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description:
+      - Number of times a checkout is retried after a connection error, a timeout or a 5xx response.
+      - Retries wait a random delay bounded by an exponential backoff. Checkin and extend are never retried.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description:
+      - Consecutive failures after which calls to this Bastion fail immediately,
+        for every task running on the same host. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
   account:
-    description: Name of the account.
-    required: true
+    description:
+      - Name of the account.
+      - Required unless I(accounts) is used or I(state=checkin_all).
+    required: false
     type: str
+  accounts:
+    description:
+      - List of accounts to process in a single module run, concurrently.
+      - Items accept the same I(domain), I(state), I(authorization),
+        I(key_format), I(cert_format), I(duration), I(force) and I(comment)
+        options as the module; unset values default to the top-level ones.
+      - Mutually exclusive with I(account). Results are returned in I(accounts),
+        keyed by account name.
+    required: false
+    type: list
+    elements: dict
+    suboptions:
+      account:
+        description: Name of the account.
+        required: true
+        type: str
+      domain:
+        description: Domain of the account.
+        type: str
+      device:
+        description: Name of the device.
+        type: str
+      application:
+        description: Name of the application.
+        type: str
+      state:
+        description: The action to perform for this account.
+        choices: [ checkout, checkin, extend ]
+        type: str
+      authorization:
+        description: The name of the authorization.
+        type: str
+      key_format:
+        description: The format of the SSH private key returned.
+        type: str
+      cert_format:
+        description: The format of the returned certificate.
+        type: str
+      duration:
+        description: Optional duration for the checkout (in seconds).
+        type: int
+      force:
+        description: Force the checkin.
+        type: bool
+      comment:
+        description: Comment for forced checkin.
+        type: str
+  max_workers:
+    description: Maximum number of I(accounts) processed concurrently.
+    required: false
+    type: int
+    default: 10
   domain:
     description: Domain of the account.
     required: false
@@ -105,10 +217,13 @@ options:
     type: str
     no_log: true
   state:
-    description: The action to perform (checkout, checkin, extend).
+    description:
+      - The action to perform (checkout, checkin, extend).
+      - C(checkin_all) checks in, concurrently, every lease recorded in the
+        lease registry for this Bastion and identity (see I(lease_registry)).
     required: false
     default: checkout
-    choices: [ checkout, checkin, extend ]
+    choices: [ checkout, checkin, extend, checkin_all ]
     type: str
   force:
     description: Force the checkin (only for state=checkin).
@@ -119,6 +234,71 @@ options:
     description: Comment for forced checkin (required if force=true).
     required: false
     type: str
+  shared_cache:
+    description:
+      - Share checkout results between tasks and forks running on the same
+        host through an encrypted, memory-backed cache (only for state=checkout).
+      - When several forks check out the same account at once, only one of
+        them calls the API while the others wait for its result.
+      - Requires the C(cryptography) Python library.
+    required: false
+    type: bool
+    default: false
+  shared_cache_dir:
+    description:
+      - Directory holding the shared cache files.
+      - Defaults to a private per-user directory under C(/dev/shm), or the
+        system temporary directory when C(/dev/shm) is not available.
+    required: false
+    type: path
+  cache_ttl:
+    description:
+      - Maximum lifetime of a shared cache entry, in seconds.
+      - The effective lifetime never exceeds the checkout duration returned by the Bastion.
+    required: false
+    type: int
+    default: 300
+  lease_registry:
+    description:
+      - Record every checkout in a local, encrypted lease registry shared by
+        all tasks of the controller (stored in I(shared_cache_dir)).
+      - A checkout of an account whose lease is still held returns the held
+        secret without calling the API. I(state=extend) only calls the API
+        when the lease expires within I(extend_threshold) seconds, and
+        I(state=checkin) skips accounts that were not checked out through the
+        registry unless I(force=true).
+      - Requires the C(cryptography) Python library.
+    required: false
+    type: bool
+    default: false
+  extend_threshold:
+    description:
+      - With I(lease_registry), remaining lease time in seconds below which a
+        held lease is extended (on checkout or extend).
+    required: false
+    type: int
+    default: 300
+  renew_leases:
+    description:
+      - Start a background process on the controller that extends every lease
+        used by the playbook run when it expires within I(extend_threshold)
+        seconds, and checks them in once the run has ended, except those a
+        concurrent run still uses.
+      - Implies I(lease_registry). One renewer runs per Bastion, identity and
+        playbook run.
+      - The renewer is only started when the task runs on the controller
+        (C(connection: local) or C(delegate_to: localhost)) through the action
+        plugin. On any other target the module warns and only acts as
+        I(lease_registry): checkouts are recorded in the registry of that
+        target, where nothing extends or checks them in.
+    required: false
+    type: bool
+    default: false
+  renew_interval:
+    description: Seconds between two passes of the background renewer over the registry.
+    required: false
+    type: int
+    default: 60
 author:
   - Wallix Integration Team
 '''
@@ -154,6 +334,62 @@ EXAMPLES = r'''
     state: extend
   register: extend_result
 
+- name: Checkout a credential shared by every host only once
+  wallix.pam.secret:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    account: "deploy"
+    domain: "local"
+    device: "jump-01"
+    shared_cache: true
+  delegate_to: localhost
+  register: deploy_secret
+
+- name: Rotate many accounts in one task
+  wallix.pam.secret:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    state: checkin
+    accounts:
+      - account: "root"
+        device: "web-01"
+      - account: "root"
+        device: "web-02"
+      - account: "postgres"
+        domain: "local"
+        device: "db-01"
+        state: extend
+    max_workers: 20
+  register: batch
+
+- name: Reuse the lease held since an earlier task, extending it if needed
+  wallix.pam.secret:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    account: "admin"
+    domain: "local"
+    device: "prod-db-01"
+    lease_registry: true
+  register: db_secret
+
+- name: Keep the lease alive for the rest of the play and check it in at the end
+  wallix.pam.secret:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    account: "admin"
+    domain: "local"
+    device: "prod-db-01"
+    renew_leases: true
+  delegate_to: localhost
+  register: db_secret
+
+- name: Check in every lease taken during the play
+  wallix.pam.secret:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    lease_registry: true
+    state: checkin_all
+
 - name: Release the secret (checkin)
   wallix.pam.secret:
     wallix_url: "https://bastion.example.com"
@@ -168,165 +404,60 @@ RETURN = r'''
 password:
   description: The retrieved password or SSH key (only for checkout).
   type: str
-  returned: when state is checkout
+  returned: when state is checkout and account is used
 metadata:
   description: Full response from the API.
   type: dict
-  returned: always
+  returned: when account is used
+cached:
+  description: Whether the checkout was served from the shared cache.
+  type: bool
+  returned: when state is checkout
+lease:
+  description:
+    - The registry lease of the account (C(account), C(expires_at),
+      C(remaining) seconds, whether an existing lease was C(reused), and the
+      C(renew_error) of the last failed background extension, if any).
+    - C(null) when the lease was checked in or is not held.
+  type: dict
+  returned: when lease_registry or renew_leases is used
+accounts:
+  description:
+    - Per-account results keyed by account name, each with the same keys as
+      a single-account run (C(changed), C(password), C(login), C(metadata), ...).
+    - Failed items contain C(failed) and C(msg).
+  type: dict
+  returned: when accounts is used or state is checkin_all
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: when the Bastion was reached
 '''
 
 
-# Disable warnings for self-signed certificates if necessary
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-
 def run_module():
-    module_args = dict(
-        wallix_url=dict(type='str', required=True),
-        api_key=dict(type='str', required=False, no_log=True),
-        username=dict(type='str', required=False),
-        password=dict(type='str', required=False, no_log=True),
-        account=dict(type='str', required=True),
-        domain=dict(type='str', required=False, default=""),
-        device=dict(type='str', required=False),
-        application=dict(type='str', required=False),
-        key_format=dict(type='str', required=False),
-        cert_format=dict(type='str', required=False),
-        authorization=dict(type='str', required=False),
-        duration=dict(type='int', required=False),
-        key_passphrase=dict(type='str', required=False, no_log=True),
-        state=dict(type='str', required=False, default='checkout',
-                   choices=['checkout', 'checkin', 'extend']),
-        force=dict(type='bool', required=False, default=False),
-        comment=dict(type='str', required=False),
-        validate_certs=dict(type='bool', required=False, default=True)
-    )
-
-    result = dict(
-        changed=False,
-        password='',
-        metadata={}
-    )
-
     module = AnsibleModule(
-        argument_spec=module_args,
+        argument_spec=ARGUMENT_SPEC,
         supports_check_mode=True,
-        required_one_of=[['api_key', 'username']]
+        required_one_of=REQUIRED_ONE_OF,
+        mutually_exclusive=MUTUALLY_EXCLUSIVE
     )
 
     if module.check_mode:
-        module.exit_json(**result)
-
-    # Construct account_name
-    account = module.params['account']
-    domain = module.params['domain']
-    device = module.params['device']
-    application = module.params['application']
-
-    if device:
-        if domain:
-            account_name = f"{account}@{domain}@{device}"
-        else:
-            account_name = f"{account}@{device}"
-    elif application:
-        if domain:
-            account_name = f"{account}@{domain}@{application}"
-        else:
-            account_name = f"{account}@{application}"
-    elif domain:
-        account_name = f"{account}@{domain}"
-    else:
-        account_name = account
-
-    base_url = module.params['wallix_url'].rstrip('/')
-    state = module.params['state']
-    api_key = module.params['api_key']
-    username = module.params['username']
-    password = module.params['password']
-
-    headers = {
-        "Content-Type": "application/json"
-    }
-
-    auth = None
-    if api_key:
-        headers["X-Auth-Token"] = api_key
-    elif username and password:
-        auth = (username, password)
-    else:
-        module.fail_json(
-            msg="Either api_key or username/password must be provided", **result)
-
-    # DEBUG: Print headers to fail_json for debugging (remove later)
-    # module.fail_json(msg=f"DEBUG HEADERS: {headers}", **result)
-
-    try:
-        if state == 'checkout':
-            url = f"{base_url}/api/targetpasswords/checkout/{account_name}"
-            params = {}
-            if module.params['key_format']:
-                params['key_format'] = module.params['key_format']
-            if module.params['cert_format']:
-                params['cert_format'] = module.params['cert_format']
-            if module.params['authorization']:
-                params['authorization'] = module.params['authorization']
-            if module.params['duration']:
-                params['duration'] = module.params['duration']
-
-            if module.params['key_passphrase']:
-                headers['X-Key-Passphrase'] = module.params['key_passphrase']
-
-            response = requests.get(
-                url, params=params, headers=headers, auth=auth, verify=module.params['validate_certs'])
-
-        elif state == 'extend':
-            url = f"{base_url}/api/targetpasswords/extendcheckout/{account_name}"
-            params = {}
-            if module.params['authorization']:
-                params['authorization'] = module.params['authorization']
-
-            response = requests.get(
-                url, params=params, headers=headers, auth=auth, verify=module.params['validate_certs'])
-
-        elif state == 'checkin':
-            url = f"{base_url}/api/targetpasswords/checkin/{account_name}"
-            params = {}
-            if module.params['authorization']:
-                params['authorization'] = module.params['authorization']
-            if module.params['force']:
-                params['force'] = 'true'
-                if not module.params['comment']:
-                    module.fail_json(
-                        msg="Comment is required when force is true", **result)
-                params['comment'] = module.params['comment']
-
-            response = requests.get(
-                url, params=params, headers=headers, auth=auth, verify=module.params['validate_certs'])
-
-        # Handle Response
-        if response.status_code == 200:
-            data = response.json()
-            result['metadata'] = data
-            # Assuming any successful API call is a change or access
-            result['changed'] = True
-
-            if state == 'checkout':
-                if 'login' in data:
-                    result['login'] = data['login']
-                if 'password' in data:
-                    result['password'] = data['password']
-                elif 'ssh_key' in data:
-                    result['password'] = data['ssh_key']
-                    result['ssh_key'] = data['ssh_key']
-                elif 'key' in data:
-                    result['password'] = data['key']
-        else:
-            module.fail_json(
-                msg=f"API Error {response.status_code}: {response.text}", **result)
-
-    except Exception as e:
-        module.fail_json(msg=f"Request failed: {str(e)}", **result)
-
+        if module.params['accounts'] or module.params['state'] == 'checkin_all':
+            module.exit_json(changed=False, accounts={})
+        module.exit_json(changed=False, password='', metadata={})
+
+    if module.params['renew_leases']:
+        module.warn("renew_leases only starts the lease renewer when the task runs on the "
+                    "controller; leases checked out on this host are recorded in its "
+                    "registry but neither extended nor checked in")
+    result = execute(module.params)
+    if result.get('failed'):
+        module.fail_json(**result)
     module.exit_json(**result)
 
 
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.session_auth import (
+    SESSION_COOKIE, SessionAuth, credentials_identity)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    SharedCache, SharedCacheError)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, create_api, get_pooled_session, split_api_url)
+
+DOCUMENTATION = r'''
+---
+module: session
+short_description: Open or reuse a WALLIX Bastion API session
+version_added: "1.1.0"
+description:
+  - Returns a session cookie for I(username), logging in with C(POST /api)
+    only when no valid session is known.
+  - With I(cache), the cookie and its expiry are kept in an encrypted cache
+    on the host running the task (run it with C(delegate_to: localhost) to
+    keep it on the controller). Later plays and playbook runs with the same
+    credentials reuse it after one cheap C(GET /api/version) check, and log
+    in again only when the Bastion rejects it.
+  - With I(state=absent), the session is closed and dropped from the cache.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  username:
+    description: Username for the API session.
+    required: true
+    type: str
+  password:
+    description: Password of I(username).
+    required: true
+    type: str
+    no_log: true
+  state:
+    description: Whether the session should be open (C(present)) or closed (C(absent)).
+    required: false
+    type: str
+    choices: [present, absent]
+    default: present
+  session_ttl:
+    description:
+      - Maximum time in seconds a session cookie is reused, bounded by the
+        expiry the Bastion sets on the cookie.
+    required: false
+    type: int
+    default: 3600
+  renewal_threshold:
+    description: Remaining lifetime in seconds below which a cached session is replaced by a new one.
+    required: false
+    type: int
+    default: 300
+  validate:
+    description: Check a cached session with C(GET /api/version) before returning it.
+    required: false
+    type: bool
+    default: true
+  cache:
+    description:
+      - Keep the session in the encrypted cache shared by every task, fork
+        and run using the same credentials.
+      - Requires the C(cryptography) Python library.
+    required: false
+    type: bool
+    default: true
+  cache_dir:
+    description:
+      - Directory holding the cache files.
+      - Defaults to a private per-user directory under C(/dev/shm), or the
+        system temporary directory when C(/dev/shm) is not available.
+    required: false
+    type: path
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times the validation is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Open or reuse the API session of the wallix-auth role
+  wallix.pam.session:
+    wallix_url: "{{ wallix_api.base_url }}"
+    username: "{{ wallix_auth.credentials.username }}"
+    password: "{{ wallix_auth.credentials.password }}"
+    validate_certs: "{{ wallix_auth.connection.verify_ssl }}"
+  delegate_to: localhost
+  register: wallix_session
+
+- name: Use it
+  uri:
+    url: "{{ wallix_api.base_url }}/devices"
+    headers:
+      Cookie: "{{ wallix_session.session_cookie }}"
+
+- name: Close the session and forget it
+  wallix.pam.session:
+    wallix_url: "{{ wallix_api.base_url }}"
+    username: "{{ wallix_auth.credentials.username }}"
+    password: "{{ wallix_auth.credentials.password }}"
+    state: absent
+  delegate_to: localhost
+'''
+
+RETURN = r'''
+session_cookie:
+  description: Cookie header value of the session, C(wab_session_id=...).
+  type: str
+  returned: when state is present
+session_id:
+  description: Value of the C(wab_session_id) cookie.
+  type: str
+  returned: when state is present
+expires_at:
+  description: UNIX timestamp after which the session is no longer reused.
+  type: float
+  returned: when state is present
+reused:
+  description: Whether a cached session was returned instead of logging in.
+  type: bool
+  returned: when state is present
+'''
+
+# Cache entries are {token, expires_at}, keyed per Bastion and credentials.
+CACHE_KEY = 'api_session'
+
+
+def session_is_valid(params, token):
+    """Return whether the Bastion still accepts the session ``token``."""
+    api = create_api(dict(params, api_key=None, session_cookie=token, deadline=None,
+                          circuit_breaker_threshold=0, circuit_breaker_reset=0))
+    status = api.request('GET', 'version').status_code
+    return status not in (401, 403)
+
+
+def login(params, base_url):
+    """Open a new session and return the cache entry and its time to live."""
+    auth = SessionAuth(base_url, params['username'], params['password'],
+                       params['validate_certs'], params['session_ttl'])
+    http = get_pooled_session(base_url, credentials_identity(
+        None, params['username'], params['password']), params['validate_certs'])
+    token, ttl = auth.login(http, timeout=(params['connect_timeout'], params['timeout']))
+    return dict(token=token, expires_at=time.time() + ttl), ttl
+
+
+def logout(params, base_url, token):
+    http = get_pooled_session(base_url, credentials_identity(
+        None, params['username'], params['password']), params['validate_certs'])
+    http.post(f"{base_url}/api/logout", headers=dict(Cookie=f"{SESSION_COOKIE}={token}"),
+              verify=params['validate_certs'],
+              timeout=(params['connect_timeout'], params['timeout']))
+
+
+def run_module():
+    argument_spec = dict(
+        dict((name, API_ARGUMENT_SPEC[name]) for name in (
+            'wallix_url', 'validate_certs', 'session_ttl', 'connect_timeout', 'timeout',
+            'retries', 'retry_backoff')),
+        username=dict(type='str', required=True),
+        password=dict(type='str', required=True, no_log=True),
+        state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+        renewal_threshold=dict(type='int', required=False, default=300),
+        validate=dict(type='bool', required=False, default=True),
+        cache=dict(type='bool', required=False, default=True),
+        cache_dir=dict(type='path', required=False),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+    params = module.params
+    base_url = split_api_url(params['wallix_url'])[0]
+    key = [CACHE_KEY, base_url, credentials_identity(None, params['username'], params['password'])]
+
+    result = dict(changed=False)
+    try:
+        store = None
+        if params['cache']:
+            store = SharedCache(f"{params['username']}:{params['password']}",
+                                cache_dir=params['cache_dir'])
+        entry = store.get(key) if store is not None else None
+
+        if params['state'] == 'absent':
+            if store is not None:
+                store.delete(key)
+            if entry:
+                if not module.check_mode:
+                    # The session is forgotten even if the Bastion cannot close it.
+                    try:
+                        logout(params, base_url, entry['token'])
+                    except Exception as e:
+                        module.warn(f"Logout failed: {str(e)}")
+                result['changed'] = True
+            module.exit_json(**result)
+
+        reused = bool(entry and entry['expires_at'] - params['renewal_threshold'] > time.time()
+                      and (not params['validate'] or session_is_valid(params, entry['token'])))
+        if not reused:
+            rejected = entry['token'] if entry else None
+
+            # Forks that find the session rejected at once log in only once.
+            def renew(current):
+                if (current and current['token'] != rejected
+                        and current['expires_at'] - params['renewal_threshold'] > time.time()):
+                    return current, current['expires_at'] - time.time()
+                return login(params, base_url)
+
+            entry = store.update(key, renew) if store is not None else login(params, base_url)[0]
+    except SharedCacheError as e:
+        module.fail_json(msg=f"Session cache unavailable: {str(e)}", **result)
+    except Exception as e:
+        module.fail_json(msg=f"Session setup failed: {str(e)}", **result)
+
+    result.update(
+        session_cookie=f"{SESSION_COOKIE}={entry['token']}",
+        session_id=entry['token'],
+        expires_at=round(entry['expires_at'], 3),
+        reused=reused)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
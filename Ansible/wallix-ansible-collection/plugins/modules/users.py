@@ -0,0 +1,418 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.wallix.pam.plugins.module_utils.applied_state import AppliedState
+from ansible_collections.wallix.pam.plugins.module_utils.reconcile import (
+    apply_delta, compute_delta, fetch_endpoints, merge_results, planned_result,
+    record_applied, summarize)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, API_REQUIRED_ONE_OF, WallixAPIError, create_api)
+
+DOCUMENTATION = r'''
+---
+module: users
+short_description: Reconcile the users, user groups and memberships of a WALLIX Bastion in bulk
+version_added: "1.1.0"
+description:
+  - Takes the whole user, user group and membership model in one task, diffs
+    it against a single snapshot of C(/users) and C(/usergroups) and pushes
+    only the changes, concurrently.
+  - User groups are created and updated before the users that reference
+    them, and deleted after them.
+  - Passwords and other credentials are only sent when a user is created;
+    they are never read back or compared.
+  - With I(state_dir), the users and groups applied are recorded locally and
+    later runs skip those still desired as applied, without reading them,
+    as long as the pages of the Bastion answer 304 to a conditional request.
+options:
+  wallix_url:
+    description:
+      - URL of the Wallix Bastion.
+      - The API base URL of the roles (C(wallix_api.base_url), ending in
+        C(/api) or C(/api/vX.Y)) is accepted as well.
+    required: true
+    type: str
+  api_key:
+    description: API Key for authentication (X-Auth-Token).
+    required: false
+    type: str
+    no_log: true
+  username:
+    description: Username for the API session.
+    required: false
+    type: str
+  password:
+    description: Password of I(username).
+    required: false
+    type: str
+    no_log: true
+  session_cookie:
+    description:
+      - Session cookie of an API session opened beforehand, for instance the
+        C(wallix_session_cookie) fact set by the C(wallix-auth) role.
+    required: false
+    type: str
+    no_log: true
+  session_ttl:
+    description:
+      - Maximum time in seconds an API session cookie is reused before logging in again.
+      - With I(username), C(0) sends the credentials as Basic auth with every
+        request instead of logging in once.
+    required: false
+    type: int
+    default: 3600
+  validate_certs:
+    description: Whether to validate SSL certificates.
+    required: false
+    type: bool
+    default: true
+  connect_timeout:
+    description: Seconds to wait for a connection to the Bastion.
+    required: false
+    type: float
+    default: 10
+  timeout:
+    description: Seconds to wait for the Bastion to answer a request.
+    required: false
+    type: float
+    default: 30
+  retries:
+    description: Number of times a read is retried after a connection error, a timeout or a 5xx response.
+    required: false
+    type: int
+    default: 3
+  retry_backoff:
+    description: Base delay in seconds of the exponential retry backoff.
+    required: false
+    type: float
+    default: 0.5
+  deadline:
+    description:
+      - Absolute UNIX timestamp after which no further request or retry is attempted.
+      - Falls back to the C(WALLIX_API_DEADLINE) environment variable.
+    required: false
+    type: float
+  circuit_breaker_threshold:
+    description: Consecutive failures after which calls to this Bastion fail immediately. C(0) disables the breaker.
+    required: false
+    type: int
+    default: 5
+  circuit_breaker_reset:
+    description: Seconds the circuit breaker stays open before letting a trial call through.
+    required: false
+    type: float
+    default: 30
+  users:
+    description:
+      - Desired users, in the format of the C(wallix_users) variable of the
+        C(wallix-users) role.
+      - Each item takes C(name), C(display_name), C(email), C(groups),
+        C(profile), C(disabled), C(user_auths), C(force_change_password),
+        C(password), C(credentials) and C(state) (C(present) or C(absent)).
+      - Attributes left out of an item are not compared with the Bastion,
+        so they keep the value they have there. A new user gets its name as
+        C(display_name), no groups, the C(user) profile and
+        C(local_password) authentication unless given.
+    required: false
+    type: list
+    elements: dict
+    default: []
+  user_groups:
+    description:
+      - Desired user groups, in the format of the C(wallix_user_groups)
+        variable of the C(wallix-users) role.
+      - Each item takes C(name), C(description), C(timeframes) (defaults to
+        C([allthetime]) on creation), C(state) and C(members).
+      - Attributes left out of an item are not compared with the Bastion.
+      - C(members) adds the group to the groups of the listed users, whether
+        they are in I(users) or already exist on the Bastion.
+    required: false
+    type: list
+    elements: dict
+    default: []
+  purge_users:
+    description: Delete the users of the Bastion that are not in I(users).
+    required: false
+    type: bool
+    default: false
+  purge_user_groups:
+    description: Delete the user groups of the Bastion that are not in I(user_groups).
+    required: false
+    type: bool
+    default: false
+  max_workers:
+    description: Maximum number of API calls sent concurrently to apply the delta.
+    required: false
+    type: int
+    default: 10
+  state_dir:
+    description:
+      - Directory of the applied state, one file per Bastion and endpoint
+        holding the fingerprint and id of each user and user group last
+        applied and the validators (C(ETag), C(Last-Modified)) of the pages
+        last read.
+      - When the pages are unchanged since, only the users and groups whose
+        desired attributes changed are read and compared. A run that writes
+        leaves the pages to be read in full by the next one.
+      - Users are read in full when a group lists I(members) missing from
+        I(users). Not updated in check mode.
+    required: false
+    type: path
+author:
+  - Wallix Integration Team
+'''
+
+EXAMPLES = r'''
+- name: Converge the users and groups of the wallix-users role in one task
+  wallix.pam.users:
+    wallix_url: "{{ wallix_api.base_url }}"
+    session_cookie: "{{ wallix_session_cookie }}"
+    validate_certs: "{{ wallix_auth.connection.verify_ssl }}"
+    users: "{{ wallix_users }}"
+    user_groups: "{{ wallix_user_groups }}"
+    max_workers: 20
+  register: users_result
+
+- name: Add existing users to a group
+  wallix.pam.users:
+    wallix_url: "https://bastion.example.com"
+    api_key: "my-secret-api-key"
+    user_groups:
+      - name: "dba"
+        description: "Database administrators"
+        members: ["alice", "bob"]
+'''
+
+RETURN = r'''
+users:
+  description:
+    - Outcome for users, with the C(created), C(updated), C(deleted) and
+      C(unchanged) names, the number of unchanged users skipped from the
+      applied state (C(from_state)), the per-attribute C(changes), the
+      C(durations) in seconds of each API call, the C(failures) by name and
+      the C(total) number of users before the run.
+  type: dict
+  returned: always
+user_groups:
+  description: Outcome for user groups, with the same keys as I(users).
+  type: dict
+  returned: always
+timings:
+  description:
+    - Number of API requests and cumulated seconds, in total and per
+      endpoint, with the bytes, status counts and latency histogram of
+      each endpoint.
+  type: dict
+  returned: always
+'''
+
+# Attributes compared with the Bastion. Credentials are only sent on creation.
+GROUP_FIELDS = ['group_name', 'description', 'timeframes']
+USER_FIELDS = ['user_name', 'display_name', 'email', 'groups', 'profile', 'is_disabled',
+               'user_auths']
+
+
+def _optional_bool(item, key):
+    return None if item.get(key) is None else bool(item[key])
+
+
+def _optional_list(item, key):
+    return None if item.get(key) is None else list(item[key])
+
+
+def desired_groups(items):
+    """Turn the module (or role) user group items into API payloads.
+
+    Attributes not given stay None and are left out of the diff.
+    """
+    groups = []
+    for item in items:
+        group = dict(group_name=item['name'], state=item.get('state', 'present'))
+        if group['state'] == 'present':
+            group.update(
+                description=item.get('description'),
+                timeframes=item.get('timeframes') or None)
+        groups.append(group)
+    return groups
+
+
+def group_defaults(payload):
+    """Return the attributes a new user group gets when the item leaves them out."""
+    return dict(timeframes=['allthetime'])
+
+
+def desired_users(items):
+    """Turn the module (or role) user items into API payloads.
+
+    Attributes not given stay None and are left out of the diff.
+    """
+    users = []
+    for item in items:
+        name = item['name']
+        user = dict(user_name=name, state=item.get('state', 'present'))
+        if user['state'] == 'present':
+            credentials = item.get('credentials') or {}
+            user.update(
+                display_name=item.get('display_name'),
+                email=item.get('email'),
+                groups=_optional_list(item, 'groups'),
+                profile=item.get('profile'),
+                is_disabled=_optional_bool(item, 'disabled'),
+                user_auths=item.get('user_auths') or None,
+                force_change_pwd=_optional_bool(item, 'force_change_password'),
+                password=credentials.get('local_password') or item.get('password'),
+                ssh_public_key=credentials.get('local_sshkey') or credentials.get('ssh_public_key'),
+                certificate_dn=credentials.get('local_x509') or credentials.get('certificate_dn'),
+                gpg_public_key=credentials.get('gpg_public_key'))
+        users.append(user)
+    return users
+
+
+def user_defaults(payload):
+    """Return the attributes a new user gets when the item leaves them out."""
+    return dict(display_name=payload['user_name'], email='', groups=[], profile='user',
+                is_disabled=False, user_auths=['local_password'], force_change_pwd=False)
+
+
+def add_memberships(users, group_items, current_users):
+    """Add the ``members`` of each group to the desired groups of those users.
+
+    Members missing from ``users``, or given without ``groups``, keep the
+    groups they have on the Bastion; those missing from ``users`` get an
+    entry that only updates their groups.
+    """
+    by_name = dict((user['user_name'], user) for user in users if user['state'] == 'present')
+    for item in group_items:
+        if item.get('state', 'present') != 'present':
+            continue
+        for member in item.get('members') or []:
+            user = by_name.get(member)
+            if user is None:
+                if member not in current_users:
+                    raise WallixAPIError(f"Unknown member {member} of user group {item['name']}")
+                user = dict(user_name=member, state='present')
+                users.append(user)
+                by_name[member] = user
+            if user.get('groups') is None:
+                current = current_users.get(member) or {}
+                user['groups'] = list(current.get('groups') or [])
+            if item['name'] not in user['groups']:
+                user['groups'].append(item['name'])
+    return users
+
+
+def run_module():
+    argument_spec = dict(
+        API_ARGUMENT_SPEC,
+        users=dict(type='list', elements='dict', required=False, default=[]),
+        user_groups=dict(type='list', elements='dict', required=False, default=[]),
+        purge_users=dict(type='bool', required=False, default=False),
+        purge_user_groups=dict(type='bool', required=False, default=False),
+        max_workers=dict(type='int', required=False, default=10),
+        state_dir=dict(type='path', required=False),
+    )
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True,
+        required_one_of=API_REQUIRED_ONE_OF
+    )
+    params = module.params
+    max_workers = params['max_workers']
+
+    users = desired_users(params['users'])
+    # Keep credentials out of the logged invocation and of the results.
+    for user in users:
+        for field in ('password', 'ssh_public_key', 'certificate_dn', 'gpg_public_key'):
+            if user.get(field):
+                module.no_log_values.add(user[field])
+
+    result = dict(changed=False, users={}, user_groups={})
+    try:
+        api = create_api(params, pool_maxsize=max(10, max_workers))
+        groups = desired_groups(params['user_groups'])
+        manage_groups = bool(groups) or params['purge_user_groups']
+        manage_users = (bool(params['users']) or params['purge_users']
+                        or any(item.get('members') for item in params['user_groups']))
+
+        state = AppliedState(params['state_dir'], api.base_url) if params['state_dir'] else None
+        # Members missing from ``users``, or given without their groups, take
+        # their groups from the full snapshot.
+        named = set(user['user_name'] for user in users
+                    if user['state'] == 'present' and user['groups'] is not None)
+        partial = state is not None and all(
+            member in named for item in params['user_groups']
+            if item.get('state', 'present') == 'present' for member in item.get('members') or [])
+        if partial:
+            users = add_memberships(users, params['user_groups'], {})
+
+        # One snapshot of each endpoint, both read at once.
+        endpoints = []
+        if manage_groups:
+            endpoints.append(('usergroups', 'group_name', GROUP_FIELDS, groups,
+                              params['purge_user_groups']))
+        if manage_users:
+            endpoints.append(('users', 'user_name', USER_FIELDS, users if partial else None,
+                              params['purge_users']))
+        snapshots = fetch_endpoints(api, endpoints, state, max_workers)
+        current_groups, groups, skipped_groups = snapshots.get('usergroups', ({}, groups, []))
+        current_users, changed_users, skipped_users = snapshots.get('users', ({}, users, []))
+
+        if partial:
+            users = changed_users
+        else:
+            users = add_memberships(users, params['user_groups'], current_users)
+        group_delta = compute_delta(groups, current_groups, 'group_name', GROUP_FIELDS,
+                                    params['purge_user_groups'], group_defaults)
+        user_delta = compute_delta(users, current_users, 'user_name', USER_FIELDS,
+                                   params['purge_users'], user_defaults)
+
+        if module.check_mode:
+            group_result = planned_result(group_delta, 'group_name')
+            user_result = planned_result(user_delta, 'user_name')
+        else:
+            # Groups must exist before the users that reference them, and
+            # outlive them until those users are deleted or updated.
+            group_result = apply_delta(api, 'usergroups', dict(group_delta, delete=[]),
+                                       'group_name', max_workers=max_workers)
+            user_result = apply_delta(api, 'users', user_delta, 'user_name',
+                                      max_workers=max_workers)
+            group_result = merge_results(group_result, apply_delta(
+                api, 'usergroups', dict(group_delta, create=[], update=[]),
+                'group_name', max_workers=max_workers))
+    except Exception as e:
+        module.fail_json(msg=f"User reconciliation failed: {str(e)}", **result)
+
+    for section, path, outcome, delta, current, key, desired, fields, skipped, used in (
+            ('user_groups', 'usergroups', group_result, group_delta, current_groups,
+             'group_name', groups, GROUP_FIELDS, skipped_groups, manage_groups),
+            ('users', 'users', user_result, user_delta, current_users,
+             'user_name', users, USER_FIELDS, skipped_users, manage_users and partial)):
+        record = state.endpoint(path) if state and used else None
+        outcome = summarize(outcome, delta, current, key, skipped, record)
+        if record is not None and not module.check_mode:
+            record_applied(record, desired, outcome, key, fields)
+        outcome['failures'] = outcome.pop('failed')
+        result[section] = outcome
+    if state and not module.check_mode:
+        state.save()
+    result['changed'] = result['users']['changed'] or result['user_groups']['changed']
+    result['timings'] = api.timings()
+
+    failures = [f"{name}: {error}" for section in ('user_groups', 'users')
+                for name, error in result[section]['failures'].items()]
+    if failures:
+        module.fail_json(msg=f"{len(failures)} user and group changes failed: "
+                         + "; ".join(failures), **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == '__main__':
+    main()
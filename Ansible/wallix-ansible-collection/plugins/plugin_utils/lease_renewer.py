@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""Background renewal of the leases held in the lease registry.
+
+The renewer is a detached process started on the controller by the
+``wallix.pam.secret`` lookup or action plugin. It extends every lease of the
+registry used by its playbook run shortly before it expires and, once the
+``ansible-playbook`` process of that run has exited, checks in those no other
+run still uses and stops. One renewer runs per Bastion, identity and playbook
+run.
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import fcntl
+import hashlib
+import multiprocessing
+import os
+import time
+
+from ansible_collections.wallix.pam.plugins.module_utils.secret_client import (
+    create_client, run_operations)
+from ansible_collections.wallix.pam.plugins.module_utils.session_auth import (
+    credentials_identity)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (
+    default_cache_dir, ensure_private_dir)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    split_api_url)
+
+# Seconds between two checks that the playbook run is still alive.
+_POLL_INTERVAL = 1
+
+
+def play_pid():
+    """Return the PID of the process running the playbook.
+
+    Tasks run in a forked worker whose parent is ``ansible-playbook``; code
+    templated in the main process (play vars, for instance) runs in it.
+    """
+    if multiprocessing.parent_process() is not None:
+        return os.getppid()
+    return os.getpid()
+
+
+def run_id(pid=None):
+    """Return an identifier of the playbook run of ``pid`` (see play_pid).
+
+    The process start time keeps a later run reusing the PID apart.
+    """
+    pid = pid or play_pid()
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            start = f.read().rsplit(")", 1)[1].split()[19]
+    except (IOError, OSError, IndexError):
+        start = ""
+    return f"{pid}:{start}"
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _lock_path(params, watch_pid):
+    base_url = split_api_url(params['wallix_url'])[0]
+    identity = credentials_identity(params['api_key'] or params['session_cookie'],
+                                    params['username'], params['password'])
+    digest = hashlib.sha256(f"{base_url}\0{identity}\0{watch_pid}".encode("utf-8")).hexdigest()
+    return os.path.join(params['shared_cache_dir'] or default_cache_dir(), f"renewer-{digest}.lock")
+
+
+def renew_due(client, margin):
+    """Extend every lease of this run expiring within ``margin`` seconds.
+
+    A failed extension is recorded on the lease and tried again at the next
+    pass while the lease lasts.
+    """
+    for name, lease in client.leases.held().items():
+        if lease['expires_at'] - time.time() > margin:
+            continue
+        try:
+            data = client.extend(dict(account_name=name,
+                                      authorization=lease.get('authorization')))
+        except Exception as e:
+            client.leases.fail_renewal(name, e)
+            continue
+        duration = data.get('duration')
+        client.leases.renew(name, duration if isinstance(duration, int) else None)
+
+
+def _run(params, watch_pid):
+    # The renewer outlives any per-run deadline and never shares secrets.
+    os.environ.pop('WALLIX_API_DEADLINE', None)
+    client = create_client(dict(params, deadline=None, shared_cache=False, renew_leases=True),
+                           run_id=run_id(watch_pid))
+
+    next_pass = 0
+    while _is_alive(watch_pid):
+        if time.time() >= next_pass:
+            renew_due(client, params['extend_threshold'])
+            next_pass = time.time() + params['renew_interval']
+        time.sleep(_POLL_INTERVAL)
+
+    # Leases still used by a concurrent run are left to its own renewer.
+    leases = client.leases.all()
+    released = client.leases.release()
+    if released:
+        ops = [dict(account_name=name, state='checkin',
+                    authorization=leases.get(name, {}).get('authorization'))
+               for name in released]
+        run_operations(client, ops, params['max_workers'])
+
+
+def start_renewer(params, watch_pid=None):
+    """Start the renewer for these module parameters unless it already runs.
+
+    Returns whether a new renewer was started.
+    """
+    watch_pid = watch_pid or play_pid()
+    path = _lock_path(params, watch_pid)
+    ensure_private_dir(os.path.dirname(path))
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        os.close(fd)
+        return False
+
+    pid = os.fork()
+    if pid:
+        # The renewer keeps the lock through its own copy of the descriptor.
+        os.close(fd)
+        os.waitpid(pid, 0)
+        return True
+
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for target in (0, 1, 2):
+            os.dup2(devnull, target)
+        # Do not hold the worker's pipes open past its own exit.
+        os.closerange(3, fd)
+        os.closerange(fd + 1, os.sysconf("SC_OPEN_MAX"))
+        try:
+            _run(params, watch_pid)
+        finally:
+            os.unlink(path)
+    finally:
+        os._exit(0)
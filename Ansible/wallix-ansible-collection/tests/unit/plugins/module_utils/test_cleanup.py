@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible_collections.wallix.pam.plugins.module_utils.cleanup import (
+    conflict_report)
+
+
+def test_conflict_report_indexes_blocked_objects_and_their_holders():
+    report = conflict_report(dict(
+        deleted={},
+        blocked=dict(
+            target_groups=dict(tg1=['authorizations:keep-a']),
+            devices=dict(web=['target_groups:tg1'], db=['target_groups:tg1']),
+        ),
+        failed={},
+    ))
+
+    assert report['total'] == 3
+    assert report['by_status'] == {409: 3}
+    assert report['by_type']['devices'] == dict(total=2, blocked=2, failed=0)
+    assert report['conflicts']['target_groups'] == [dict(
+        name='tg1', status=409, reason='Still referred to by 1 object(s)',
+        referenced_by=['authorizations:keep-a'])]
+    # Blocking the most first; tg1 is left behind itself, keep-a is the root.
+    assert list(report['blockers']) == ['target_groups:tg1', 'authorizations:keep-a']
+    assert report['blockers']['target_groups:tg1'] == ['devices:db', 'devices:web']
+    assert report['root_blockers'] == ['authorizations:keep-a']
+
+
+def test_conflict_report_keeps_the_status_of_failures():
+    report = conflict_report(dict(failed=dict(users=dict(
+        alice='API Error 500: boom', bob='Connection refused'))))
+
+    assert report['by_status'] == {500: 1, None: 1}
+    assert report['by_type']['users'] == dict(total=2, blocked=0, failed=2)
+    assert [(c['name'], c['status'], c['referenced_by'])
+            for c in report['conflicts']['users']] == [('alice', 500, []), ('bob', None, [])]
+    assert report['blockers'] == {}
+    assert report['root_blockers'] == []
+
+
+def test_conflict_report_attributes_refused_deletions_to_their_referrers():
+    report = conflict_report(dict(
+        deleted=dict(authorizations=['gone']),
+        blocked={},
+        failed=dict(user_groups=dict(ops='API Error 409: in use')),
+        referrers={'user_groups:ops': ['authorizations:gone', 'authorizations:kept']},
+    ))
+
+    assert report['by_type']['user_groups'] == dict(total=1, blocked=1, failed=0)
+    assert report['conflicts']['user_groups'][0]['referenced_by'] == ['authorizations:kept']
+    assert report['blockers'] == {'authorizations:kept': ['user_groups:ops']}
+    assert report['root_blockers'] == ['authorizations:kept']
+
+
+def test_conflict_report_of_a_clean_run_is_empty():
+    report = conflict_report(dict(deleted=dict(devices=['web']), blocked={}, failed={}))
+    assert report == dict(total=0, by_status={}, by_type={}, conflicts={}, blockers={},
+                          root_blockers=[])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import time
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from ansible_collections.wallix.pam.plugins.module_utils.lease_registry import (  # noqa: E402
+    LeaseRegistry, lease_info)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (  # noqa: E402
+    SharedCache)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache('key', cache_dir=str(tmp_path))
+
+
+def registry(cache, run_id=None):
+    return LeaseRegistry(cache, 'https://bastion', 'identity', run_id)
+
+
+def test_record_stores_the_checkout_and_its_expiry(cache):
+    leases = registry(cache)
+    before = time.time()
+    lease = leases.record('root@local@web', dict(password='secret'), 600)
+
+    assert leases.get('root@local@web') == lease
+    assert lease['metadata'] == dict(password='secret')
+    assert before <= lease['checked_out_at'] <= time.time()
+    assert lease['expires_at'] == lease['checked_out_at'] + 600
+
+
+def test_record_dates_a_shared_checkout_from_when_it_was_issued(cache):
+    issued = time.time() - 100
+    lease = registry(cache).record('root@local@web', {}, 600, checked_out_at=issued)
+    assert lease['expires_at'] == issued + 600
+    assert 495 <= lease_info(lease)['remaining'] <= 500
+
+
+def test_expired_leases_are_pruned(cache):
+    leases = registry(cache)
+    leases.record('old@local@web', {}, 60, checked_out_at=time.time() - 120)
+    leases.record('new@local@web', {}, 60)
+    assert sorted(leases.all()) == ['new@local@web']
+
+
+def test_renew_pushes_the_expiry(cache):
+    leases = registry(cache)
+    leases.record('root@local@web', {}, 60, checked_out_at=time.time() - 50)
+
+    lease = leases.renew('root@local@web', 300)
+    assert 299 <= lease['expires_at'] - time.time() <= 300
+    assert leases.get('root@local@web')['expires_at'] == lease['expires_at']
+    # Without a duration, the lease is renewed for its checkout duration.
+    assert 59 <= leases.renew('root@local@web')['expires_at'] - time.time() <= 60
+    assert leases.renew('other@local@web') is None
+
+
+def test_registries_are_shared_through_the_cache(cache):
+    registry(cache).record('root@local@web', {}, 600)
+    assert registry(cache).get('root@local@web') is not None
+    assert LeaseRegistry(cache, 'https://other', 'identity').get('root@local@web') is None
+
+
+def test_remove_forgets_the_lease(cache):
+    leases = registry(cache)
+    leases.record('root@local@web', {}, 600)
+    leases.remove('root@local@web')
+    assert leases.all() == {}
+    assert lease_info(None) is None
+
+
+def test_claim_and_release_track_the_runs_using_a_lease(cache):
+    first, second = registry(cache, 'run-1'), registry(cache, 'run-2')
+    first.record('root@local@web', {}, 600)
+    first.record('app@local@web', {}, 600)
+    second.claim('root@local@web')
+
+    assert sorted(first.held()) == ['app@local@web', 'root@local@web']
+    assert sorted(second.held()) == ['root@local@web']
+    # Leases still used by the second run are not released by the first.
+    assert first.release() == ['app@local@web']
+    assert first.held() == {}
+    assert second.release() == ['root@local@web']
+    # Released leases stay in the registry for the caller to check them in.
+    assert sorted(registry(cache).all()) == ['app@local@web', 'root@local@web']
+
+
+def test_claim_is_a_no_op_without_a_run(cache):
+    registry(cache, 'run-1').record('root@local@web', {}, 600)
+    registry(cache).claim('root@local@web')
+    assert registry(cache).get('root@local@web')['runs'] == ['run-1']
+
+
+def test_lease_keeps_its_authorization_and_renewal_error(cache):
+    leases = registry(cache, 'run-1')
+    leases.record('root@local@web', {}, 600, 'ops-auth')
+    leases.fail_renewal('root@local@web', 'API Error 403: denied')
+
+    lease = leases.get('root@local@web')
+    assert lease['authorization'] == 'ops-auth'
+    assert lease_info(lease)['renew_error'] == 'API Error 403: denied'
+    assert leases.renew('root@local@web')['renew_error'] is None
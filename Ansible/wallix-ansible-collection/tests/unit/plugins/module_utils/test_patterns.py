@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from fnmatch import fnmatchcase
+
+import pytest
+
+from ansible_collections.wallix.pam.plugins.module_utils.patterns import (
+    GlobSet, compile_patterns)
+
+PATTERNS = ['admin', 'demo*', 'TG_*', 'web-??', 'db[0-9]*', '*-test']
+NAMES = ['admin', 'admins', 'demo', 'demo-1', 'Demo-1', 'TG_prod', 'TG', 'web-01',
+         'web-001', 'db1', 'dbx', 'app-test', 'test', '', 'de']
+
+
+def test_globset_sorts_patterns_by_kind():
+    globs = GlobSet(PATTERNS)
+    assert globs.literals == set(['admin'])
+    assert globs.prefixes == [(3, set(['TG_'])), (4, set(['demo']))]
+    assert globs.regex is not None
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_globset_matches_like_fnmatchcase(name):
+    expected = any(fnmatchcase(name, pattern) for pattern in PATTERNS)
+    assert (name in GlobSet(PATTERNS)) is expected
+
+
+def test_empty_globset_matches_nothing():
+    assert 'anything' not in GlobSet([])
+
+
+def test_matcher_applies_include_then_exclude():
+    matcher = compile_patterns(['demo*'], ['demo-keep*'])
+    assert matcher('demo-1')
+    assert not matcher('demo-keep-1')
+    assert not matcher('prod-1')
+    assert not matcher(None)
+
+
+def test_matcher_include_none_matches_everything_not_excluded():
+    matcher = compile_patterns(None, ['admin*'])
+    assert matcher('user')
+    assert not matcher('admin')
+    assert not compile_patterns([])('user')
+
+
+def test_matcher_partition_keeps_order():
+    matcher = compile_patterns(['a*'])
+    items = [dict(name='b1'), dict(name='a1'), dict(name='a2')]
+    matched, unmatched = matcher.partition(items, key=lambda item: item['name'])
+    assert matched == [dict(name='a1'), dict(name='a2')]
+    assert unmatched == [dict(name='b1')]
+
+
+def test_compile_patterns_is_cached():
+    assert compile_patterns(['a*'], ['b']) is compile_patterns(['a*'], ['b'])
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.wallix.pam.plugins.module_utils.reconcile import (
+    apply_delta, compute_delta)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+FIELDS = ['device_name', 'host', 'description', 'tags']
+
+
+class FakeAPI:
+    """Records the calls apply_delta sends, failing those on ``fail``."""
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = fail
+
+    def _send(self, method, path, data=None):
+        self.calls.append((method, path, data))
+        if path in self.fail:
+            raise WallixAPIError(f"API Error 500: {path}", 500)
+
+    def post(self, path, data):
+        self._send('POST', path, data)
+
+    def put(self, path, data):
+        self._send('PUT', path, data)
+
+    def delete(self, path):
+        self._send('DELETE', path)
+
+    def bulk(self, func, items, max_workers=10):
+        results = []
+        for item in items:
+            try:
+                results.append((func(item), None))
+            except WallixAPIError as e:
+                results.append((None, e))
+        return results
+
+
+def current_devices():
+    return dict(
+        web=dict(id='1', device_name='web', host='10.0.0.1', description='Web', tags=['a', 'b']),
+        db=dict(id='2', device_name='db', host='10.0.0.2', description='', tags=[]),
+    )
+
+
+def test_compute_delta_sorts_creations_updates_and_deletions():
+    desired = [
+        dict(device_name='web', host='10.0.0.9', description='Web', tags=['b', 'a']),
+        dict(device_name='db', state='absent'),
+        dict(device_name='new', host='10.0.0.3'),
+    ]
+    delta = compute_delta(desired, current_devices(), 'device_name', FIELDS)
+
+    assert delta['create'] == [dict(device_name='new', host='10.0.0.3')]
+    assert [(obj['id'], changes) for obj, changes in delta['update']] == [
+        ('1', dict(host=dict(before='10.0.0.1', after='10.0.0.9')))]
+    assert [obj['id'] for obj in delta['delete']] == ['2']
+    assert delta['unchanged'] == []
+
+
+def test_compute_delta_leaves_fields_set_to_none_out_of_the_diff():
+    desired = [dict(device_name='web', host=None, description=None, tags=None),
+               dict(device_name='db', host='10.0.0.2', description=None)]
+    delta = compute_delta(desired, current_devices(), 'device_name', FIELDS)
+
+    assert delta['update'] == []
+    assert delta['unchanged'] == ['web', 'db']
+
+
+def test_compute_delta_applies_create_defaults_to_new_objects_only():
+    desired = [dict(device_name='web', description=None),
+               dict(device_name='new', description=None)]
+    delta = compute_delta(desired, current_devices(), 'device_name', FIELDS,
+                          create_defaults=lambda payload: dict(description='', tags=[]))
+
+    assert delta['create'] == [dict(device_name='new', description='', tags=[])]
+    assert delta['unchanged'] == ['web']
+
+
+def test_compute_delta_purges_unlisted_objects():
+    delta = compute_delta([dict(device_name='web')], current_devices(), 'device_name',
+                          FIELDS, purge=True)
+    assert [obj['device_name'] for obj in delta['delete']] == ['db']
+
+
+def test_compute_delta_rejects_duplicate_keys():
+    with pytest.raises(WallixAPIError, match='Duplicate device_name values: web'):
+        compute_delta([dict(device_name='web'), dict(device_name='web')], {},
+                      'device_name', FIELDS)
+
+
+def test_apply_delta_sends_only_the_changed_fields():
+    current = current_devices()
+    delta = dict(create=[dict(device_name='new', host='10.0.0.3')],
+                 update=[(current['web'], dict(host=dict(before='10.0.0.1', after='10.0.0.9')))],
+                 delete=[current['db']], unchanged=[])
+    api = FakeAPI()
+    result = apply_delta(api, 'devices', delta, 'device_name')
+
+    assert api.calls == [('POST', 'devices', dict(device_name='new', host='10.0.0.3')),
+                         ('PUT', 'devices/1', dict(host='10.0.0.9')),
+                         ('DELETE', 'devices/2', None)]
+    assert (result['created'], result['updated'], result['deleted']) == (['new'], ['web'], ['db'])
+    assert result['failed'] == {}
+    assert set(result['durations']) == set(['new', 'web', 'db'])
+
+
+def test_apply_delta_reports_failures_by_name():
+    current = current_devices()
+    delta = dict(create=[], update=[], delete=[current['web'], current['db']], unchanged=[])
+    result = apply_delta(FakeAPI(fail=('devices/2',)), 'devices', delta, 'device_name')
+
+    assert result['deleted'] == ['web']
+    assert result['failed'] == dict(db='API Error 500: devices/2')
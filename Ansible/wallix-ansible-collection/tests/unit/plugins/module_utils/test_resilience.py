@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import time
+
+import pytest
+import requests
+
+from ansible_collections.wallix.pam.plugins.module_utils.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_with_retry)
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def sender(*outcomes):
+    """Return a send function answering ``outcomes`` in turn, and its calls."""
+    calls = []
+
+    def send(timeout):
+        calls.append(timeout)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Response(outcome)
+    return send, calls
+
+
+def test_call_with_retry_retries_errors_and_5xx_until_success():
+    send, calls = sender(requests.ConnectionError(), 503, 200)
+    assert call_with_retry(send, retries=3, backoff=0).status_code == 200
+    assert len(calls) == 3
+
+
+def test_call_with_retry_does_not_retry_client_errors():
+    send, calls = sender(404)
+    assert call_with_retry(send, retries=3, backoff=0).status_code == 404
+    assert len(calls) == 1
+
+
+def test_call_with_retry_returns_the_last_response_or_raises_the_last_error():
+    send, calls = sender(500, 502)
+    assert call_with_retry(send, retries=1, backoff=0).status_code == 502
+
+    send, calls = sender(500, requests.Timeout('slow'))
+    with pytest.raises(requests.Timeout):
+        call_with_retry(send, retries=1, backoff=0)
+    assert len(calls) == 2
+
+
+def test_call_with_retry_bounds_the_read_timeout_by_the_deadline():
+    send, calls = sender(200)
+    call_with_retry(send, timeout=(5, 30), deadline=time.time() + 10)
+    connect_timeout, read_timeout = calls[0]
+    assert connect_timeout == 5
+    assert 9 < read_timeout <= 10
+
+    send, calls = sender(200)
+    with pytest.raises(DeadlineExceeded):
+        call_with_retry(send, deadline=time.time() - 1)
+    assert calls == []
+
+
+def test_circuit_breaker_opens_after_threshold_failures(tmp_path):
+    breaker = CircuitBreaker('https://bastion', threshold=2, reset_timeout=60,
+                             state_dir=str(tmp_path))
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    send, calls = sender(200)
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(send, breaker=breaker)
+    assert calls == []
+
+
+def test_circuit_breaker_lets_one_trial_through_when_half_open(tmp_path):
+    breaker = CircuitBreaker('https://bastion', threshold=1, reset_timeout=0.2,
+                             state_dir=str(tmp_path))
+    # Forks share the breaker state through its file.
+    other_fork = CircuitBreaker('https://bastion', threshold=1, reset_timeout=0.2,
+                                state_dir=str(tmp_path))
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        other_fork.allow()
+
+    time.sleep(0.25)
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        other_fork.allow()
+
+    breaker.record_success()
+    other_fork.allow()
+
+
+def test_circuit_breaker_reopens_when_the_trial_fails(tmp_path):
+    breaker = CircuitBreaker('https://bastion', threshold=1, reset_timeout=0.2,
+                             state_dir=str(tmp_path))
+    breaker.record_failure()
+    time.sleep(0.25)
+    breaker.allow()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_disabled_circuit_breaker_never_opens(tmp_path):
+    breaker = CircuitBreaker('https://bastion', threshold=0, state_dir=str(tmp_path))
+    for _attempt in range(10):
+        breaker.record_failure()
+    breaker.allow()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.wallix.pam.plugins.module_utils.resources import (
+    RESOURCE_TYPES, creation_levels, deletion_levels, referring_types)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    WallixAPIError)
+
+ALL_TYPES = sorted(RESOURCE_TYPES)
+
+
+def level_of(levels):
+    return dict((resource_type, index) for index, level in enumerate(levels)
+                for resource_type in level)
+
+
+def test_deletion_levels_delete_referring_types_first():
+    levels = deletion_levels(ALL_TYPES)
+    index = level_of(levels)
+
+    assert sorted(index) == ALL_TYPES
+    for resource_type in ALL_TYPES:
+        for referrer in referring_types(resource_type):
+            assert index[referrer] < index[resource_type], (referrer, resource_type)
+
+
+def test_deletion_levels_of_a_chain():
+    assert deletion_levels(['timeframes', 'user_groups', 'authorizations']) == [
+        ['authorizations'], ['user_groups'], ['timeframes']]
+
+
+def test_deletion_levels_group_independent_types():
+    assert deletion_levels(['devices', 'authorizations', 'timeframes']) == [
+        ['authorizations', 'devices', 'timeframes']]
+
+
+def test_deletion_levels_reject_unknown_types():
+    with pytest.raises(WallixAPIError, match='Unknown object types: gadgets'):
+        deletion_levels(['devices', 'gadgets'])
+
+
+def test_creation_levels_create_referred_types_first():
+    index = level_of(creation_levels(ALL_TYPES))
+
+    assert sorted(index) == ALL_TYPES
+    for resource_type, spec in RESOURCE_TYPES.items():
+        for dependency in spec['refers_to'] + spec.get('created_after', []):
+            assert index[dependency] < index[resource_type], (dependency, resource_type)
+
+
+def test_creation_levels_create_users_after_their_groups():
+    # Users do not keep groups from being deleted, but need them to exist.
+    assert deletion_levels(['users', 'user_groups']) == [['user_groups', 'users']]
+    assert creation_levels(['users', 'user_groups']) == [['user_groups'], ['users']]
+
+
+def test_creation_levels_of_a_chain():
+    assert creation_levels(['authorizations', 'user_groups', 'timeframes']) == [
+        ['timeframes'], ['user_groups'], ['authorizations']]
+
+
+def test_creation_levels_reject_unknown_types():
+    with pytest.raises(WallixAPIError, match='Unknown object types: gadgets'):
+        creation_levels(['gadgets'])
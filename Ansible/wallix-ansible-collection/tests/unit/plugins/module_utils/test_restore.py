@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.wallix.pam.plugins.module_utils import restore
+from ansible_collections.wallix.pam.plugins.module_utils.restore import (
+    creation_path, creation_payload, verify_restore)
+
+
+def test_creation_payload_drops_read_only_attributes():
+    device = dict(id='12', device_name='web', host='10.0.0.1')
+    assert creation_payload('devices', device) == dict(device_name='web', host='10.0.0.1')
+
+    account = dict(id='3', account_name='root', device='web', domain='local', login='root')
+    assert creation_payload('local_accounts', account) == dict(account_name='root', login='root')
+
+
+def test_creation_path_of_nested_accounts():
+    assert creation_path('local_accounts', 'root@local@web 1') == \
+        'devices/web%201/localdomains/local/accounts'
+    assert creation_path('global_accounts', 'svc@corp') == 'domains/corp/accounts'
+    assert creation_path('devices', 'web') == 'devices'
+
+
+@pytest.fixture
+def restored(monkeypatch):
+    """Serve a backup of devices and a Bastion holding them, as given by the test."""
+    state = dict(backup=[], bastion=[])
+    monkeypatch.setattr(restore, 'iter_backup',
+                        lambda manifest, directory, resource_type: iter(state['backup']))
+    monkeypatch.setattr(restore, 'discover',
+                        lambda api, resource_type, max_workers, project: [
+                            dict(name=obj['device_name'], object=obj)
+                            for obj in state['bastion']])
+    return state
+
+
+def test_verify_restore_ignores_ids_and_attributes_set_by_the_bastion(restored):
+    restored['backup'] = [('web', dict(id='1', device_name='web', host='10.0.0.1',
+                                       tags=['b', 'a']), True)]
+    restored['bastion'] = [dict(id='99', device_name='web', host='10.0.0.1', tags=['a', 'b'],
+                                created_at='2026-01-01T00:00:00')]
+
+    result = verify_restore(None, {}, '.', ['devices'])
+    assert result == dict(verified=dict(devices=1), mismatched={}, missing={})
+
+
+def test_verify_restore_reports_mismatched_and_missing_objects(restored):
+    restored['backup'] = [
+        ('web', dict(id='1', device_name='web', host='10.0.0.1'), True),
+        ('db', dict(id='2', device_name='db', host='10.0.0.2'), True),
+        ('old', dict(id='3', device_name='old', host='10.0.0.3'), False),
+    ]
+    restored['bastion'] = [dict(id='7', device_name='web', host='10.0.0.9')]
+
+    result = verify_restore(None, {}, '.', ['devices'])
+    assert result == dict(verified=dict(devices=0), mismatched=dict(devices=['web']),
+                          missing=dict(devices=['db']))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (
+    API_ARGUMENT_SPEC, create_api, split_api_url)
+
+
+def api_params(**overrides):
+    params = dict((name, spec.get('default')) for name, spec in API_ARGUMENT_SPEC.items())
+    params.update(api_key='key', circuit_breaker_threshold=0)
+    params.update(overrides)
+    return params
+
+
+def test_split_api_url_keeps_the_version():
+    assert split_api_url('https://b/api/v3.12/') == ('https://b', 'api/v3.12')
+    assert split_api_url('https://b') == ('https://b', 'api')
+
+
+def test_create_api_targets_the_versioned_api():
+    api = create_api(api_params(wallix_url='https://b/api/v3.12'))
+    assert api.base_url == 'https://b'
+    assert api.api_url == 'https://b/api/v3.12'
+    assert api.url('devices') == 'https://b/api/v3.12/devices'
+
+
+def test_create_api_defaults_to_the_unversioned_api():
+    api = create_api(api_params(wallix_url='https://b'))
+    assert api.api_url == 'https://b/api'
+
+
+def test_create_api_logs_in_once_with_username_and_password():
+    api = create_api(api_params(wallix_url='https://b', api_key=None, username='admin',
+                                password='secret'))
+    assert api.session_auth is not None
+    assert api.basic_auth is None
+
+
+def test_create_api_sends_basic_auth_with_session_ttl_zero():
+    api = create_api(api_params(wallix_url='https://b', api_key=None, username='admin',
+                                password='secret', session_ttl=0))
+    assert api.session_auth is None
+    assert api.basic_auth == ('admin', 'secret')
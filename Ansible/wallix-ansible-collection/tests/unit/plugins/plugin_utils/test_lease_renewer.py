@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import time
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+from ansible_collections.wallix.pam.plugins.module_utils.lease_registry import (  # noqa: E402
+    LeaseRegistry)
+from ansible_collections.wallix.pam.plugins.module_utils.shared_cache import (  # noqa: E402
+    SharedCache)
+from ansible_collections.wallix.pam.plugins.module_utils.wallix_api import (  # noqa: E402
+    WallixAPIError)
+from ansible_collections.wallix.pam.plugins.plugin_utils.lease_renewer import (  # noqa: E402
+    renew_due)
+
+
+class FakeClient:
+    """Extends leases through ``extend``, refusing the accounts in ``refuse``."""
+
+    def __init__(self, leases, refuse=()):
+        self.leases = leases
+        self.refuse = refuse
+        self.extended = []
+
+    def extend(self, op):
+        self.extended.append(op)
+        if op['account_name'] in self.refuse:
+            raise WallixAPIError('API Error 403: denied', 403)
+        return dict(duration=900)
+
+
+@pytest.fixture
+def leases(tmp_path):
+    return LeaseRegistry(SharedCache('key', cache_dir=str(tmp_path)), 'https://bastion',
+                         'identity', 'run-1')
+
+
+def test_renew_due_extends_expiring_leases_through_their_authorization(leases):
+    leases.record('due@local@web', {}, 60, 'ops-auth')
+    leases.record('later@local@web', {}, 3600, 'ops-auth')
+    client = FakeClient(leases)
+
+    renew_due(client, 300)
+    assert client.extended == [dict(account_name='due@local@web', authorization='ops-auth')]
+    assert 899 <= leases.get('due@local@web')['expires_at'] - time.time() <= 900
+
+
+def test_renew_due_records_failed_extensions(leases):
+    leases.record('due@local@web', {}, 60)
+    expires_at = leases.get('due@local@web')['expires_at']
+
+    renew_due(FakeClient(leases, refuse=('due@local@web',)), 300)
+    lease = leases.get('due@local@web')
+    assert lease['renew_error'] == 'API Error 403: denied'
+    assert lease['expires_at'] == expires_at
+
+
+def test_renew_due_skips_leases_of_other_runs(leases):
+    LeaseRegistry(leases.cache, 'https://bastion', 'identity', 'run-2').record(
+        'other@local@web', {}, 60)
+    client = FakeClient(leases)
+    renew_due(client, 300)
+    assert client.extended == []